@@ -0,0 +1,83 @@
+"""
+Cost of finding every problem in a config
+
+Compares fixing a config one error at a time, validating it again after each
+fix as a user would (fail-fast `validate`, once per error), with finding every
+error in a single pass (`validate(..., collect=True)`).
+
+  $ python benchmarks/collect_errors.py
+"""
+import copy
+import time
+
+from configurati.attrs import attrs
+from configurati.validation import index_spec, optional, required, validate, ValidationError
+
+
+def make_spec(width):
+  return index_spec(attrs.from_dict({
+      "service{}".format(i): {
+        "host": required(type=str),
+        "port": optional(type=int, default=80),
+        "timeout": optional(type=float, default=1.0),
+        "tags": [required(type=str)],
+      }
+      for i in range(width)
+    }))
+
+
+def make_config(width, broken):
+  config = {
+      "service{}".format(i): {
+        "host": "host{}".format(i),
+        "port": "8080",
+        "tags": ["x", "y", "z"],
+      }
+      for i in range(width)
+    }
+  for i in range(0, width, width // broken):
+    config["service{}".format(i)]["port"] = "eighty"
+  return config
+
+
+def one_at_a_time(spec, config):
+  """Validate, fix whatever failed, and repeat until the config is valid"""
+  config = copy.deepcopy(config)
+  start, passes = time.time(), 0
+  while True:
+    passes += 1
+    try:
+      validate(spec, config)
+      return passes, time.time() - start
+    except ValidationError:
+      # the error doesn't say where it was, so finding it is up to the user
+      stop = time.time()
+      for service in config.values():
+        if service["port"] == "eighty":
+          service["port"] = "80"
+          break
+      start += time.time() - stop
+
+
+def all_at_once(spec, config):
+  start = time.time()
+  try:
+    validate(spec, config, collect=True)
+  except ValidationError as e:
+    return len(e.errors), time.time() - start
+
+
+def main():
+  print("{:>8} {:>8} {:>22} {:>15} {:>8}".format(
+      "services", "errors", "one at a time (ms)", "collected (ms)", "speedup"))
+  for width, broken in [(100, 10), (1000, 10), (1000, 100)]:
+    spec, config = make_spec(width), make_config(width, broken)
+    passes, t_before = one_at_a_time(spec, config)
+    errors, t_after  = all_at_once(spec, config)
+    assert passes == errors + 1
+    print("{:>8} {:>8} {:>22.1f} {:>15.1f} {:>7.1f}x".format(
+        width, errors, 1e3 * t_before, 1e3 * t_after, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,48 @@
+"""
+Cost of building a config from many command line overrides
+
+Compares consuming arguments by slicing off each "--key value" pair and
+calling `attrs.set` once per override, as `loaders.commandline.load` used to,
+with scanning them by index. Up to `SEQUENTIAL_LIMIT` overrides are then set
+one at a time; beyond that, they're built from an `Overrides` trie.
+
+  $ python benchmarks/commandline.py
+"""
+import timeit
+
+from configurati.attrs import set
+from configurati.loaders.commandline import load, next
+
+
+def before(args):
+  result = {}
+  while len(args) > 0:
+    k, v, args = next(args)
+    set(result, "." + k, v, build=True)
+  return result
+
+
+def make_args(n):
+  """`n` overrides spread across 100 sections, 2 levels deep"""
+  args = []
+  for i in range(n):
+    args += ["--section{}.group{}.key{}".format(i % 100, i % 7, i), str(i)]
+  return args
+
+
+def main():
+  print("{:>10} {:>12} {:>12} {:>8}".format(
+      "overrides", "before (ms)", "after (ms)", "speedup"))
+  for n in [10, 100, 1000, 10000]:
+    args = make_args(n)
+    assert before(args) == load(args)
+
+    number = max(1, 10000 // n)
+    t_before = timeit.timeit(lambda: before(args), number=number)
+    t_after  = timeit.timeit(lambda: load(args), number=number)
+    print("{:>10} {:>12.3f} {:>12.3f} {:>7.1f}x".format(
+        n, 1e3 * t_before / number, 1e3 * t_after / number, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,37 @@
+"""
+Per-level cost of get/set/unroll/recursive_apply on deeply nested objects
+
+  $ python benchmarks/deep.py
+"""
+import sys
+import timeit
+
+from configurati.attrs import get, set, unroll
+from configurati.utils import recursive_apply, Missing
+
+
+def main():
+  limit = sys.getrecursionlimit()
+  print("recursion limit: {}".format(limit))
+  print("{:>8} {:>12} {:>12} {:>12} {:>12}".format(
+      "depth", "get", "set", "unroll", "apply"))
+  print("{:>8} {:>12} {:>12} {:>12} {:>12}".format(
+      "", "(us/level)", "(us/level)", "(us/level)", "(us/level)"))
+
+  for depth in [10, 100, 1000, limit * 10, limit * 100]:
+    key = ".a" * depth
+    obj = set(Missing, key, 1, build=True)
+    n   = max(1, 10000 // depth)
+
+    timings = [
+        timeit.timeit(lambda: get(obj, key), number=n),
+        timeit.timeit(lambda: set(obj, key, 2), number=n),
+        timeit.timeit(lambda: unroll(obj), number=n),
+        timeit.timeit(lambda: recursive_apply(obj), number=n),
+      ]
+    print("{:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.3f}".format(
+        depth, *[1e6 * t / (n * depth) for t in timings]))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,48 @@
+"""
+Per-expression cost of evaluating `...` expressions
+
+Compares a fresh `code.InteractiveConsole` per expression, as `evaluate` used
+to, with compiling each distinct expression once and caching the result.
+
+  $ python benchmarks/evaluate.py
+"""
+import code
+import re
+import timeit
+
+from configurati.loaders.utils import evaluate
+
+
+EXPRESSIONS = [
+    "1 + 1",
+    "import os; os.path.join('a', 'b')",
+    "from datetime import timedelta\ntimedelta(days=1).total_seconds()",
+    "[x ** 2 for x in range(100)]",
+  ]
+
+
+def before(line):
+  line = re.split(";|\n", line)
+  line[-1] = "OUTPUT = " + line[-1]
+  line = ";".join(line)
+
+  interpreter = code.InteractiveConsole()
+  interpreter.push(line)
+  return interpreter.locals["OUTPUT"]
+
+
+def main():
+  print("{:>40} {:>14} {:>14} {:>8}".format(
+      "expression", "before (us)", "after (us)", "speedup"))
+  n = 10000
+  for expression in EXPRESSIONS:
+    assert before(expression) == evaluate(expression)
+    t_before = timeit.timeit(lambda: before(expression), number=n)
+    t_after  = timeit.timeit(lambda: evaluate(expression), number=n)
+    print("{:>40} {:>14.3f} {:>14.3f} {:>7.1f}x".format(
+        repr(expression)[:40], 1e6 * t_before / n, 1e6 * t_after / n,
+        t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
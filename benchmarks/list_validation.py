@@ -0,0 +1,49 @@
+"""
+Cost of validating long lists of simple values
+
+Compares validating each element separately (`_validate` on the element spec,
+as `validate_list` used to) with validating the whole list at once, for lists
+of a million strings to be coerced or checked against a few options.
+
+  $ python benchmarks/list_validation.py
+"""
+import time
+
+from configurati.validation import _validate, compile_spec, one_of, optional, required, validate_list
+
+
+N = 1000000
+
+
+def one_at_a_time(spec, config):
+  return [_validate(spec[0], c) for c in config]
+
+
+def timed(f, *args):
+  start = time.time()
+  result = f(*args)
+  return result, time.time() - start
+
+
+def main():
+  cases = [
+      ("int",    [required(type=int)],   [str(i) for i in range(N)]),
+      ("float",  [required(type=float)], [str(i * 0.5) for i in range(N)]),
+      ("str",    [optional(type=str, default="")], list(range(N))),
+      ("one_of", [required(type=one_of("debug", "info", "warning"))], ["debug", "info", "warning", "info"] * (N // 4)),
+    ]
+
+  print("{:>8} {:>16} {:>12} {:>12} {:>8}".format(
+      "type", "one at a time (s)", "batched (s)", "compiled (s)", "speedup"))
+  for name, spec, config in cases:
+    expected, t_before = timed(one_at_a_time, spec, config)
+    actual,   t_after  = timed(validate_list, spec, config)
+    compiled = compile_spec(spec)
+    actual_c, t_compiled = timed(compiled.validate_node, config)
+    assert actual == expected and actual_c == expected
+    print("{:>8} {:>17.3f} {:>12.3f} {:>12.3f} {:>7.1f}x".format(
+        name, t_before, t_after, t_compiled, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,85 @@
+"""
+Cost of overlaying a few overrides onto a large config
+
+Compares the previous `update`, which visited every element of each list on
+the way and copied lists it extended, with the current `update` and `merge`,
+which only visit what the overrides touch. Without modifying the base config,
+the previous `update` also needed a full copy first.
+
+  $ python benchmarks/merge.py
+"""
+import timeit
+
+from configurati.utils import copy_tree, merge, update, Missing
+
+
+def before(o1, o2):
+  def update_dict(o1, o2):
+    if not isinstance(o2, dict):
+      o2 = {}
+    for k, v in o1.items():
+      o2[k] = before(o1[k], o2.get(k, {}))
+    return o2
+
+  def update_list(o1, o2):
+    if not isinstance(o2, list):
+      try:
+        o2 = list(o2)
+      except ValueError:
+        o2 = []
+    if len(o1) > len(o2):
+      o2 = o2 + [Missing] * (len(o1) - len(o2))
+    if len(o2) > len(o1):
+      o1 = o1 + [Missing] * (len(o2) - len(o1))
+    for i in range(len(o1)):
+      o2[i] = before(o1[i], o2[i])
+    return o2
+
+  def update_tuple(o1, o2):
+    return tuple(update_list(o1, list(o2)))
+
+  if isinstance(o1, dict):
+    return update_dict(o1, o2)
+  elif isinstance(o1, list):
+    return update_list(o1, o2)
+  elif isinstance(o1, tuple):
+    return update_tuple(o1, o2)
+  else:
+    return o2 if o1 is Missing else o1
+
+
+def make_config(n):
+  """A config with `n` sections, each with a 100-element list of dicts"""
+  return {
+      "section{}".format(i): {"items": [{"value": j} for j in range(100)], "name": "x"}
+      for i in range(n)
+    }
+
+
+def main():
+  overrides = {
+      "section0": {"name": "y"},
+      "section1": {"items": [Missing] * 50 + [{"value": -1}]},
+      "section2": {"items": [Missing] * 99 + [{"value": -1}]},
+    }
+  print("{:>8} {:>16} {:>16} {:>16} {:>16}".format(
+      "leaves", "update before", "update after", "copy + update", "merge"))
+  print("{:>8} {:>16} {:>16} {:>16} {:>16}".format(
+      "", "(us)", "(us)", "(us)", "(us)"))
+  for n in [10, 100, 1000]:
+    config = make_config(n)
+    assert before(overrides, copy_tree(config)) == merge(overrides, config)
+
+    number = 100
+    times = [
+        timeit.timeit(lambda: before(overrides, config), number=number),
+        timeit.timeit(lambda: update(overrides, config), number=number),
+        timeit.timeit(lambda: before(overrides, copy_tree(config)), number=number),
+        timeit.timeit(lambda: merge(overrides, config), number=number),
+      ]
+    print("{:>8} {:>16.1f} {:>16.1f} {:>16.1f} {:>16.1f}".format(
+        n * 101, *[1e6 * t / number for t in times]))
+
+
+if __name__ == '__main__':
+  main()
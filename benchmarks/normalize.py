@@ -0,0 +1,62 @@
+"""
+Per-node cost of post-processing a loaded YAML/JSON config
+
+Compares the previous pipeline -- substitute, `normalize_keys`,
+`strip_invalid_keys` and `attrs.from_dict`, each a full copy -- with the fused
+`normalize` pass used by `load_config`.
+
+  $ python benchmarks/normalize.py
+"""
+import json
+import timeit
+
+import yaml
+
+from configurati.attrs import attrs, unroll
+from configurati.loaders.utils import substitute
+from configurati.utils import normalize, normalize_keys, recursive_apply, strip_invalid_keys
+
+
+def make_config(width, depth):
+  """A config with `width` children per dict, `depth` levels deep"""
+  if depth == 0:
+    return ["value", 1, 2.0, True, "`1 + 1`"]
+  return {
+      "key-{}".format(i) if i % 2 else "key_{}".format(i): make_config(width, depth - 1)
+      for i in range(width)
+    }
+
+
+def before(contents):
+  contents = recursive_apply(contents, value_func=substitute)
+  return attrs.from_dict(strip_invalid_keys(normalize_keys(contents)))
+
+
+def after(contents):
+  return normalize(contents, value_func=substitute, factory=attrs)
+
+
+def main():
+  print("{:>6} {:>8} {:>14} {:>14} {:>8}".format(
+      "format", "nodes", "before (us)", "after (us)", "speedup"))
+  for width, depth in [(10, 2), (10, 3), (10, 4)]:
+    config = make_config(width, depth)
+    nodes  = len(unroll(config))
+    for name, dumps, loads in [
+        ("yaml", yaml.dump, yaml.safe_load),
+        ("json", json.dumps, json.loads),
+      ]:
+      contents = loads(dumps(config))
+      assert before(contents) == after(contents)
+
+      n = max(1, 100000 // nodes)
+      t_before = timeit.timeit(lambda: before(contents), number=n)
+      t_after  = timeit.timeit(lambda: after(contents), number=n)
+      print("{:>6} {:>8} {:>14.3f} {:>14.3f} {:>7.1f}x".format(
+          name, nodes,
+          1e6 * t_before / (n * nodes), 1e6 * t_after / (n * nodes),
+          t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,51 @@
+"""
+Cost of parsing command line override values
+
+Compares parsing every value with the JSON parser and keeping it as a string
+when that fails, as `loaders.commandline.parse_value` used to, with
+recognizing common shapes first. Values repeat, as they do across a sweep.
+
+  $ python benchmarks/parse_value.py
+"""
+import random
+import timeit
+
+from configurati.loaders.commandline import parse_value
+from configurati.loaders.json import loads
+
+
+def before(s):
+  try:
+    s = loads(s)
+  except ValueError:
+    pass
+  return s
+
+
+SHAPES = {
+  "plain strings": lambda i: random.choice(["localhost", "adam", "relu", "/data/run{}".format(i % 50)]),
+  "numbers": lambda i: random.choice([str(i % 100), "{}e-3".format(i % 100), "0.{}".format(i % 100)]),
+  "literals": lambda i: random.choice(["true", "false", "null"]),
+  "strings": lambda i: '"name{}"'.format(i % 100),
+  "lists": lambda i: "[{}, {}, 3]".format(i % 10, i % 7),
+  "objects": lambda i: '{{"a": {}}}'.format(i % 10),
+}
+
+
+def main():
+  random.seed(0)
+  print("{:>14} {:>12} {:>12} {:>8}".format(
+      "values", "before (us)", "after (us)", "speedup"))
+  for name, shape in sorted(SHAPES.items()):
+    values = [shape(i) for i in range(10000)]
+    assert [before(v) for v in values] == [parse_value(v) for v in values]
+
+    t_before = timeit.timeit(lambda: [before(v) for v in values], number=3)
+    t_after  = timeit.timeit(lambda: [parse_value(v) for v in values], number=3)
+    n = 3 * len(values)
+    print("{:>14} {:>12.2f} {:>12.2f} {:>7.1f}x".format(
+        name, 1e6 * t_before / n, 1e6 * t_after / n, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
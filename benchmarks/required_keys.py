@@ -0,0 +1,62 @@
+"""
+Cost of checking a config for missing required keys
+
+Compares searching the spec for required keys on every check (flattening it
+with `unroll` and looking each one up by its fancy key, as
+`missing_required_keys` used to) with the spec's precomputed `RequiredIndex`.
+
+  $ python benchmarks/required_keys.py
+"""
+import timeit
+
+from configurati.attrs import attrs, lookup
+from configurati.utils import NotFound
+from configurati.validation import index_spec, missing_required_keys, optional, required
+
+
+def rescan(spec, config):
+  return [
+      k for k, v in spec.unroll().items()
+      if isinstance(v, required) and lookup(config, '.' + k) is NotFound
+    ]
+
+
+def make_spec(width):
+  return attrs.from_dict({
+      "service{}".format(i): {
+        "host": required(type=str),
+        "port": optional(type=int, default=80),
+        "auth": {"user": required(type=str), "password": optional(type=str)},
+        "replicas": (required(type=str), optional(type=int, default=1)),
+      }
+      for i in range(width)
+    })
+
+
+def make_config(width):
+  return {
+      "service{}".format(i): {
+        "host": "host{}".format(i),
+        "auth": {"user": "root"},
+        "replicas": ["a"],
+      }
+      for i in range(width)
+    }
+
+
+def main():
+  print("{:>8} {:>12} {:>12} {:>8}".format(
+      "services", "rescan (us)", "index (us)", "speedup"))
+  for width in [1, 10, 100, 1000]:
+    spec, config = index_spec(make_spec(width)), make_config(width)
+    assert missing_required_keys(spec, config) == rescan(spec, config)
+
+    number = max(10, 10000 // width)
+    t_before = timeit.timeit(lambda: rescan(spec, config), number=number)
+    t_after  = timeit.timeit(lambda: missing_required_keys(spec, config), number=number)
+    print("{:>8} {:>12.1f} {:>12.1f} {:>7.1f}x".format(
+        width, 1e6 * t_before / number, 1e6 * t_after / number, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
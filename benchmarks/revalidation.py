@@ -0,0 +1,68 @@
+"""
+Cost of re-validating a large config after changing one value
+
+Compares validating the whole config again (`validate`, including its check
+for missing required keys) with a `ValidationSession` re-validating only the
+changed key.
+
+  $ python benchmarks/revalidation.py
+"""
+import timeit
+
+from configurati.attrs import attrs
+from configurati.validation import optional, required, validate, ValidationSession
+
+
+def make_spec(width):
+  return attrs.from_dict({
+      "service{}".format(i): {
+        "host": required(type=str),
+        "port": optional(type=int, default=80),
+        "timeout": optional(type=float, default=1.0),
+        "tags": [required(type=str)],
+      }
+      for i in range(width)
+    })
+
+
+def make_config(width):
+  return {
+      "service{}".format(i): {
+        "host": "host{}".format(i),
+        "port": "8080",
+        "tags": ["x", "y", "z"],
+      }
+      for i in range(width)
+    }
+
+
+def main():
+  print("{:>8} {:>13} {:>16} {:>8}".format(
+      "services", "validate (us)", "revalidate (us)", "speedup"))
+  for width in [10, 100, 1000]:
+    spec, config = make_spec(width), make_config(width)
+    session = ValidationSession(spec)
+    session.validate(config)
+
+    def change():
+      config["service0"]["port"] = str(int(config["service0"]["port"]) + 1)
+
+    def full():
+      change()
+      return validate(spec, config)
+
+    def incremental():
+      change()
+      return session.revalidate(config, ["service0.port"])
+
+    assert incremental() == validate(spec, config)
+
+    number = max(10, 10000 // width)
+    t_before = timeit.timeit(full, number=number)
+    t_after  = timeit.timeit(incremental, number=number)
+    print("{:>8} {:>13.1f} {:>16.1f} {:>7.1f}x".format(
+        width, 1e6 * t_before / number, 1e6 * t_after / number, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,59 @@
+"""
+Cost of validating configs against the same spec over and over
+
+Compares interpreting the spec on every call (`_validate`, which dispatches
+through `VALIDATORS` at each node) with a spec compiled once by
+`compile_spec`.
+
+  $ python benchmarks/validation.py
+"""
+import timeit
+
+from configurati.attrs import attrs
+from configurati.validation import _validate, compile_spec, one_of, optional, required
+
+
+def make_spec(width):
+  """A spec with `width` services, each with a few typed fields and a list"""
+  return attrs.from_dict({
+      "service{}".format(i): {
+        "host": required(type=str),
+        "port": optional(type=int, default=80),
+        "timeout": optional(type=float, default=1.0),
+        "level": optional(type=one_of("debug", "info"), default="info"),
+        "replicas": (required(type=str), optional(type=int, default=1)),
+        "tags": [required(type=str)],
+      }
+      for i in range(width)
+    })
+
+
+def make_config(width):
+  return {
+      "service{}".format(i): {
+        "host": "host{}".format(i),
+        "port": "8080",
+        "replicas": ["a"],
+        "tags": ["x", "y", "z"],
+      }
+      for i in range(width)
+    }
+
+
+def main():
+  print("{:>8} {:>16} {:>16} {:>8}".format(
+      "services", "interpreted (us)", "compiled (us)", "speedup"))
+  for width in [1, 10, 100]:
+    spec, config = make_spec(width), make_config(width)
+    compiled = compile_spec(spec)
+    assert compiled.validate_node(config) == _validate(spec, config)
+
+    number = max(1, 10000 // width)
+    t_before = timeit.timeit(lambda: _validate(spec, config), number=number)
+    t_after  = timeit.timeit(lambda: compiled.validate_node(config), number=number)
+    print("{:>8} {:>16.1f} {:>16.1f} {:>7.1f}x".format(
+        width, 1e6 * t_before / number, 1e6 * t_after / number, t_before / t_after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,53 @@
+"""
+Time to parse multi-megabyte YAML configs with each of PyYAML's loaders
+
+  $ python benchmarks/yaml_loaders.py
+"""
+from StringIO import StringIO
+import time
+
+import yaml
+
+from configurati.loaders.yaml import parse
+
+
+def make_config(sections, entries):
+  return {
+      "section_{}".format(i): {
+        "entry_{}".format(j): {
+          "host": "host-{}.example.com".format(j),
+          "port": 8000 + j,
+          "weights": [0.1, 0.2, 0.3],
+          "enabled": j % 2 == 0,
+        }
+        for j in range(entries)
+      }
+      for i in range(sections)
+    }
+
+
+def main():
+  loaders = [
+      ("Loader",      yaml.Loader),
+      ("SafeLoader",  yaml.SafeLoader),
+    ]
+  if yaml.__with_libyaml__:
+    loaders += [
+        ("CLoader",     yaml.CLoader),
+        ("CSafeLoader", yaml.CSafeLoader),
+      ]
+  else:
+    print("PyYAML was built without libyaml; only pure-Python loaders available")
+
+  print("{:>8} {:>12} {:>12}".format("size", "loader", "time (s)"))
+  for sections in [10, 50]:
+    text = yaml.dump(make_config(sections, 200))
+    for name, loader in loaders:
+      start = time.time()
+      parse(StringIO(text), yaml_loader=loader)
+      elapsed = time.time() - start
+      print("{:>6.1f}MB {:>12} {:>12.3f}".format(len(text) / 1e6, name, elapsed))
+
+
+if __name__ == '__main__':
+  main()
@@ -3,6 +3,8 @@ from .configure import *
 from .commands import *
 from .exceptions import *
 from .globals import *
+from .loaders.utils import expression_cache
+from .stack import *
 from .validation import *
 from .utils import *
 
@@ -14,9 +16,11 @@ __all__ = [
     'attrs',
 
     # commands
+    'config_cache',
     'env',
     'import_config',
     'import_spec',
+    'iter_configs',
     'load_config',
     'load_spec',
 
@@ -30,10 +34,18 @@ __all__ = [
     # globals
     'CONFIG',
 
+    # loaders
+    'expression_cache',
+
+    # stack
+    'ConfigStack',
+
     # validation
+    'compile_spec',
     'one_of',
     'optional',
     'required',
+    'ValidationSession',
 
     # utils
     'Missing'
@@ -1,10 +1,11 @@
 """
 Attribute dictionary
 """
+from collections import namedtuple, MutableMapping, MutableSequence
 import re
 
 from .exceptions import ConfiguratiException
-from .utils import recursive_apply, Missing
+from .utils import recursive_apply, LRUCache, Missing, NotFound
 
 
 class adict(dict):
@@ -20,6 +21,12 @@ class adict(dict):
     self[key] = value
     return self[key]
 
+  def __copy__(self):
+    # copy.copy would otherwise re-add (and re-convert) each value
+    result = type(self)()
+    dict.update(result, self)
+    return result
+
   def to_dict(self):
     f = lambda x: dict(x) if isinstance(x, attrs) else x
     return recursive_apply(self, value_func=f)
@@ -35,7 +42,12 @@ class adict(dict):
 
 
 class attrs(adict):
-  """A dictionary/object designed for nested objects"""
+  """A dictionary/object designed for nested objects
+
+  Dicts assigned to an attrs, and any dicts within them, are copied into new
+  attrs. A value that's already an attrs is stored as it is rather than
+  copied, so after `a.b = b`, changes to `b` show up in `a.b`.
+  """
 
   def __init__(self, *args, **kwargs):
     super(attrs, self).__init__()
@@ -68,19 +80,326 @@ class attrs(adict):
       raise KeyError(
           "invalid attrs key: {}".format(key)
         )
-    value = attrs.from_dict(value)
+    # an attrs' contents have already been converted, so there's no need to
+    # copy it all over again
+    if not isinstance(value, attrs):
+      value = attrs.from_dict(value)
     if is_atomic(key):
       return super(attrs, self).__setitem__(key, value)
     else:
       return set(self, '.' + key, value, build=True)
 
+  def get(self, key, default=None):
+    if isinstance(key, basestring) and not is_atomic(key):
+      return lookup(self, '.' + key, default)
+    else:
+      return super(attrs, self).get(key, default)
+
   def __contains__(self, key):
-    try:
-      self[key]
-      return True
-    except:
+    if not isinstance(key, basestring):
+      return False
+    return self.get(key, NotFound) is not NotFound
+
+  @classmethod
+  def view(cls, d):
+    """Wrap a dict without copying it. See `attrsview`."""
+    return attrsview(d)
+
+
+LazyInfo = namedtuple("LazyInfo", ["sections", "materialized"])
+
+
+class lazyattrs(attrs):
+  """An attrs whose top-level values are only loaded when first needed
+
+  Each value is loaded the first time it's accessed by key or attribute. Any
+  method that needs every value, such as `items`, `to_dict` or comparisons,
+  loads them all. Values that haven't been loaded yet are kept apart from the
+  dict itself, so code that reads a dict's contents directly rather than
+  through its methods (`dict(d)`, `other.update(d)`, `f(**d)`) only sees the
+  values loaded so far; call `load_all` first to see everything.
+
+  Parameters
+  ----------
+  sections : dict
+      key -> function returning that key's value, with any dicts already
+      converted to attrs. Each is called at most once.
+  """
+
+  def __init__(self, sections):
+    super(lazyattrs, self).__init__()
+    object.__setattr__(self, '_sections', {})
+    object.__setattr__(self, '_materialized', 0)
+    for k, load in sections.items():
+      if not valid_key(k) or not is_atomic(k):
+        raise KeyError(
+            "invalid attrs key: {}".format(k)
+          )
+      self._sections[k] = load
+
+  def __copy__(self):
+    # values that haven't been loaded yet are loaded separately by each copy
+    result = lazyattrs({})
+    dict.update(result, self)
+    result._sections.update(self._sections)
+    object.__setattr__(result, '_materialized', self._materialized)
+    return result
+
+  def lazy_info(self):
+    """How many top-level values there are, and how many have been loaded"""
+    return LazyInfo(self._materialized + len(self._sections), self._materialized)
+
+  def load_all(self):
+    """Load every value that hasn't been loaded yet"""
+    for key in list(self._sections):
+      self._load(key)
+
+  def _load(self, key):
+    value = self._sections[key]()
+    del self._sections[key]
+    dict.__setitem__(self, key, value)
+    object.__setattr__(self, '_materialized', self._materialized + 1)
+    return value
+
+  def _unloaded(self, key):
+    """Is `key` a top-level value that hasn't been loaded yet?"""
+    return isinstance(key, basestring) and key in self._sections
+
+  def __getitem__(self, key):
+    if self._unloaded(key):
+      return self._load(key)
+    return super(lazyattrs, self).__getitem__(key)
+
+  def __setitem__(self, key, value):
+    self._sections.pop(key, None)
+    return super(lazyattrs, self).__setitem__(key, value)
+
+  def __delitem__(self, key):
+    if self._unloaded(key):
+      del self._sections[key]
+    else:
+      dict.__delitem__(self, key)
+
+  def __contains__(self, key):
+    return self._unloaded(key) or super(lazyattrs, self).__contains__(key)
+
+  def has_key(self, key):
+    return self._unloaded(key) or dict.has_key(self, key)
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return dict.__len__(self) + len(self._sections)
+
+  def keys(self):
+    return dict.keys(self) + list(self._sections)
+
+  def iterkeys(self):
+    return iter(self.keys())
+
+  def get(self, key, default=None):
+    if self._unloaded(key):
+      return self._load(key)
+    return super(lazyattrs, self).get(key, default)
+
+  def update(self, *args, **kwargs):
+    other = dict(*args, **kwargs)
+    for k in other:
+      self._sections.pop(k, None)
+    dict.update(self, other)
+
+  def clear(self):
+    self._sections.clear()
+    dict.clear(self)
+
+
+def _loading_all(name):
+  """Wrap a dict method so that it loads all of a lazyattrs' values first"""
+  method = getattr(attrs, name)
+
+  def wrapper(self, *args, **kwargs):
+    self.load_all()
+    return method(self, *args, **kwargs)
+
+  wrapper.__name__ = name
+  return wrapper
+
+
+for _name in ['items', 'values', 'iteritems', 'itervalues', 'viewitems',
+              'viewkeys', 'viewvalues', 'copy', 'pop', 'popitem', 'setdefault',
+              '__eq__', '__ne__', '__repr__']:
+  setattr(lazyattrs, _name, _loading_all(_name))
+
+
+class attrsview(MutableMapping):
+  """An attrs-like view of a plain dict
+
+  Unlike `attrs.from_dict`, nothing is copied up front. Reads and writes go
+  straight to the wrapped dict, and child dicts and lists are wrapped only
+  when they're accessed (the wrapper is then reused for as long as the child
+  is). Lists are wrapped in an `attrslistview`, so dicts inside them are views
+  too; tuples are returned as new tuples of wrapped values. `validate`,
+  `update` and `merge` accept views wherever they accept dicts.
+
+  >>> d = {'server': {'port': 8080}}
+  >>> config = attrs.view(d)
+  >>> config.server.port = 8081
+  >>> d['server']['port']
+  8081
+  """
+
+  def __init__(self, d):
+    object.__setattr__(self, '_dict', d)
+    object.__setattr__(self, '_children', {})
+
+  def _wrap(self, key, value):
+    return _wrap(self._children, key, value)
+
+  def __copy__(self):
+    # a view of a shallow copy, like copying a dict
+    return attrsview(dict(self._dict))
+
+  def __getattr__(self, key):
+    if not key.startswith('_') and key in self:
+      return self[key]
+    else:
+      raise AttributeError("No attribute: " + str(key))
+
+  def __setattr__(self, key, value):
+    self[key] = value
+    return self[key]
+
+  def __getitem__(self, key):
+    if is_atomic(key):
+      return self._wrap(key, self._dict[key])
+    else:
+      return self._wrap(key, get(self._dict, '.' + key))
+
+  def __setitem__(self, key, value):
+    if not valid_key(key):
+      raise KeyError(
+          "invalid attrs key: {}".format(key)
+        )
+    value = unwrap(value)
+    if is_atomic(key):
+      self._dict[key] = value
+    else:
+      set(self._dict, '.' + key, value, build=True)
+
+  def __delitem__(self, key):
+    del self._dict[key]
+    self._children.pop(key, None)
+
+  def __iter__(self):
+    return iter(self._dict)
+
+  def __len__(self):
+    return len(self._dict)
+
+  def __contains__(self, key):
+    if not isinstance(key, basestring):
       return False
+    elif is_atomic(key):
+      return key in self._dict
+    else:
+      return lookup(self._dict, '.' + key) is not NotFound
+
+  def get(self, key, default=None):
+    if isinstance(key, basestring) and not is_atomic(key):
+      value = lookup(self._dict, '.' + key)
+    else:
+      value = self._dict.get(key, NotFound)
+    if value is NotFound:
+      return default
+    return self._wrap(key, value)
+
+  def __eq__(self, other):
+    return self._dict == unwrap(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return "attrsview({!r})".format(self._dict)
+
+  def to_dict(self):
+    return recursive_apply(self._dict)
+
+  def unroll(self):
+    unrolled = unroll(self._dict)
+    return { k[1:]:v for k, v in unrolled.items() }
+
+
+class attrslistview(MutableSequence):
+  """A view of a plain list, found inside an `attrsview`
+
+  Reads and writes go straight to the wrapped list, and dicts and lists in it
+  are wrapped when they're accessed, as `attrsview`'s are.
+  """
+
+  def __init__(self, l):
+    self._list     = l
+    self._children = {}
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [_wrap({}, None, value) for value in self._list[i]]
+    return _wrap(self._children, i, self._list[i])
+
+  def __setitem__(self, i, value):
+    if isinstance(i, slice):
+      value = [unwrap(v) for v in value]
+    else:
+      value = unwrap(value)
+    self._list[i] = value
+
+  def __delitem__(self, i):
+    del self._list[i]
+    # indices after `i` now refer to other values
+    self._children.clear()
+
+  def __len__(self):
+    return len(self._list)
+
+  def insert(self, i, value):
+    self._list.insert(i, unwrap(value))
+    self._children.clear()
+
+  def __eq__(self, other):
+    return self._list == unwrap(other)
+
+  def __ne__(self, other):
+    return not self == other
 
+  def __repr__(self):
+    return "attrslistview({!r})".format(self._list)
+
+
+def _wrap(children, key, value):
+  """Wrap a dict or list for a view, reusing the wrapper in `children`"""
+  if isinstance(value, dict):
+    cached = children.get(key)
+    if not isinstance(cached, attrsview) or cached._dict is not value:
+      cached = children[key] = attrsview(value)
+    return cached
+  elif isinstance(value, list):
+    cached = children.get(key)
+    if not isinstance(cached, attrslistview) or cached._list is not value:
+      cached = children[key] = attrslistview(value)
+    return cached
+  elif isinstance(value, tuple):
+    return tuple(_wrap({}, None, v) for v in value)
+  return value
+
+
+def unwrap(obj):
+  """The dict or list behind an `attrsview` or `attrslistview`, or `obj`"""
+  if isinstance(obj, attrsview):
+    return obj._dict
+  elif isinstance(obj, attrslistview):
+    return obj._list
+  return obj
 
 
 def is_atomic(key):
@@ -90,93 +409,128 @@ def is_atomic(key):
 
 
 def unroll(a):
-  if isinstance(a, dict):
-    result = {}
-    for k, v in a.items():
-      for k_, v_ in unroll(v).items():
-        result["." + k + k_] = v_
-    return result
-  elif isinstance(a, tuple) or isinstance(a, list):
-    result = {}
-    for k, v, in enumerate(a):
-      for k_, v_ in unroll(v).items():
-        result["[{}]{}".format(k, k_)] = v_
-    return result
-  else:
-    return {'': a}
+  """Flatten a nested object into a dict from fancy keys to leaf values"""
+  result = {}
+  stack  = [('', a)]
+  while len(stack) > 0:
+    prefix, obj = stack.pop()
+    if isinstance(obj, dict):
+      for k, v in obj.items():
+        stack.append((prefix + "." + k, v))
+    elif isinstance(obj, tuple) or isinstance(obj, list):
+      for k, v in enumerate(obj):
+        stack.append(("{}[{}]".format(prefix, k), v))
+    else:
+      result[prefix] = obj
+  return result
 
 
 def get(obj, key):
   """Retrieve a key from a nested object"""
-  if len(key) == 0:
-    return obj
-  else:
-    key, rest = next_key(key)
+  for k in compile_key(key):
     if isinstance(obj, dict):
-      return get(obj[key], rest)
+      obj = obj[k]
     elif isinstance(obj, list) or isinstance(obj, tuple):
-      if not isinstance(key, int):
-        raise KeyError('Attempting to use non-integer index "{}" on list or tuple'.format(key))
-      if key >= len(obj):
-        raise KeyError('Attempting to access index {} but only {} available'.format(key, len(obj)))
-      return get(obj[key], rest)
+      if not isinstance(k, int):
+        raise KeyError('Attempting to use non-integer index "{}" on list or tuple'.format(k))
+      if k >= len(obj):
+        raise KeyError('Attempting to access index {} but only {} available'.format(k, len(obj)))
+      obj = obj[k]
     else:
-      raise KeyError('Still have additional key components "{}" but have already reached terminal node {}'.format(key, obj))
+      raise KeyError('Still have additional key components "{}" but have already reached terminal node {}'.format(k, obj))
+  return obj
 
 
-def set(obj, key, value, build=False):
-  """Set a key to a value in a nested object"""
-  if len(key) == 0:
-    return value
-  else:
-    def set_dict(obj, key, value):
-      obj[key] = set(obj.get(key, Missing), rest, value, build)
-      return obj
-
-    def set_list(obj, key, value):
-      if not isinstance(key, int):
-        raise KeyError('Attempting to use non-integer index "{}" on list or tuple'.format(key))
-      if key >= len(obj):
-        obj = obj + [Missing] * (key + 1 - len(obj))
-      obj[key] = set(obj[key], rest, value, build)
-      return obj
+def lookup(obj, key, default=NotFound):
+  """Retrieve a key from a nested object, or `default` if it isn't there
 
-    def set_tuple(obj, key, value):
-      return tuple(set_list(list(obj), key, value))
+  Unlike `get`, this never raises for a missing key: malformed keys, absent
+  dict keys, indices out of range and keys that continue past a leaf all
+  return `default`. Errors loading a `lazyattrs` value are raised, though.
+  """
+  path = _try_compile_key(key)
+  if path is None:
+    return default
+  for k in path:
+    if isinstance(obj, dict):
+      value = dict.get(obj, k, NotFound)
+      if value is NotFound:
+        if not isinstance(obj, lazyattrs) or not obj._unloaded(k):
+          return default
+        value = obj[k]
+      obj = value
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+      if not isinstance(k, int) or not -len(obj) <= k < len(obj):
+        return default
+      obj = obj[k]
+    else:
+      return default
+  return obj
 
-    # parse next atomic key
-    key, rest = next_key(key)
 
+def set(obj, key, value, build=False):
+  """Set a key to a value in a nested object"""
+  # walk down the path, remembering each container and the key used in it
+  visited = []
+  for k in compile_key(key):
     # make an object if `build` and object is missing
     if build and obj is Missing:
-      if isinstance(key, basestring):
+      if isinstance(k, basestring):
         obj = {}
-      elif isinstance(key, int):
-        obj = [Missing] * (key + 1)
+      elif isinstance(k, int):
+        obj = [Missing] * (k + 1)
       else:
-        raise KeyError("Unrecognized key type: {}".format(str(type(key))))
+        raise KeyError("Unrecognized key type: {}".format(str(type(k))))
 
     if isinstance(obj, dict):
-      return set_dict(obj, key, value)
-    elif isinstance(obj, list):
-     return set_list(obj, key, value)
-    elif isinstance(obj, tuple):
-      return set_tuple(obj, key, value)
+      child = obj.get(k, Missing)
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+      if not isinstance(k, int):
+        raise KeyError('Attempting to use non-integer index "{}" on list or tuple'.format(k))
+      if k >= len(obj):
+        obj = obj + type(obj)([Missing] * (k + 1 - len(obj)))
+      child = obj[k]
+    else:
+      raise KeyError('Still have additional key components "{}" but have already reached terminal node {}'.format(k, obj))
+
+    visited.append((obj, k))
+    obj = child
+
+  # walk back up, placing each new value in its parent. lists may have been
+  # extended and tuples must be rebuilt, so parents can change too.
+  for obj, k in reversed(visited):
+    if isinstance(obj, tuple):
+      obj = list(obj)
+      obj[k] = value
+      value = tuple(obj)
     else:
-      raise KeyError('Still have additional key components "{}" but have already reached terminal node {}'.format(key, obj))
+      obj[k] = value
+      value = obj
+  return value
+
+
+# compiled patterns for parsing keys
+_DOT_KEY     = re.compile("""^[.]([^.[]*)""")
+_BRACKET_KEY = re.compile("""^\[([^[.]*)\]""")
+_IDENTIFIER  = re.compile("""^[a-zA-Z][a-zA-Z0-9-_]*$""")
+
+# parsed keys, indexed by their string representation
+_KEY_CACHE = LRUCache(maxsize=4096)
 
 
 def next_key(s):
   if s.startswith('.'):
     # get "key_1" from ".key_1[0]" or ".key_1.key_2"
-    match = re.search("""^[.]([^.[]*)""", s)
+    match = _DOT_KEY.search(s)
     key, rest = match.group(1), s[match.end():]
-    if re.search("""^[a-zA-Z][a-zA-Z0-9-_]*$""", key) is None:
+    if _IDENTIFIER.search(key) is None:
       raise KeyError('"{}" is not a attrs key'.format(key))
     return key.replace("-", "_"), rest
   elif s.startswith('['):
     # get "5" from "[5].key_1" or "[5][3]"
-    match = re.search("""^\[([^[.]*)\]""", s)
+    match = _BRACKET_KEY.search(s)
+    if match is None:
+      raise KeyError('"{}" is not a valid list/tuple key'.format(s))
     key, rest = match.group(1), s[match.end():]
     try:
       key = int(key)
@@ -187,14 +541,54 @@ def next_key(s):
     raise KeyError('"{}" is not a valid attrs key'.format(s))
 
 
+def compile_key(key):
+  """Parse a key like ".a.b[3]" into a tuple of atomic keys like ("a", "b", 3)
+
+  Parsed keys are kept in a bounded LRU cache, so looking up the same path
+  again skips parsing altogether. Tuples are assumed to be compiled already and
+  are returned as-is.
+  """
+  if isinstance(key, tuple):
+    return key
+  path = _KEY_CACHE.get(key)
+  if path is None:
+    path = _parse_key(key)
+    _KEY_CACHE.put(key, path)
+  return path
+
+
+def _parse_key(key):
+  path = []
+  rest = key
+  while len(rest) > 0:
+    k, rest = next_key(rest)
+    path.append(k)
+  return tuple(path)
+
+
+def _try_compile_key(key):
+  """`compile_key`, or None if `key` can't be parsed
+
+  Only errors parsing the key itself are caught, never ones from the cache.
+  """
+  if isinstance(key, tuple):
+    return key
+  path = _KEY_CACHE.get(key)
+  if path is None:
+    try:
+      path = _parse_key(key)
+    except (KeyError, AttributeError):
+      return None
+    _KEY_CACHE.put(key, path)
+  return path
+
+
+def key_cache_info():
+  """Hit/miss statistics for the compiled key cache"""
+  return _KEY_CACHE.info()
+
+
 def valid_key(k):
   if not isinstance(k, basestring):
     return False
-  else:
-    k = '.' + k
-    while len(k) > 0:
-      try:
-        _, k = next_key(k)
-      except KeyError:
-        return False
-    return True
+  return _try_compile_key('.' + k) is not None
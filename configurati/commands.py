@@ -1,17 +1,158 @@
 """
 Commands to load a configuration
 """
-import codecs
+import hashlib
 import os
 import sys
 
-from .attrs import attrs
-from .loaders import load
-from .utils import normalize_keys, previous_frame, add_globals, strip_invalid_keys
-from .validation import is_spec
+from .attrs import attrs, lazyattrs
+from .exceptions import ConfiguratiException
+from .loaders import parse, sections, stream
+from .loaders.utils import MappedFile, substitute, substitute_all
+from .utils import (normalize, normalize_key, copy_tree, previous_frame, add_globals, unique,
+                    LRUCache, NotFound, snapshot_path, snapshot_paths, read_snapshot,
+                    write_snapshot)
+from .validation import compile_spec, index_spec, is_spec
 
 
-def load_config(path, relative_to_caller=False):
+class ConfigCache(object):
+  """Loaded configs, indexed by absolute path
+
+  A cached config is reused for as long as the modification time and size
+  (and, if `hash_contents`, a hash of the contents) of its file and of every
+  other file loaded while evaluating it -- for example, through
+  `import_config` -- are unchanged.
+
+  Callers always get their own copy of a cached config's dicts, lists and
+  tuples, so modifying a loaded config never affects the cache. A file loaded
+  with different parser options, such as `yaml_loader`, is cached separately
+  for each set of options.
+
+  Parameters
+  ----------
+  enabled : bool
+      whether `load_config` uses this cache by default
+  maxsize : int
+      maximum number of configs to keep in memory
+  hash_contents : bool
+      also compare a hash of each file's contents. Catches changes that
+      don't alter a file's modification time or size, at the cost of reading
+      the file on every load.
+  directory : str or None
+      if given, also save a snapshot of each loaded config in this directory
+      so later processes can skip parsing and evaluating it. Configs that
+      can't be pickled, such as those containing functions or modules, are
+      only kept in memory.
+  """
+
+  # names this cache's snapshots, apart from any others in the same directory
+  SNAPSHOT_PREFIX = "config-"
+
+  def __init__(self, enabled=False, maxsize=128, hash_contents=False, directory=None):
+    self.enabled       = enabled
+    self.hash_contents = hash_contents
+    self.directory     = directory
+    self._cache        = LRUCache(maxsize=maxsize)
+
+  def fingerprint(self, path):
+    stat = os.stat(path)
+    result = (stat.st_mtime, stat.st_size)
+    if self.hash_contents:
+      with open(path, 'rb') as f:
+        result += (hashlib.sha1(f.read()).hexdigest(),)
+    return result
+
+  def get(self, path, options=''):
+    """Retrieve a copy of a cached config and the files it was loaded from
+
+    Returns None if the config isn't cached with these options or any of its
+    files has changed.
+    """
+    variants = self._variants(path)
+    cached = variants.get(options)
+    if cached is None or not self._fresh(cached[0]):
+      return None
+    return copy_tree(cached[1], factory=attrs), cached[0]
+
+  def put(self, path, sources, config, options=''):
+    """Cache a config
+
+    Parameters
+    ----------
+    path : str
+        absolute path to the config's file
+    sources : [(str, tuple)]
+        path and fingerprint of every file read while loading the config
+    config : attrs
+        the loaded config
+    options : str
+        the options it was loaded with; see `options_key`
+    """
+    variants = dict(self._variants(path))
+    variants[options] = (tuple(sources), copy_tree(config))
+    self._cache.put(path, variants)
+    if self.directory is not None:
+      self._write(path, variants)
+
+  @staticmethod
+  def options_key(**options):
+    """A key identifying the options a config was loaded with"""
+    return repr(sorted(options.items()))
+
+  def _variants(self, path):
+    """Each set of options -> (sources, config) cached for `path`"""
+    variants = self._cache.get(path)
+    if variants is None and self.directory is not None:
+      variants = self._read(path)
+      if variants is not None:
+        self._cache.put(path, variants)
+    return variants if variants is not None else {}
+
+  def invalidate(self, path=None):
+    """Forget a single file's config, or every config if `path` is None"""
+    if path is None:
+      self._cache.clear()
+      snapshots = self._snapshots()
+    else:
+      path = os.path.abspath(path)
+      self._cache.invalidate(path)
+      snapshots = [self._snapshot(path)] if self.directory is not None else []
+    for snapshot in snapshots:
+      if os.path.exists(snapshot):
+        os.remove(snapshot)
+
+  def info(self):
+    return self._cache.info()
+
+  def _fresh(self, sources):
+    try:
+      return all(self.fingerprint(p) == fingerprint for p, fingerprint in sources)
+    except (IOError, OSError):
+      return False
+
+  def _snapshot(self, path):
+    return snapshot_path(self.directory, path, self.SNAPSHOT_PREFIX)
+
+  def _snapshots(self):
+    return snapshot_paths(self.directory, self.SNAPSHOT_PREFIX)
+
+  def _read(self, path):
+    cached = read_snapshot(self._snapshot(path))
+    return cached if isinstance(cached, dict) else None
+
+  def _write(self, path, cached):
+    write_snapshot(self._snapshot(path), cached)
+
+
+# process-wide cache used by `load_config`
+config_cache = ConfigCache()
+
+# files read while loading each of the configs currently being loaded
+_SOURCES = []
+
+
+def load_config(path, relative_to_caller=False, cache=None, streaming=False,
+                lazy=False, parallel=None, workers=None, **options):
   """Load a config module as a dict
 
   Parameters
@@ -21,25 +162,138 @@ def load_config(path, relative_to_caller=False):
   relative_to_caller : bool
       if path isn't an absolute file path, interpret it as relative to the file
       from which this method is called.
+  cache : bool or None
+      reuse this file's previously loaded contents if neither it nor any file
+      it loads has changed. If None, use `config_cache.enabled`. See
+      `ConfigCache`.
+  streaming : bool
+      build the config straight from the parser's events instead of parsing
+      the whole file first. See `configurati.loaders.stream`.
+  lazy : bool
+      don't parse or evaluate each top-level key until it's first accessed.
+      Returns a `lazyattrs`. Files that can't be split into top-level sections
+      (see `configurati.loaders.sections`) are loaded eagerly. Lazily loaded
+      configs aren't cached.
+  parallel : str or None
+      evaluate `...` expressions concurrently on a "thread" or "process" pool
+      of `workers` workers. See `configurati.loaders.utils.substitute_all`.
+      Expressions that load other configs should be marked "!serial" so that
+      the files they load are tracked by the cache.
+  workers : int or None
+      pool size for `parallel`. Defaults to the number of CPUs.
+  options
+      passed on to the file format's parser. For example, `yaml_loader="safe"`
+      selects the YAML loader (see `configurati.loaders.yaml.LOADERS`).
   """
-  if relative_to_caller and not os.path.abspath(path) == path:
-    previous_fname  = previous_frame().f_globals['__file__']
-    previous_fname  = os.path.abspath(previous_fname)
-    previous_folder = os.path.split(previous_fname)[0]
-    path            = os.path.join(previous_folder, path)
-  with codecs.open(path, 'r', 'UTF-8') as f:
-    return attrs.from_dict(strip_invalid_keys(normalize_keys(load(f))))
+  path = resolve_path(path, relative_to_caller)
+  if streaming and parallel:
+    raise ConfiguratiException("streaming and parallel can't be used together")
+
+  if lazy:
+    with MappedFile(path) as f:
+      split, value_func = sections(f, **options)
+    if split is not None:
+      result = {}
+      for k, v in split.items():
+        k = normalize_key(k)
+        if k is not None:
+          result[k] = _section_loader(v, value_func, parallel, workers)
+      return lazyattrs(result)
+
+  if cache is None:
+    cache = config_cache.enabled
+  if cache:
+    key = config_cache.options_key(streaming=streaming, parallel=parallel, **options)
+    cached = config_cache.get(path, key)
+    if cached is not None:
+      config, sources = cached
+      for s in _SOURCES:
+        s.extend(sources)
+      return config
+
+  # files only need tracking if this config, or one loading it, is cached
+  track = cache or len(_SOURCES) > 0
+  with MappedFile(path) as f:
+    # record this file and any loaded while evaluating it
+    sources = [(path, config_cache.fingerprint(path))] if track else []
+    if track:
+      _SOURCES.append(sources)
+    try:
+      if streaming:
+        documents = stream(f, factory=attrs, **options)
+        config = next(documents, None)
+        if next(documents, NotFound) is not NotFound:
+          raise ConfiguratiException(
+              "{} contains multiple documents; use iter_configs instead".format(path))
+      else:
+        contents, value_func = parse(f, **options)
+        config = _postprocess(contents, value_func, parallel, workers)
+    finally:
+      if track:
+        _SOURCES.pop()
+  for s in _SOURCES:
+    s.extend(sources)
+
+  if cache:
+    config_cache.put(path, unique(sources), config, key)
+  return config
 
 
-def load_spec(path, relative_to_caller=False):
-  """Load a configuration specification"""
-  spec = load_config(path, relative_to_caller=relative_to_caller)
+def _section_loader(section, value_func, parallel, workers):
+  return lambda: _postprocess(section(), value_func, parallel, workers)
+
+
+def _postprocess(contents, value_func, parallel, workers):
+  """Apply `value_func` to parsed contents and convert them to attrs"""
+  if parallel and value_func is substitute:
+    return substitute_all(contents, factory=attrs, parallel=parallel, workers=workers)
+  return normalize(contents, value_func=value_func, factory=attrs)
+
+
+def iter_configs(path, relative_to_caller=False, **options):
+  """Lazily load each document in a multi-document YAML file
+
+  Each config is built in a single pass straight from the parser's events,
+  and isn't parsed until it's asked for.
+
+  Parameters
+  ----------
+  path : str
+      path to configuration file
+  relative_to_caller : bool
+      see `load_config`
+  options
+      passed on to the file format's parser
+  """
+  path = resolve_path(path, relative_to_caller)
+
+  def configs():
+    with MappedFile(path) as f:
+      for config in stream(f, factory=attrs, **options):
+        yield config
+
+  return configs()
+
+
+def load_spec(path, relative_to_caller=False, cache=None, compiled=False, **options):
+  """Load a configuration specification
+
+  The spec comes with a `RequiredIndex` of its required keys, so validating
+  against it doesn't have to search the spec for them each time.
+
+  Parameters
+  ----------
+  compiled : bool
+      return a `CompiledSpec`, for validating many configs quickly
+  """
+  spec = load_config(path, relative_to_caller=relative_to_caller, cache=cache, **options)
   spec = { k:v for k,v in spec.items()
            if is_spec(v) }
-  return attrs.from_dict(spec)
+  spec = index_spec(attrs.from_dict(spec))
+  return compile_spec(spec) if compiled else spec
 
 
-def import_config(path, relative_to_caller=True):
+def import_config(path, relative_to_caller=True, cache=None):
   """Load contents of another configuration file into the environment
 
   Parameters
@@ -49,17 +303,38 @@ def import_config(path, relative_to_caller=True):
   relative_to_caller : bool
       if path isn't an absolute file path, interpret it as relative to the file
       from which this method is called.
+  cache : bool or None
+      see `load_config`
   """
-  variables = load_config(path, relative_to_caller=relative_to_caller)
+  variables = load_config(path, relative_to_caller=relative_to_caller, cache=cache)
   add_globals(**variables)
 
 
-def import_spec(path, relative_to_caller=True):
+def import_spec(path, relative_to_caller=True, cache=None):
   """Import another specification's contents into the environment"""
-  variables = load_spec(path, relative_to_caller=relative_to_caller)
+  variables = load_spec(path, relative_to_caller=relative_to_caller, cache=cache)
   add_globals(**variables)
 
 
+def resolve_path(path, relative_to_caller=False):
+  """Find the absolute path to a file
+
+  Parameters
+  ----------
+  path : str
+      path to a file
+  relative_to_caller : bool
+      if path isn't an absolute file path, interpret it as relative to the file
+      from which the configurati function being used was called.
+  """
+  if relative_to_caller and not os.path.abspath(path) == path:
+    previous_fname  = previous_frame().f_globals['__file__']
+    previous_fname  = os.path.abspath(previous_fname)
+    previous_folder = os.path.split(previous_fname)[0]
+    path            = os.path.join(previous_folder, path)
+  return os.path.abspath(path)
+
+
 def env(variable_name):
   """Load an environment variable
 
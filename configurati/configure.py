@@ -3,6 +3,7 @@ The `configure` command
 """
 import sys
 
+from .attrs import attrs
 from .loaders import load
 from .commands import load_config, load_spec
 from .globals import CONFIG
@@ -10,10 +11,13 @@ from .utils import update
 from .validation import validate
 
 
-def configure(args=None, config=None, spec=None):
+def configure(args=None, config=None, spec=None, lazy=False, overrides_from=None):
   # load command line arguments
   if args is None:
     args = sys.argv[1:]
+  if overrides_from is not None:
+    # applied first, so arguments take precedence
+    args = ['--overrides-from', overrides_from] + list(args)
   if args is not None:
     args = load(args)
   else:
@@ -23,7 +27,7 @@ def configure(args=None, config=None, spec=None):
   if config is None and 'config' in args:
     config = args['config']
   if config is not None:
-    result = update(args, load_config(config))
+    result = update(args, load_config(config, lazy=lazy), factory=attrs)
   else:
     result = args
 
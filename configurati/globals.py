@@ -2,7 +2,7 @@
 Global way to access configuration.
 """
 
-from .attrs import attrs
+from .attrs import attrs, lazyattrs
 
 
 # globally accessible configuration object.
@@ -13,5 +13,9 @@ _CONFIG = attrs()
 def CONFIG(config=None):
   if config is not None:
     global _CONFIG
-    _CONFIG = attrs.from_dict(config)
+    if isinstance(config, lazyattrs):
+      # copying would load every value
+      _CONFIG = config
+    else:
+      _CONFIG = attrs.from_dict(config)
   return _CONFIG
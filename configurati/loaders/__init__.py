@@ -1,13 +1,30 @@
+from . import json as json_format
+from . import python as python_format
+from . import yaml as yaml_format
 from .json import load as load_json
 from .yaml import load as load_yaml
 from .python import load as load_py
 from .commandline import load as load_cl
+from .utils import substitute
 
 from ..exceptions import ConfiguratiException
+from ..utils import identity
 
 
 __all__ = [
-  'load'
+  'load',
+  'parse',
+  'sections',
+  'stream',
+]
+
+
+# file extension -> (module with `parse` and `stream` functions for that
+# format, function to apply to each value)
+FORMATS = [
+  (".py",   (python_format, identity)),
+  (".yaml", (yaml_format,   substitute)),
+  (".json", (json_format,   substitute)),
 ]
 
 
@@ -24,3 +41,78 @@ def load(f):
       return load_json(f)
     else:
       raise ConfiguratiException("Unrecognized file type {}".format(n))
+
+
+def parse(f, **options):
+  """Parse a file without post-processing its values
+
+  Parameters
+  ----------
+  f : file
+      file to parse. Its format is determined by its name's extension.
+  options
+      passed on to the format's parser. Options meant for other formats, such
+      as `yaml_loader` for a JSON file, are ignored.
+
+  Returns
+  -------
+  contents : object
+      the file's parsed contents
+  value_func : function
+      function that should be applied to each of `contents`' values, such as
+      evaluating `...` expressions
+  """
+  module, value_func = file_format(f)
+  return module.parse(f, **options), value_func
+
+
+def sections(f, **options):
+  """Split a file into separately-parsed top-level sections, if possible
+
+  Parameters
+  ----------
+  f : file
+      file to split. Its format is determined by its name's extension.
+  options
+      passed on to the format's parser, as in `parse`
+
+  Returns
+  -------
+  sections : dict or None
+      key -> function returning that key's contents, before `value_func` is
+      applied. None if this file can't be split.
+  value_func : function
+      as in `parse`
+  """
+  module, value_func = file_format(f)
+  split = getattr(module, 'sections', None)
+  if split is None:
+    return None, value_func
+  return split(f, **options), value_func
+
+
+def stream(f, factory=dict, **options):
+  """Lazily load each document in a file, building each in a single pass
+
+  Only YAML files can contain more than one document.
+
+  Parameters
+  ----------
+  f : file
+      file to load. Its format is determined by its name's extension.
+  factory : type
+      dict type to build mappings with
+  options
+      passed on to the format's parser, as in `parse`
+  """
+  module, value_func = file_format(f)
+  return module.stream(f, value_func=value_func, factory=factory, **options)
+
+
+def file_format(f):
+  """Find the loader module and value function for a file, by extension"""
+  n = f.name.lower()
+  for extension, file_format in FORMATS:
+    if n.endswith(extension):
+      return file_format
+  raise ConfiguratiException("Unrecognized file type {}".format(n))
@@ -1,20 +1,123 @@
 from __future__ import absolute_import
 
-import json
+import re
+import sys
 
-from ..attrs import set
+from .json import backend, BACKENDS, loads
+from ..attrs import compile_key, set
 from ..exceptions import ConfiguratiException
+from ..utils import Missing, NotFound
 
 
 def load(args):
   """Construct configuration object from command line arguments alone"""
-  result = {}
   if args is None:
     args = sys.argv[1:]
-  while len(args) > 0:
-    k, v, args = next(args)
-    set(result, "." + k, v, build=True)
-  return result
+  pairs = list(scan(args))
+  if len(pairs) <= SEQUENTIAL_LIMIT:
+    try:
+      result = {}
+      for k, v in pairs:
+        set(result, '.' + k, v, build=True)
+      return result
+    except KeyError:
+      # a conflict, which a later override may yet replace (see `Overrides`).
+      # `set` may have modified the values, so parse them again.
+      pairs = scan(args)
+  overrides = Overrides()
+  for k, v in pairs:
+    overrides.add(k, v)
+  return overrides.build()
+
+
+# up to how many overrides `load` sets one at a time rather than building an
+# `Overrides`. the trie's bookkeeping only pays for itself on long argument
+# lists; see benchmarks/commandline.py.
+SEQUENTIAL_LIMIT = 256
+
+
+def scan(args):
+  """Yield each key-value pair in a list of arguments, in order
+
+  Equivalent to calling `next` repeatedly, without copying what's left of
+  `args` each time. "--overrides-from path" is replaced by the overrides in
+  that file; see `read_overrides`.
+  """
+  i = 0
+  while i < len(args):
+    a = args[i]
+    if not a.startswith('--'):
+      raise ConfiguratiException('Arguments must be of the form "--key value" or "--key=value"')
+
+    a = a[2:]
+    if '=' in a:
+      # "--key=value"
+      key, value = a.split("=", 1)
+      i += 1
+    else:
+      # "--key" "value"
+      if not i + 1 < len(args):
+        raise ConfiguratiException('Found key but no value: "{}"'.format(args[i:]))
+      key, value = a, args[i + 1]
+      i += 2
+
+    if key == 'overrides-from':
+      for override in read_overrides(value):
+        yield override
+    else:
+      yield key, parse_value(value)
+
+
+def read_overrides(path):
+  """Yield each key-value pair in a file of overrides, in order
+
+  The file is read one line at a time. Each line is either "key=value", with
+  the value parsed as on the command line, or a JSON object mapping keys to
+  values. Blank lines and lines starting with "#" are skipped.
+
+  >>> # overrides.txt
+  >>> # a.b=1
+  >>> # {"a.c[0]": "x"}
+  >>> list(read_overrides("overrides.txt"))
+  [('a.b', 1), (u'a.c[0]', u'x')]
+
+  The order of keys within a single JSON object isn't preserved, so overrides
+  of overlapping keys belong on separate lines.
+
+  Parameters
+  ----------
+  path : str
+      file to read, or "-" for stdin
+  """
+  if path == '-':
+    for override in _read_overrides(sys.stdin, '<stdin>'):
+      yield override
+  else:
+    with open(path) as f:
+      for override in _read_overrides(f, path):
+        yield override
+
+
+def _read_overrides(f, name):
+  for n, line in enumerate(f, 1):
+    line = line.strip()
+    if len(line) == 0 or line.startswith('#'):
+      continue
+
+    if line.startswith('{'):
+      try:
+        overrides = loads(line)
+      except ValueError as e:
+        raise ConfiguratiException('{}:{}: invalid JSON: {}'.format(name, n, e))
+      for override in overrides.items():
+        yield override
+    elif '=' in line:
+      key, value = line.split('=', 1)
+      yield key.strip(), parse_value(value.strip())
+    else:
+      raise ConfiguratiException(
+          '{}:{}: overrides must be of the form "key=value" or a JSON object'.format(name, n)
+        )
 
 
 def next(args):
@@ -39,10 +142,232 @@ def next(args):
 
 
 def parse_value(s):
-  """Parse a value expression"""
+  """Parse a value expression
+
+  Values are parsed as JSON, or kept as they are if they aren't valid JSON.
+  With the standard JSON backend, the most common shapes (numbers, true, false,
+  null, strings without escapes, and flat lists of those) are recognized
+  without calling the parser, as is anything that can't be JSON at all, so
+  plain strings don't each cost a failed parse. Results are cached.
+  """
   # XXX should this be any Python expression?
-  try:
-    s = json.loads(s)
-  except ValueError:
-    pass
-  return s
+  if backend() is not BACKENDS['json']:
+    # other backends may parse differently
+    try:
+      s = loads(s)
+    except ValueError:
+      pass
+    return s
+
+  value = _VALUES.get(s, NotFound)
+  if value is NotFound:
+    value = _classify(s)
+    if value is NotFound:
+      try:
+        value = loads(s)
+      except ValueError:
+        value = _PLAIN
+    # values that can't be modified, and flat lists, which are copied
+    if type(value) is not dict and (type(value) is not list or _flat(value)):
+      if len(_VALUES) >= VALUE_CACHE_SIZE:
+        _VALUES.clear()
+      _VALUES[s] = value
+
+  if value is _PLAIN:
+    return s
+  elif type(value) is list:
+    return list(value)
+  return value
+
+
+# how many parsed values to keep. the cache is a plain dict, emptied when it's
+# full: with values this cheap to parse, an LRU's bookkeeping costs more than
+# it saves.
+VALUE_CACHE_SIZE = 4096
+
+# parsed values, by the text they were parsed from
+_VALUES = {}
+
+
+# stands in for text that isn't JSON, and so is used as is
+_PLAIN = object()
+
+# the whitespace JSON allows around values
+_WHITESPACE = ' \t\n\r'
+
+# the characters a JSON value can start with
+_JSON_START = frozenset('{["-0123456789tfnNI')
+
+_INT    = re.compile(r'-?(?:0|[1-9][0-9]*)$')
+_FLOAT  = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?$')
+# printable ASCII, without quotes or backslashes
+_STRING = re.compile(r'"[ !#-\[\]-~]*"$')
+
+_LITERALS = {
+  'true': True,
+  'false': False,
+  'null': None,
+  'NaN': float('nan'),
+  'Infinity': float('inf'),
+  '-Infinity': float('-inf'),
+}
+
+
+def _classify(s):
+  """Parse `s` as JSON would, without the parser
+
+  Returns `_PLAIN` if `s` isn't JSON, or NotFound if only the parser can tell.
+  """
+  s = s.strip(_WHITESPACE)
+  if len(s) == 0 or s[0] not in _JSON_START:
+    return _PLAIN
+  if s[0] == '{':
+    return NotFound
+  if s[0] == '[':
+    if s[-1] != ']':
+      return _PLAIN
+    contents = s[1:-1].strip(_WHITESPACE)
+    if len(contents) == 0:
+      return []
+    values = [_scalar(v.strip(_WHITESPACE)) for v in contents.split(',')]
+    if any(v is NotFound or v is _PLAIN for v in values):
+      # a string with a comma in it, a nested list, or something invalid
+      return NotFound
+    return values
+  return _scalar(s)
+
+
+def _scalar(s):
+  value = _LITERALS.get(s, NotFound)
+  if value is not NotFound:
+    return value
+  if s[:1] == '"':
+    return unicode(s[1:-1]) if _STRING.match(s) else NotFound
+  if s[:1] == '-' or s[:1].isdigit():
+    if _INT.match(s):
+      return int(s)
+    if _FLOAT.match(s):
+      return float(s)
+    return _PLAIN
+  if s[:1] in ('[', '{'):
+    return NotFound
+  # any other text, including the start of a literal with more after it
+  return _PLAIN
+
+
+def _flat(values):
+  return not any(isinstance(v, (list, dict)) for v in values)
+
+
+class Overrides(object):
+  """Key-value pairs to be built into a single nested object
+
+  Overrides are grouped by shared path prefix as they're added, so building
+  the result walks each path only once. The result is the same as calling
+  `attrs.set(result, "." + key, value, build=True)` for each override in
+  order: later overrides replace earlier ones, and overrides of keys inside an
+  earlier override's value are applied to that value. The one difference is
+  that an override which conflicts with an earlier one, such as "a.b" after
+  "a[0]", is only an error if no later override replaces the conflict.
+
+  >>> overrides = Overrides()
+  >>> overrides.add("a.b", 1)
+  >>> overrides.add("a.c[1]", 2)
+  >>> overrides.build()
+  {'a': {'b': 1, 'c': [Missing, 2]}}
+  """
+
+  def __init__(self):
+    self._root = _Node()
+
+  def add(self, key, value):
+    """Override a key, as in "a.b[0]", with a value"""
+    node = self._root
+    for k in compile_key('.' + key):
+      if node.children is None:
+        node.children = {}
+        node.order    = []
+      child = node.children.get(k)
+      if child is None:
+        child = node.children[k] = _Node()
+        node.order.append(k)
+      node = child
+    # anything set beneath this key so far is replaced
+    node.value    = value
+    node.children = None
+    node.order    = None
+
+  def build(self):
+    """Build every override into a new dict"""
+    # each frame is [node, object being built, index of next child]
+    frames = [[self._root, {}, 0]]
+    while True:
+      frame = frames[-1]
+      node, obj, i = frame
+      if node.order is None or i == len(node.order):
+        frames.pop()
+        if len(frames) == 0:
+          return obj
+        # place the finished object in its parent
+        parent = frames[-1]
+        k = parent[0].order[parent[2] - 1]
+        parent[1] = _place(parent[1], k, obj)
+        continue
+
+      k = node.order[i]
+      child = node.children[k]
+      obj = _container(obj, k)
+      frame[2] = i + 1
+
+      if child.order is None:
+        # nothing's set beneath this key, so its value is final
+        frame[1] = _place(obj, k, child.value)
+        continue
+
+      frame[1] = obj
+      if child.value is NotFound:
+        # start from whatever's already there, as `set` would
+        current = obj.get(k, Missing) if isinstance(obj, dict) else obj[k]
+      else:
+        current = child.value
+      frames.append([child, current, 0])
+
+
+class _Node(object):
+  """A key in `Overrides`, with the value it's set to and overrides beneath it
+
+  `order` lists the keys of `children` in the order they were first added.
+  """
+  __slots__ = ['value', 'children', 'order']
+
+  def __init__(self):
+    self.value    = NotFound
+    self.children = None
+    self.order    = None
+
+
+def _container(obj, k):
+  """Make `obj` able to hold key `k`, as `attrs.set(..., build=True)` would"""
+  if isinstance(obj, dict):
+    return obj
+  if obj is Missing:
+    if isinstance(k, basestring):
+      return {}
+    return [Missing] * (k + 1)
+  if isinstance(obj, (list, tuple)):
+    if not isinstance(k, int):
+      raise KeyError('Attempting to use non-integer index "{}" on list or tuple'.format(k))
+    if k >= len(obj):
+      obj = obj + type(obj)([Missing] * (k + 1 - len(obj)))
+    return obj
+  raise KeyError('Still have additional key components "{}" but have already reached terminal node {}'.format(k, obj))
+
+
+def _place(obj, k, value):
+  """Set `obj[k]` to `value`, rebuilding `obj` if it's a tuple"""
+  if isinstance(obj, tuple):
+    obj = list(obj)
+    obj[k] = value
+    return tuple(obj)
+  obj[k] = value
+  return obj
@@ -1,11 +1,158 @@
 from __future__ import absolute_import
 
+from decimal import Decimal
 import json
 
-from .utils import substitute
-from ..utils import recursive_apply
+try:
+  import ijson
+except ImportError:
+  ijson = None
 
+from .utils import substitute, TreeBuilder
+from ..exceptions import ConfiguratiException
+from ..utils import identity, normalize, recursive_apply
 
-def load(f):
-  contents = json.load(f)
+
+# name -> function parsing JSON from a str, unicode or bytes. Parsers must
+# raise ValueError (or a subclass) on invalid input.
+BACKENDS = {
+  'json': json.loads,
+}
+
+# faster parsers, registered if they're installed
+for _name in ['ujson', 'orjson', 'simdjson']:
+  try:
+    BACKENDS[_name] = __import__(_name).loads
+  except (ImportError, AttributeError):
+    pass
+
+# backend used when none is specified
+DEFAULT_BACKEND = 'json'
+
+
+def register_backend(name, loads):
+  """Make a JSON parser available by name
+
+  Parameters
+  ----------
+  name : str
+      name used to select this backend
+  loads : function
+      parses JSON from a str, unicode or bytes, raising ValueError on invalid
+      input
+  """
+  BACKENDS[name] = loads
+
+
+def set_default_backend(name):
+  """Select the JSON backend used when none is specified"""
+  global DEFAULT_BACKEND
+  backend(name)
+  DEFAULT_BACKEND = name
+
+
+def backend(name=None):
+  """Find a JSON parser by name, or the default one if `name` is None"""
+  if name is None:
+    name = DEFAULT_BACKEND
+  if name not in BACKENDS:
+    raise ConfiguratiException(
+        'Unknown JSON backend "{}"; choose one of {}'.format(name, sorted(BACKENDS))
+      )
+  return BACKENDS[name]
+
+
+def loads(s, json_backend=None):
+  """Parse JSON from a str, unicode, bytes, bytearray or memoryview"""
+  if isinstance(s, memoryview):
+    s = s.tobytes()
+  elif isinstance(s, bytearray):
+    s = bytes(s)
+  return backend(json_backend)(s)
+
+
+def parse(f, json_backend=None, **options):
+  """Parse a file's contents without evaluating `...` expressions
+
+  Parameters
+  ----------
+  f : file
+      file to parse
+  json_backend : str or None
+      name of an entry in `BACKENDS`. Defaults to `DEFAULT_BACKEND`.
+  """
+  return loads(f.read(), json_backend=json_backend)
+
+
+def sections(f, json_backend=None, **options):
+  """Split a JSON object into its top-level keys
+
+  JSON parsers are fast enough that finding each key's offset in Python would
+  cost more than parsing the whole file, so the file is parsed up front; only
+  post-processing each value is left for later.
+
+  Parameters
+  ----------
+  f : file
+      file to split
+  json_backend : str or None
+      see `parse`
+
+  Returns
+  -------
+  sections : dict or None
+      key -> function returning that key's value, or None if the file isn't a
+      JSON object
+  """
+  contents = parse(f, json_backend=json_backend)
+  if not isinstance(contents, dict):
+    return None
+  return {k: _constant(v) for k, v in contents.items()}
+
+
+def _constant(value):
+  return lambda: value
+
+
+def stream(f, value_func=identity, factory=dict, json_backend=None, **options):
+  """Build a JSON document straight from parser events
+
+  Keys are normalized and `value_func` is applied to each scalar as it's
+  parsed; see `TreeBuilder`. This requires `ijson` (`pip install ijson`);
+  without it, the document is parsed with `json_backend` and then normalized.
+  Either way, the single document is yielded, for symmetry with YAML streams.
+
+  Parameters
+  ----------
+  f : file
+      file to parse
+  value_func : function
+      applied to each scalar value
+  factory : type
+      dict type to build mappings with
+  json_backend : str or None
+      backend to fall back to if `ijson` isn't installed
+  """
+  if ijson is None:
+    yield normalize(parse(f, json_backend=json_backend), value_func, factory)
+    return
+
+  builder = TreeBuilder(value_func, factory)
+  for _, event, value in ijson.parse(f):
+    if event == 'start_map':
+      builder.start_mapping()
+    elif event == 'start_array':
+      builder.start_sequence()
+    elif event in ('end_map', 'end_array'):
+      builder.end()
+    else:
+      # ijson parses non-integers as Decimals; json parses them as floats
+      if isinstance(value, Decimal):
+        value = float(value)
+      builder.value(value)
+  yield builder.result
+
+
+def load(f, json_backend=None):
+  contents = parse(f, json_backend=json_backend)
   return recursive_apply(contents, value_func=substitute)
@@ -2,6 +2,8 @@ import imp
 import os
 import uuid
 
+from ..utils import identity, normalize
+
 
 def load(f):
   modname = str(uuid.uuid4())
@@ -12,3 +14,13 @@ def load(f):
   }
 
   return variables
+
+
+def parse(f, **options):
+  """Python files are evaluated as they're parsed, so this is just `load`"""
+  return load(f)
+
+
+def stream(f, value_func=identity, factory=dict, **options):
+  """Python files are evaluated all at once, so this yields a single config"""
+  yield normalize(load(f), value_func, factory)
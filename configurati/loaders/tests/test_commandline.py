@@ -1,5 +1,11 @@
+import json
+from StringIO import StringIO
+import sys
+from tempfile import NamedTemporaryFile as NTF
 import unittest
 
+from configurati.attrs import set
+from configurati.exceptions import ConfiguratiException
 from configurati.loaders.commandline import *
 from configurati.utils import Missing
 
@@ -16,6 +22,156 @@ class NextTests(unittest.TestCase):
     assert next(["--key", '{"a": 1}']) == ("key", {'a': 1}, [])
 
 
+class ParseValueTests(unittest.TestCase):
+
+  def test_same_as_json(self):
+    values = [
+        '1', '-0', '01', '1.5', '1e400', '-1E+3', '12345678901234567890', '1.2.3',
+        'true', 'truex', 'null', 'NaN', '-Infinity', '"a"', '"a\\"b"', '"a,b"',
+        '[1, "a", null]', '["a,b", [1]]', '[1,]', '[]', '{"a": [1]}', '{',
+        'localhost', '', '  2 ', '"\xc3\xa9"', u'"\xe9"',
+      ]
+    for v in values:
+      try:
+        expected = json.loads(v)
+      except ValueError:
+        expected = v
+      actual = parse_value(v)
+      self.assertEqual(repr(actual), repr(expected), v)
+      self.assertEqual(type(actual), type(expected), v)
+
+  def test_plain(self):
+    s = 'localhost'
+    self.assertIs(parse_value(s), s)
+    self.assertIsInstance(parse_value('x'), str)
+    self.assertIsInstance(parse_value(u'x'), unicode)
+
+  def test_copies(self):
+    v = parse_value('[1, 2]')
+    v.append(3)
+    self.assertEqual(parse_value('[1, 2]'), [1, 2])
+    v = parse_value('{"a": [1]}')
+    v['a'].append(2)
+    self.assertEqual(parse_value('{"a": [1]}'), {'a': [1]})
+
+
+class ScanTests(unittest.TestCase):
+
+  def test_scan(self):
+    self.assertEqual(
+        list(scan(["--a", "1", "--b=c=d", "--e", '{"f": 1}'])),
+        [("a", 1), ("b", "c=d"), ("e", {"f": 1})]
+      )
+
+  def test_no_value(self):
+    self.assertRaises(ConfiguratiException, list, scan(["--a", "1", "--b"]))
+
+  def test_no_dashes(self):
+    self.assertRaises(ConfiguratiException, list, scan(["a", "1"]))
+
+
+class ReadOverridesTests(unittest.TestCase):
+
+  def setUp(self):
+    self.text = "\n".join([
+        "# comment",
+        "a.b=1",
+        "",
+        "  c = x y  ",
+        '{"d[1]": "1", "e": {"f": null}}',
+      ])
+
+  def test_read(self):
+    with NTF() as f:
+      f.write(self.text)
+      f.flush()
+      self.assertEqual(
+          sorted(read_overrides(f.name)),
+          [("a.b", 1), ("c", "x y"), ("d[1]", "1"), ("e", {"f": None})]
+        )
+
+  def test_stdin(self):
+    stdin, sys.stdin = sys.stdin, StringIO(self.text)
+    try:
+      self.assertEqual(
+          load(["--overrides-from", "-"]),
+          {"a": {"b": 1}, "c": "x y", "d": [Missing, "1"], "e": {"f": None}}
+        )
+    finally:
+      sys.stdin = stdin
+
+  def test_order(self):
+    with NTF() as f:
+      f.write("a=1\nb=1\n")
+      f.flush()
+      self.assertEqual(
+          load(["--a", "0", "--overrides-from=" + f.name, "--b", "2"]),
+          {"a": 1, "b": 2}
+        )
+
+  def test_invalid(self):
+    for text in ["a", '{"a": 1']:
+      with NTF() as f:
+        f.write(text)
+        f.flush()
+        self.assertRaises(ConfiguratiException, list, read_overrides(f.name))
+
+
+class OverridesTests(unittest.TestCase):
+
+  def assertSameAsSet(self, args):
+    expected = {}
+    for k, v in scan(args):
+      set(expected, "." + k, v, build=True)
+    self.assertEqual(load(args), expected)
+    self.assertEqual(self.build(args), expected)
+
+  def build(self, args):
+    overrides = Overrides()
+    for k, v in scan(args):
+      overrides.add(k, v)
+    return overrides.build()
+
+  def test_shared_prefix(self):
+    self.assertSameAsSet(["--a.b", "1", "--a.c", "2", "--a.d[1]", "3", "--a.d[0].e", "4"])
+
+  def test_replace(self):
+    self.assertSameAsSet(["--a.b", "1", "--a", "2"])
+    self.assertSameAsSet(["--a[3]", "1", "--a", "[1]", "--a[2]", "2"])
+
+  def test_inside_value(self):
+    self.assertSameAsSet(["--a", '{"b": {"c": 1}, "d": [1]}', "--a.b.e", "2", "--a.d[2]", "3"])
+
+  def test_mixed_keys(self):
+    self.assertSameAsSet(["--a.b", "1", "--a[0]", "2"])
+
+  def test_hyphens(self):
+    self.assertSameAsSet(["--a-b.c-d", "1"])
+
+  def test_conflict(self):
+    self.assertRaises(KeyError, load, ["--a", "1", "--a.b", "2"])
+    self.assertRaises(KeyError, load, ["--a[0]", "1", "--a.b", "2"])
+
+  def test_conflict_replaced(self):
+    args = ["--a", "[1]", "--a[0]", "2", "--a.b", "3", "--a", "4"]
+    self.assertEqual(load(args), {'a': 4})
+    self.assertEqual(self.build(args), {'a': 4})
+
+  def test_long(self):
+    args = []
+    for i in range(SEQUENTIAL_LIMIT + 1):
+      args += ["--a.b{}".format(i), str(i)]
+    args += ["--c", "1", "--c.d", "2", "--c", "3"]
+    self.assertEqual(len(load(args)['a']), SEQUENTIAL_LIMIT + 1)
+    self.assertEqual(load(args)['c'], 3)
+
+  def test_many(self):
+    args = []
+    for i in range(1000):
+      args += ["--a.b{}.c[{}]".format(i % 10, i % 7), str(i)]
+    self.assertSameAsSet(args)
+
+
 class LoadTests(unittest.TestCase):
 
   def test_simple(self):
@@ -1,9 +1,15 @@
 from __future__ import absolute_import
 
+from decimal import Decimal
 import json
+from StringIO import StringIO
 import unittest
 
+from configurati.exceptions import ConfiguratiException
+from configurati.loaders import json as json_loader
 from configurati.loaders.json import *
+from configurati.loaders.utils import substitute
+from configurati.utils import normalize
 from configurati.loaders.tests import LoadTests
 
 
@@ -13,3 +19,97 @@ class JsonLoadTests(LoadTests, unittest.TestCase):
     self.loadfunc  = load
     self.dumpfunc  = json.dump
     self.extension = "json"
+
+
+class JsonBackendTests(unittest.TestCase):
+
+  def tearDown(self):
+    set_default_backend('json')
+    BACKENDS.pop('test', None)
+
+  def test_buffers(self):
+    for s in [b'{"a": [1, 2]}', u'{"a": [1, 2]}', bytearray(b'{"a": [1, 2]}'), memoryview(b'{"a": [1, 2]}')]:
+      self.assertEqual(loads(s), {'a': [1, 2]})
+
+  def test_register(self):
+    register_backend('test', lambda s: 'parsed')
+    self.assertEqual(loads('{}', json_backend='test'), 'parsed')
+    self.assertEqual(parse(StringIO('{}'), json_backend='test'), 'parsed')
+
+  def test_default(self):
+    from configurati.loaders.commandline import parse_value
+    register_backend('test', lambda s: 'parsed')
+    set_default_backend('test')
+    self.assertEqual(loads('{}'), 'parsed')
+    self.assertEqual(parse_value('1'), 'parsed')
+
+  def test_unknown(self):
+    self.assertRaises(ConfiguratiException, loads, '{}', json_backend='unknown')
+    self.assertRaises(ConfiguratiException, set_default_backend, 'unknown')
+
+
+class JsonSectionsTests(unittest.TestCase):
+
+  def test_sections(self):
+    split = sections(StringIO('{"a": [1, 2], "b": {"c": 1}}'))
+    self.assertEqual({k: v() for k, v in split.items()}, {'a': [1, 2], 'b': {'c': 1}})
+
+  def test_not_object(self):
+    self.assertIsNone(sections(StringIO('[1, 2]')))
+
+
+class JsonStreamTests(unittest.TestCase):
+
+  def test_same_as_parse(self):
+    text = '{"a-b": [1, 2.5, {"_c": null, "d": "`1 + 1`"}], "e": true}'
+    self.assertEqual(
+        list(stream(StringIO(text), value_func=substitute)),
+        [normalize(parse(StringIO(text)), value_func=substitute)]
+      )
+
+  def test_ijson(self):
+    ijson, json_loader.ijson = json_loader.ijson, FakeIjson
+    try:
+      self.test_same_as_parse()
+      [result] = stream(StringIO('{"a": [1, 2.5]}'))
+      self.assertIsInstance(result['a'][1], float)
+    finally:
+      json_loader.ijson = ijson
+
+  def test_without_ijson(self):
+    ijson, json_loader.ijson = json_loader.ijson, None
+    try:
+      self.test_same_as_parse()
+    finally:
+      json_loader.ijson = ijson
+
+
+class FakeIjson(object):
+  """Stands in for `ijson`, producing the events its `parse` would"""
+
+  @staticmethod
+  def parse(f):
+    stack = [json.load(f)]
+    while len(stack) > 0:
+      obj = stack.pop()
+      if isinstance(obj, tuple):
+        yield obj
+      elif isinstance(obj, dict):
+        yield ('', 'start_map', None)
+        stack.append(('', 'end_map', None))
+        for k, v in reversed(list(obj.items())):
+          stack.extend([v, ('', 'map_key', k)])
+      elif isinstance(obj, list):
+        yield ('', 'start_array', None)
+        stack.append(('', 'end_array', None))
+        stack.extend(reversed(obj))
+      elif obj is None:
+        yield ('', 'null', None)
+      elif isinstance(obj, bool):
+        yield ('', 'boolean', obj)
+      elif isinstance(obj, float):
+        yield ('', 'number', Decimal(repr(obj)))
+      elif isinstance(obj, (int, long)):
+        yield ('', 'number', obj)
+      else:
+        yield ('', 'string', obj)
@@ -1,7 +1,18 @@
 import os
+import shutil
+import threading
+from tempfile import mkdtemp, NamedTemporaryFile as NTF
 import unittest
 
+from configurati.exceptions import ConfiguratiException
 from configurati.loaders.utils import *
+from configurati.utils import normalize, NotFound
+
+
+# shared with expressions evaluated by SubstituteAllTest
+EVENT = threading.Event()
+ORDER = []
+CALLS = []
 
 
 class SubstituteTest(unittest.TestCase):
@@ -20,3 +31,193 @@ class SubstituteTest(unittest.TestCase):
 
   def test_substitution_function(self):
     self.assertEqual(substitute("`lambda x: x + 1`")(1), 2)
+
+  def test_substitution_with_semicolon_in_string(self):
+    self.assertEqual(substitute('`x = "a;b"; x`'), "a;b")
+
+  def test_substitution_with_block(self):
+    self.assertEqual(substitute("`x = 1\nif x:\n  x = 2\nx`"), 2)
+
+  def test_substitution_assignment(self):
+    self.assertEqual(substitute("`x = 1`"), 1)
+    self.assertEqual(substitute("`a, b = 1, 2`"), (1, 2))
+    self.assertEqual(substitute("`import os`"), None)
+
+  def test_substitution_partial(self):
+    self.assertEqual(substitute("a `1` b"), "a `1` b")
+
+  def test_separate_namespaces(self):
+    substitute("`leaked = 1`")
+    self.assertRaises(NameError, substitute, "`leaked`")
+
+  def test_errors(self):
+    self.assertRaises(ZeroDivisionError, substitute, "`1 / 0`")
+    self.assertRaises(SyntaxError, substitute, "`1 +`")
+
+  def test_code_cache(self):
+    hits = code_cache_info().hits
+    substitute("`1 + 2`")
+    substitute("`1 + 2`")
+    self.assertGreater(code_cache_info().hits, hits)
+
+
+class SplitMarkersTest(unittest.TestCase):
+
+  def test_markers(self):
+    self.assertEqual(split_markers("!serial 1 + 1"), (frozenset(['serial']), "1 + 1"))
+    self.assertEqual(split_markers("1 + 1"), (frozenset(), "1 + 1"))
+    self.assertEqual(substitute("`!serial 1 + 1`"), 2)
+
+  def test_unknown(self):
+    self.assertRaises(ConfiguratiException, split_markers, "!unknown 1")
+
+
+class ExpressionCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    expression_cache.invalidate()
+    module = "import sys; m = sys.modules[{!r}]; ".format(__name__)
+    self.text = "`!pure " + module + "m.CALLS.append(1); {'a': [len(m.CALLS)]}`"
+    del CALLS[:]
+
+  def test_memoized(self):
+    self.assertEqual(substitute(self.text), {'a': [1]})
+    self.assertEqual(substitute(self.text), {'a': [1]})
+    self.assertEqual(CALLS, [1])
+
+  def test_copies(self):
+    substitute(self.text)['a'].append(2)
+    self.assertEqual(substitute(self.text), {'a': [1]})
+
+  def test_impure(self):
+    text = self.text.replace("!pure ", "")
+    substitute(text)
+    substitute(text)
+    self.assertEqual(CALLS, [1, 1])
+
+  def test_substitute_all(self):
+    for parallel in ['thread', 'process']:
+      self.assertEqual(
+          substitute_all([self.text, self.text, "`!serial !pure 1`"], parallel=parallel),
+          [{'a': [1]}, {'a': [1]}, 1]
+        )
+    self.assertEqual(substitute(self.text), {'a': [1]})
+    self.assertEqual(CALLS, [1])
+
+  def test_directory(self):
+    directory = mkdtemp()
+    try:
+      cache = ExpressionCache(directory=directory)
+      cache.put("1 + 1", 2)
+      cache.put("lambda: 1", lambda: 1)
+      self.assertEqual(ExpressionCache(directory=directory).get("1 + 1"), 2)
+      self.assertIs(ExpressionCache(directory=directory).get("lambda: 1"), NotFound)
+      cache.invalidate("1 + 1")
+      self.assertIs(ExpressionCache(directory=directory).get("1 + 1"), NotFound)
+    finally:
+      shutil.rmtree(directory)
+
+  def test_shared_directory(self):
+    from configurati.commands import ConfigCache
+    directory = mkdtemp()
+    try:
+      configs = ConfigCache(directory=directory)
+      with NTF(suffix='.py') as f:
+        configs.put(f.name, [], {'a': 1})
+      cache = ExpressionCache(directory=directory)
+      cache.put("1 + 1", 2)
+      # neither cache's snapshots are the other's to remove
+      cache.invalidate()
+      configs.invalidate()
+      self.assertEqual(os.listdir(directory), [])
+      cache.put("1 + 1", 2)
+      configs.invalidate()
+      self.assertEqual(ExpressionCache(directory=directory).get("1 + 1"), 2)
+    finally:
+      shutil.rmtree(directory)
+
+
+class SubstituteAllTest(unittest.TestCase):
+
+  def setUp(self):
+    self.contents = {
+        'a-b': ["`1 + 1`", "c", ("`2`", 3)],
+        'd': {'e': "`{'f-g': 1}`"},
+        '_h': "`1 / 0`",
+      }
+
+  def test_same_as_normalize(self):
+    for parallel in ['thread', 'process']:
+      self.assertEqual(
+          substitute_all(self.contents, parallel=parallel, workers=2),
+          normalize(self.contents, value_func=substitute),
+        )
+
+  def test_concurrent(self):
+    # "a" only finishes before its timeout if "b" runs at the same time
+    module = "import sys; m = sys.modules[{!r}]; ".format(__name__)
+    result = substitute_all({
+        'a': "`" + module + "m.EVENT.wait(5)`",
+        'b': "`" + module + "m.EVENT.set()`",
+      }, workers=2)
+    self.assertEqual(result, {'a': True, 'b': None})
+
+  def test_serial(self):
+    module = "import sys; m = sys.modules[{!r}]; ".format(__name__)
+    contents = ["`!serial " + module + "m.ORDER.append({})`".format(i) for i in range(10)]
+    del ORDER[:]
+    substitute_all(contents + ["`1`"] * 10, workers=4)
+    self.assertEqual(ORDER, list(range(10)))
+
+  def test_errors(self):
+    self.assertRaises(ZeroDivisionError, substitute_all, {'a': "`1 / 0`"}, workers=2)
+
+  def test_unknown_pool(self):
+    self.assertRaises(ConfiguratiException, substitute_all, {}, parallel='unknown')
+
+
+class MappedFileTest(unittest.TestCase):
+
+  def test_read(self):
+    with NTF() as f:
+      f.write(b"abcdef")
+      f.flush()
+      with MappedFile(f.name) as m:
+        self.assertEqual(m.name, f.name)
+        self.assertEqual(m.read(2), b"ab")
+        self.assertEqual(m.read(), b"cdef")
+        self.assertEqual(m.read(), b"")
+
+  def test_empty(self):
+    with NTF() as f:
+      with MappedFile(f.name) as m:
+        self.assertEqual(m.read(), b"")
+
+
+class TreeBuilderTest(unittest.TestCase):
+
+  def test_build(self):
+    b = TreeBuilder(value_func=lambda x: x * 2)
+    b.start_mapping()
+    b.value("a-b")
+    b.start_sequence(finish=tuple)
+    b.value(1)
+    b.value("x")
+    self.assertEqual(b.end(), (2, "xx"))
+    b.value("_c")
+    b.value(3)
+    b.value(4)
+    b.value(5)
+    self.assertFalse(b.done)
+    b.end()
+    self.assertTrue(b.done)
+    self.assertEqual(b.result, {"a_b": (2, "xx")})
+
+  def test_merge(self):
+    b = TreeBuilder()
+    b.start_mapping()
+    b.value("a")
+    b.value(1)
+    b.merge()
+    b.value({"a": 2, "b": 3}, evaluate=False)
+    self.assertEqual(b.end(), {"a": 1, "b": 3})
@@ -1,9 +1,14 @@
 from __future__ import absolute_import
 
+from StringIO import StringIO
+import os
 import unittest
 import yaml
 
+from configurati.exceptions import ConfiguratiException
 from configurati.loaders.yaml import *
+from configurati.loaders.utils import substitute
+from configurati.utils import normalize
 from configurati.loaders.tests import LoadTests
 
 
@@ -13,3 +18,102 @@ class YamlLoadTest(LoadTests, unittest.TestCase):
     self.loadfunc  = load
     self.dumpfunc  = yaml.dump
     self.extension = "yaml"
+
+
+class YamlLoaderTest(unittest.TestCase):
+
+  def test_full(self):
+    self.assertEqual(parse(StringIO("a: !!python/tuple [1, 2]")), {'a': (1, 2)})
+
+  def test_safe(self):
+    self.assertEqual(parse(StringIO("a: [1, 2]"), yaml_loader='safe'), {'a': [1, 2]})
+    self.assertRaises(yaml.YAMLError, parse, StringIO("a: !!python/tuple [1, 2]"), yaml_loader='safe')
+
+  def test_full_refuses_calls(self):
+    doc = "a: !!python/object/apply:os.getcwd []"
+    self.assertRaises(yaml.YAMLError, parse, StringIO(doc))
+    self.assertEqual(parse(StringIO(doc), yaml_loader='unsafe'), {'a': os.getcwd()})
+
+  def test_loader_class(self):
+    self.assertEqual(parse(StringIO("a: 1"), yaml_loader=yaml.SafeLoader), {'a': 1})
+
+  def test_unknown(self):
+    self.assertRaises(ConfiguratiException, parse, StringIO("a: 1"), yaml_loader='fast')
+
+
+class YamlSectionsTest(unittest.TestCase):
+
+  def test_sections(self):
+    text = "\n".join([
+        "# comment",
+        "a:",
+        "  b: [1, 2]",
+        "",
+        "c: 3   # comment",
+        "d: |",
+        "  multi",
+        "  line",
+        "e: !!python/tuple [1, 2]",
+        "1: one",
+      ])
+    split = sections(StringIO(text))
+    self.assertEqual(
+        {k: v() for k, v in split.items()},
+        parse(StringIO(text))
+      )
+
+  def test_unsplittable(self):
+    for text in ["a: &x 1\nb: *x", "a: {<<: {b: 1}}\n<<: {c: 1}", "{a: 1}",
+                 "- 1", "a: 1\n---\nb: 2", "a: 1\rb: 2"]:
+      self.assertIsNone(sections(StringIO(text)), text)
+
+
+class YamlStreamTest(unittest.TestCase):
+
+  def setUp(self):
+    self.text = "\n".join([
+        "base: &base",
+        "  x-y: 1",
+        "  z: [1, 2]",
+        "a:",
+        "  <<: *base",
+        "  z: '`3`'",
+        "b: *base",
+        "c: !!python/tuple [1, 2]",
+        "_d: 1",
+        "---",
+        "e: 2",
+      ])
+
+  def test_documents(self):
+    documents = list(stream(StringIO(self.text), value_func=substitute))
+    self.assertEqual(documents, [
+        {
+          'base': {'x_y': 1, 'z': [1, 2]},
+          'a': {'x_y': 1, 'z': 3},
+          'b': {'x_y': 1, 'z': [1, 2]},
+          'c': (1, 2),
+        },
+        {'e': 2},
+      ])
+
+  def test_same_as_parse(self):
+    text = self.text.split("---")[0]
+    self.assertEqual(
+        next(stream(StringIO(text), value_func=substitute)),
+        normalize(parse(StringIO(text)), value_func=substitute)
+      )
+
+  def test_lazy(self):
+    documents = stream(StringIO("a: 1\n---\nb: [\n"))
+    self.assertEqual(next(documents), {'a': 1})
+    self.assertRaises(yaml.YAMLError, next, documents)
+
+  def test_aliases_are_copies(self):
+    documents = stream(StringIO(self.text))
+    document = next(documents)
+    self.assertIsNot(document['b'], document['base'])
+
+  def test_safe(self):
+    documents = stream(StringIO("a: !!python/tuple [1, 2]"), yaml_loader='safe')
+    self.assertRaises(ConfiguratiException, next, documents)
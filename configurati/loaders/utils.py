@@ -1,25 +1,476 @@
-import code
+import ast
+from copy import deepcopy
+import mmap
+from multiprocessing.pool import Pool, ThreadPool
+import os
 import re
 
+from ..exceptions import ConfiguratiException
+from ..utils import (copy_tree, identity, normalize, normalize_key, LRUCache, NotFound,
+                     snapshot_path, snapshot_paths, read_snapshot, write_snapshot)
+
+
+# a string that's entirely a single `...` expression
+_BACKTICKS = re.compile("""^`([^`]+)`$""")
+
+# a marker at the start of an expression, as in `!serial open("secret").read()`
+_MARKER = re.compile("""^\s*!([a-z_]+)\s+""")
+
+# marker -> what it means. See `split_markers`.
+MARKERS = {
+  'pure':   "the expression's result depends only on its source text, so it's "
+            "evaluated once and reused. See `ExpressionCache`.",
+  'serial': "evaluate in document order with other serial expressions, "
+            "rather than in parallel. See `substitute_all`.",
+}
+
+# pools `substitute_all` can evaluate expressions with
+POOLS = {
+  'thread':  ThreadPool,
+  'process': Pool,
+}
+
+# compiled expressions, indexed by source text. See `compile_expression`.
+_CODE_CACHE = LRUCache(maxsize=4096)
+
+# variables every expression starts with. Each evaluation gets its own copy,
+# so expressions can't see each other's variables.
+_NAMESPACE = {'__name__': '__console__', '__builtins__': __builtins__}
+
+
+class ExpressionCache(object):
+  """Results of expressions marked "!pure", indexed by source text
+
+  A pure expression is evaluated once and its result reused wherever the same
+  source appears, in any file, for the rest of the process. Callers get their
+  own copy of a cached result's dicts, lists and tuples.
+
+  Parameters
+  ----------
+  maxsize : int
+      maximum number of results to keep in memory
+  directory : str or None
+      if given, also save each result in this directory so later processes can
+      skip evaluating it. Results that can't be pickled, such as functions or
+      modules, are only kept in memory.
+  """
+
+  # names this cache's snapshots, apart from any others in the same directory
+  SNAPSHOT_PREFIX = "expression-"
+
+  def __init__(self, maxsize=1024, directory=None):
+    self.directory = directory
+    self._cache    = LRUCache(maxsize=maxsize)
+
+  def get(self, source):
+    """A copy of an expression's cached result, or NotFound"""
+    result = self._cache.get(source, NotFound)
+    if result is NotFound and self.directory is not None:
+      result = read_snapshot(self._snapshot(source))
+      if result is not NotFound:
+        self._cache.put(source, result)
+    if result is NotFound:
+      return NotFound
+    return copy_tree(result)
+
+  def put(self, source, result):
+    """Cache an expression's result"""
+    result = copy_tree(result)
+    self._cache.put(source, result)
+    if self.directory is not None:
+      write_snapshot(self._snapshot(source), result)
+
+  def evaluate(self, source):
+    """Evaluate an expression, reusing its cached result if there is one"""
+    result = self.get(source)
+    if result is NotFound:
+      result = evaluate(source)
+      self.put(source, result)
+    return result
+
+  def invalidate(self, source=None):
+    """Forget a single expression's result, or every result if `source` is None"""
+    if source is None:
+      self._cache.clear()
+      snapshots = snapshot_paths(self.directory, self.SNAPSHOT_PREFIX)
+    else:
+      self._cache.invalidate(source)
+      snapshots = [self._snapshot(source)] if self.directory is not None else []
+    for snapshot in snapshots:
+      if os.path.exists(snapshot):
+        os.remove(snapshot)
+
+  def info(self):
+    return self._cache.info()
+
+  def _snapshot(self, source):
+    return snapshot_path(self.directory, source, self.SNAPSHOT_PREFIX)
+
+
+# process-wide cache of "!pure" expressions' results
+expression_cache = ExpressionCache()
+
 
 def substitute(s):
   """Contents of `...` evaluated in Python"""
-  if isinstance(s, basestring) and s.count("`") == 2:
-    match = re.search("""^`([^`]+)`$""", s)
-    contents, rest = match.group(1), s[match.end():]
-    return evaluate(contents)
+  source = expression(s)
+  if source is not None:
+    return evaluate(source)
   else:
     return s
 
 
+def expression(s):
+  """The contents of `...` if `s` is an expression, or None otherwise"""
+  if isinstance(s, basestring) and s.count("`") == 2:
+    match = _BACKTICKS.search(s)
+    if match is not None:
+      return match.group(1)
+  return None
+
+
+def split_markers(line):
+  """Separate an expression from the markers at its start
+
+  Markers change how an expression is evaluated. Each is an entry in `MARKERS`
+  preceded by "!" and followed by whitespace.
+
+  >>> split_markers("!serial open('secret').read()")
+  (frozenset(['serial']), "open('secret').read()")
+
+  Returns
+  -------
+  markers : frozenset
+      the expression's markers
+  line : str
+      the expression, without its markers
+  """
+  markers = []
+  match = _MARKER.search(line)
+  while match is not None:
+    if match.group(1) not in MARKERS:
+      raise ConfiguratiException(
+          'Unknown marker "!{}"; choose one of {}'.format(match.group(1), sorted(MARKERS))
+        )
+    markers.append(match.group(1))
+    line  = line[match.end():]
+    match = _MARKER.search(line)
+  return frozenset(markers), line
+
+
+def substitute_all(contents, factory=dict, parallel='thread', workers=None):
+  """Normalize parsed contents, evaluating its `...` expressions concurrently
+
+  Equivalent to `normalize(contents, substitute, factory)`, except that all
+  expressions are gathered first and then evaluated on a pool of `workers`
+  threads or processes. Expressions marked "!serial" are instead evaluated one
+  after another, in document order, while the rest run in the pool. Results of
+  expressions marked "!pure" are taken from, and added to, `expression_cache`.
+
+  With `parallel="process"`, expressions and their results must be picklable.
+
+  Parameters
+  ----------
+  contents : object
+      parsed contents of a file
+  factory : type
+      dict type to build mappings with
+  parallel : str
+      "thread" or "process"; see `POOLS`
+  workers : int or None
+      pool size. Defaults to the number of CPUs.
+  """
+  if parallel not in POOLS:
+    raise ConfiguratiException(
+        'Unknown pool "{}"; choose one of {}'.format(parallel, sorted(POOLS))
+      )
+
+  # replace each expression with a placeholder, gathering it along the way
+  sources = []
+  def defer(v):
+    source = expression(v)
+    if source is None:
+      return v
+    sources.append(source)
+    return _Pending(len(sources) - 1)
+  contents = normalize(contents, value_func=defer, factory=factory)
+
+  results = [None] * len(sources)
+  serial, independent = [], []
+  pure, repeated = {}, []     # source -> index to evaluate it at; (index, source)
+  for i, source in enumerate(sources):
+    markers, source = split_markers(source)
+    if 'pure' in markers:
+      if source in pure:
+        repeated.append((i, source))
+        continue
+      results[i] = expression_cache.get(source)
+      if results[i] is not NotFound:
+        continue
+      pure[source] = i
+    sources[i] = source
+    (serial if 'serial' in markers else independent).append(i)
+
+  if len(independent) > 0:
+    pool = POOLS[parallel](workers)
+    try:
+      if parallel == 'thread':
+        # compiling holds the GIL, so it gains nothing from the pool. compiling
+        # here also raises syntax errors before any expression has run.
+        jobs = pool.map_async(_execute, [compile_expression(sources[i]) for i in independent])
+      else:
+        jobs = pool.map_async(evaluate, [sources[i] for i in independent])
+      for i in serial:
+        results[i] = evaluate(sources[i])
+      for i, result in zip(independent, jobs.get()):
+        results[i] = result
+    finally:
+      pool.terminate()
+      pool.join()
+  else:
+    for i in serial:
+      results[i] = evaluate(sources[i])
+
+  for source, i in pure.items():
+    expression_cache.put(source, results[i])
+  for i, source in repeated:
+    results[i] = results[pure[source]]
+
+  # fill in each placeholder
+  def fill(v):
+    return results[v.index] if isinstance(v, _Pending) else v
+  return normalize(contents, value_func=fill, factory=factory)
+
+
+class _Pending(object):
+  """Placeholder for the result of the `index`-th expression"""
+  __slots__ = ['index']
+
+  def __init__(self, index):
+    self.index = index
+
+
 def evaluate(line):
-  """Evaluate a line and return its final output"""
-  # XXX this isn't smart enough to know about semicolons/newlines in strings,
-  # or code where the final result relies on indentation
-  line = re.split(";|\n", line)
-  line[-1] = "OUTPUT = " + line[-1]
-  line = ";".join(line)
-
-  interpreter = code.InteractiveConsole()
-  interpreter.push(line)
-  return interpreter.locals["OUTPUT"]
+  """Evaluate a line and return its final output
+
+  Statements may be separated by semicolons or newlines. The result is the
+  value of the last statement if it's an expression or an assignment, and
+  None otherwise.
+
+  Expressions marked "!pure" are evaluated through `expression_cache`.
+  """
+  markers, source = split_markers(line)
+  if 'pure' in markers:
+    return expression_cache.evaluate(source)
+  return _execute(compile_expression(source))
+
+
+def _execute(compiled):
+  """Run the output of `compile_expression`"""
+  statements, result = compiled
+  namespace = dict(_NAMESPACE)
+  if statements is not None:
+    exec statements in namespace
+  if result is not None:
+    return eval(result, namespace)
+
+
+def compile_expression(line):
+  """Compile a line, split so that its final output can be recovered
+
+  Parameters
+  ----------
+  line : str
+      Python source code, optionally preceded by markers (see `split_markers`)
+
+  Returns
+  -------
+  statements : code or None
+      code to execute before `result`, if there's any
+  result : code or None
+      code evaluating to the line's final output, or None if the last
+      statement has none
+  """
+  compiled = _CODE_CACHE.get(line)
+  if compiled is None:
+    compiled = _compile(line)
+    _CODE_CACHE.put(line, compiled)
+  return compiled
+
+
+def code_cache_info():
+  """Hit/miss statistics for the compiled expression cache"""
+  return _CODE_CACHE.info()
+
+
+def _compile(line):
+  _, line = split_markers(line)
+  body = ast.parse(line, mode='exec').body
+  if len(body) == 0:
+    return None, None
+
+  last = body[-1]
+  if isinstance(last, ast.Expr):
+    body   = body[:-1]
+    result = last.value
+  elif isinstance(last, ast.Assign):
+    # an assignment's output is the value of its (first) target
+    result = _load(last.targets[0])
+  else:
+    result = None
+
+  statements = None
+  if len(body) > 0:
+    statements = compile(ast.Module(body=body), '<config>', 'exec')
+  if result is not None:
+    result = compile(ast.Expression(body=result), '<config>', 'eval')
+  return statements, result
+
+
+def _load(target):
+  """Copy an assignment target into an expression reading its value"""
+  target = deepcopy(target)
+  for node in ast.walk(target):
+    if hasattr(node, 'ctx'):
+      node.ctx = ast.Load()
+  return target
+
+
+class MappedFile(object):
+  """A read-only, memory-mapped file for parsers to read bytes from
+
+  Unlike `codecs.open`, contents aren't decoded into a unicode string first;
+  parsers receive the raw bytes and detect the encoding themselves.
+
+  >>> with MappedFile("config.yaml") as f:
+  ...   contents = yaml.load(f)
+  """
+
+  def __init__(self, path):
+    self.name = path
+    with open(path, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        # empty files can't be mapped
+        self._map = None
+      else:
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def read(self, size=-1):
+    if self._map is None:
+      return b''
+    if size < 0:
+      size = len(self._map) - self._map.tell()
+    return self._map.read(size)
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+class TreeBuilder(object):
+  """Builds a config from a stream of parser events in a single pass
+
+  Feed it `start_mapping`, `start_sequence`, `value` and `end` calls in
+  document order. Keys are normalized and invalid ones dropped as they arrive
+  and `value_func` is applied to each leaf value as soon as it's seen, so the
+  result is the same as `normalize`'s without an intermediate tree.
+
+  Parameters
+  ----------
+  value_func : function
+      applied to each leaf value, but not to keys
+  factory : type
+      dict type to build mappings with
+  """
+
+  def __init__(self, value_func=identity, factory=dict):
+    self.value_func = value_func
+    self.factory    = factory
+    self.result     = None
+    self.done       = False
+
+    # open containers, innermost last. each is [container, function to
+    # finish it with, state of the next key, mappings to merge in]
+    self._stack = []
+
+  @property
+  def expecting_key(self):
+    """True if the next value will be used as a key"""
+    return (
+        len(self._stack) > 0 and
+        isinstance(self._stack[-1][0], dict) and
+        self._stack[-1][2] is _EXPECT_KEY
+      )
+
+  def start_mapping(self):
+    self._stack.append([self.factory(), identity, _EXPECT_KEY, []])
+
+  def start_sequence(self, finish=list):
+    """Start a sequence; `finish` is applied to its contents once complete"""
+    self._stack.append([[], finish, None, []])
+
+  def merge(self):
+    """Merge the next value (a mapping or list of mappings) into the current
+    mapping, without overriding any of its own keys"""
+    if not self.expecting_key:
+      raise ConfiguratiException("Merges can only be used in place of a key")
+    self._stack[-1][2] = _MERGE
+
+  def end(self):
+    """Finish the innermost container and return it"""
+    container, finish, _, merges = self._stack.pop()
+    for source in merges:
+      for mapping in (source if isinstance(source, list) else [source]):
+        if not isinstance(mapping, dict):
+          raise ConfiguratiException('Only mappings can be merged; found "{}"'.format(mapping))
+        for k, v in mapping.items():
+          if not dict.__contains__(container, k):
+            dict.__setitem__(container, k, copy_tree(v, factory=self.factory))
+    container = finish(container)
+    self._add(container)
+    return container
+
+  def value(self, v, evaluate=True):
+    """Add a scalar value or key, returning it as it was added
+
+    If `evaluate`, apply `value_func` to it first, unless it's a key.
+    """
+    if evaluate and not self.expecting_key:
+      v = self.value_func(v)
+      if isinstance(v, (dict, list, tuple)):
+        v = normalize(v, factory=self.factory)
+    self._add(v)
+    return v
+
+  def _add(self, v):
+    if len(self._stack) == 0:
+      self.result = v
+      self.done   = True
+      return
+
+    frame = self._stack[-1]
+    container, state = frame[0], frame[2]
+    if not isinstance(container, dict):
+      container.append(v)
+    elif state is _EXPECT_KEY:
+      key = normalize_key(v)
+      frame[2] = _SKIP if key is None else key
+    elif state is _MERGE:
+      frame[3].append(v)
+      frame[2] = _EXPECT_KEY
+    else:
+      if state is not _SKIP:
+        dict.__setitem__(container, state, v)
+      frame[2] = _EXPECT_KEY
+
+
+# TreeBuilder mapping states
+_EXPECT_KEY = object()
+_MERGE      = object()
+_SKIP       = object()
@@ -7,10 +7,257 @@ except ImportError:
   sys.stderr.write("Unable to import `yaml`. Install with `pip install PyYAML`\n")
   sys.exit(1)
 
-from .utils import substitute
-from ..utils import recursive_apply
+from .utils import substitute, TreeBuilder
+from ..exceptions import ConfiguratiException
+from ..utils import copy_tree, identity, recursive_apply
 
 
-def load(f):
-  contents = yaml.load(f)
+def _prefer_libyaml(name):
+  """Use the libyaml-backed version of a loader if PyYAML was built with it"""
+  return getattr(yaml, 'C' + name, getattr(yaml, name))
+
+
+# loaders that can be selected by name. "full" is what `yaml.load` uses by
+# default and refuses to call arbitrary Python; "safe" only constructs plain
+# YAML types; "unsafe" can construct arbitrary Python objects. PyYAML before
+# 5.1 has no FullLoader, and its default loader is the unsafe one.
+LOADERS = {
+  'full': _prefer_libyaml('FullLoader' if hasattr(yaml, 'FullLoader') else 'Loader'),
+  'safe': _prefer_libyaml('SafeLoader'),
+  'unsafe': _prefer_libyaml('Loader'),
+}
+
+
+# tags of collections that can be built from events
+_MAPPING_TAGS  = [None, u'!', yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG]
+_SEQUENCE_TAGS = [None, u'!', yaml.resolver.BaseResolver.DEFAULT_SEQUENCE_TAG]
+_TUPLE_TAG     = u'tag:yaml.org,2002:python/tuple'
+_MERGE_TAG     = u'tag:yaml.org,2002:merge'
+
+
+def loader(yaml_loader=None):
+  """Find a YAML loader class by name, defaulting to "full"
+
+  Parameters
+  ----------
+  yaml_loader : str, yaml.Loader subclass, or None
+      name of an entry in `LOADERS` or a loader class
+  """
+  if yaml_loader is None:
+    yaml_loader = 'full'
+  if isinstance(yaml_loader, basestring):
+    if yaml_loader not in LOADERS:
+      raise ConfiguratiException(
+          'Unknown YAML loader "{}"; choose one of {}'.format(yaml_loader, sorted(LOADERS))
+        )
+    yaml_loader = LOADERS[yaml_loader]
+  return yaml_loader
+
+
+def parse(f, yaml_loader=None, **options):
+  """Parse a file's contents without evaluating `...` expressions
+
+  Parameters
+  ----------
+  f : file
+      file to parse
+  yaml_loader : str, yaml.Loader subclass, or None
+      see `loader`
+  """
+  return yaml.load(f, Loader=loader(yaml_loader))
+
+
+def sections(f, yaml_loader=None, **options):
+  """Index a YAML file's top-level keys so each can be parsed on its own
+
+  The file is scanned once for the lines on which each top-level key starts,
+  without constructing any values. Only single-document files whose top
+  level is a block mapping, and which don't use aliases or merge keys, can be
+  split this way.
+
+  Parameters
+  ----------
+  f : file
+      file to index
+  yaml_loader : str, yaml.Loader subclass, or None
+      see `loader`
+
+  Returns
+  -------
+  sections : dict or None
+      key -> function parsing that key's value, or None if the file can't be
+      split into sections
+  """
+  Loader = loader(yaml_loader)
+  data = f.read()
+
+  # line breaks other than "\n" and "\r\n" would throw off line numbers
+  if data.count(b'\r') != data.count(b'\r\n') or \
+      any(brk in data for brk in [b'\xc2\x85', b'\xe2\x80\xa8', b'\xe2\x80\xa9']):
+    return None
+
+  keys = _index_keys(Loader(data))
+  if keys is None:
+    return None
+
+  # offset of the start of each line
+  line_starts = [0]
+  offset = data.find(b'\n')
+  while offset != -1:
+    line_starts.append(offset + 1)
+    offset = data.find(b'\n', offset + 1)
+
+  result = {}
+  for i, (key, line) in enumerate(keys):
+    start = line_starts[line]
+    end   = line_starts[keys[i + 1][1]] if i + 1 < len(keys) else len(data)
+    result[key] = _section_parser(data, start, end, Loader)
+  return result
+
+
+def _index_keys(parser):
+  """Find each top-level key and the line it starts on"""
+  try:
+    parser.get_event()    # StreamStartEvent
+    event = parser.get_event()
+    if not isinstance(event, yaml.DocumentStartEvent) or event.tags:
+      return None
+    event = parser.get_event()
+    if not isinstance(event, yaml.MappingStartEvent) or \
+        event.flow_style or event.tag not in _MAPPING_TAGS:
+      return None
+
+    keys  = []
+    depth = 0
+    while True:
+      event = parser.get_event()
+      if isinstance(event, yaml.AliasEvent):
+        return None
+      elif depth == 0 and isinstance(event, yaml.MappingEndEvent):
+        break
+      elif depth == 0 and len(keys) % 2 == 0:
+        # a top-level key
+        if not isinstance(event, yaml.ScalarEvent):
+          return None
+        tag = event.tag
+        if tag is None or tag == u'!':
+          tag = parser.resolve(yaml.ScalarNode, event.value, event.implicit)
+        if tag == _MERGE_TAG:
+          return None
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        keys.append((parser.construct_object(node), event.start_mark.line))
+        continue
+      elif isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+        depth += 1
+      elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+        depth -= 1
+
+      if depth == 0:
+        # a top-level value is complete
+        keys.append(None)
+
+    parser.get_event()    # DocumentEndEvent
+    if not parser.check_event(yaml.StreamEndEvent):
+      return None
+    return keys[0::2]
+  finally:
+    parser.dispose()
+
+
+def _section_parser(data, start, end, Loader):
+  def parse_section():
+    contents = yaml.load(data[start:end], Loader=Loader)
+    return list(contents.values())[0]
+  return parse_section
+
+
+def stream(f, value_func=identity, factory=dict, yaml_loader=None, **options):
+  """Lazily build each document in a YAML stream
+
+  Documents are built straight from parser events, without first composing
+  a tree of YAML nodes or a tree of plain dicts. Keys are normalized and
+  `value_func` is applied to each scalar as it's parsed; see `TreeBuilder`.
+
+  Collections tagged with anything but `!!python/tuple` aren't supported.
+
+  Parameters
+  ----------
+  f : file
+      file to parse
+  value_func : function
+      applied to each scalar value
+  factory : type
+      dict type to build mappings with
+  yaml_loader : str, yaml.Loader subclass, or None
+      see `loader`
+  """
+  parser = loader(yaml_loader)(f)
+  try:
+    parser.get_event()    # StreamStartEvent
+    while not parser.check_event(yaml.StreamEndEvent):
+      yield _build_document(parser, TreeBuilder(value_func, factory))
+  finally:
+    parser.dispose()
+
+
+def _build_document(parser, builder):
+  anchors = {}
+  collection_anchors = []
+
+  parser.get_event()      # DocumentStartEvent
+  while not builder.done:
+    event = parser.get_event()
+
+    if isinstance(event, yaml.AliasEvent):
+      if event.anchor not in anchors:
+        raise yaml.composer.ComposerError(None, None,
+            "found undefined or recursive alias %r" % event.anchor, event.start_mark)
+      builder.value(copy_tree(anchors[event.anchor], factory=builder.factory), evaluate=False)
+      continue
+
+    elif isinstance(event, yaml.ScalarEvent):
+      tag = event.tag
+      if tag is None or tag == u'!':
+        tag = parser.resolve(yaml.ScalarNode, event.value, event.implicit)
+      if tag == _MERGE_TAG and builder.expecting_key:
+        builder.merge()
+        continue
+      node  = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+      value = builder.value(parser.construct_object(node))
+      parser.constructed_objects.pop(node, None)
+      anchor = event.anchor
+
+    elif isinstance(event, yaml.MappingStartEvent):
+      if event.tag not in _MAPPING_TAGS:
+        raise ConfiguratiException(
+            'Mappings tagged "{}" can\'t be streamed'.format(event.tag))
+      builder.start_mapping()
+      collection_anchors.append(event.anchor)
+      continue
+
+    elif isinstance(event, yaml.SequenceStartEvent):
+      if event.tag in _SEQUENCE_TAGS:
+        builder.start_sequence()
+      elif event.tag == _TUPLE_TAG and _TUPLE_TAG in parser.yaml_constructors:
+        builder.start_sequence(finish=tuple)
+      else:
+        raise ConfiguratiException(
+            'Sequences tagged "{}" can\'t be streamed'.format(event.tag))
+      collection_anchors.append(event.anchor)
+      continue
+
+    else:
+      # MappingEndEvent or SequenceEndEvent
+      value  = builder.end()
+      anchor = collection_anchors.pop()
+
+    if anchor is not None:
+      anchors[anchor] = value
+
+  parser.get_event()      # DocumentEndEvent
+  return builder.result
+
+
+def load(f, yaml_loader=None):
+  contents = parse(f, yaml_loader=yaml_loader)
   return recursive_apply(contents, value_func=substitute)
@@ -0,0 +1,280 @@
+"""
+Layered configurations
+"""
+from collections import Mapping
+
+from .attrs import attrs, compile_key, set, unroll
+from .utils import merge, Missing, NotFound
+
+
+class ConfigStack(Mapping):
+  """An ordered stack of configs, each overriding the ones beneath it
+
+  Reading a key is equivalent to reading it from the result of
+  `update(top, update(..., update(second, bottom)))`, but only the layers'
+  values at that key are looked up and merged (with `merge`), and the result
+  is cached until a layer that could change it is modified. A layer's value
+  replaces, rather than merges with, values of a different type beneath it.
+
+  Like `attrs`, keys can be read as attributes or with fancy keys, and dicts
+  are returned as attrs. Layers should only be modified through the stack, or
+  the cache won't know to forget their old values; resolved values share
+  structure with the layers and shouldn't be modified either.
+
+  >>> stack = ConfigStack([{'server': {'host': 'localhost', 'port': 80}}])
+  >>> stack.push({'server': {'port': 8080}}, name='cli')
+  >>> stack.server
+  {'host': 'localhost', 'port': 8080}
+  >>> stack.set('server.port', 8081, layer='cli')
+  >>> stack['server.port']
+  8081
+
+  Parameters
+  ----------
+  layers : [dict]
+      initial layers, from bottom to top
+  """
+
+  def __init__(self, layers=()):
+    object.__setattr__(self, '_layers', [])
+    object.__setattr__(self, '_names',  [])
+    object.__setattr__(self, '_cache',  {})
+    for layer in layers:
+      self.push(layer)
+
+  # layers
+
+  @property
+  def layers(self):
+    """Each layer, from bottom to top"""
+    return list(self._layers)
+
+  def layer(self, index):
+    """A layer, by position (from the bottom) or name"""
+    return self._layers[self._index(index)]
+
+  def push(self, layer, name=None):
+    """Add a layer on top of the others"""
+    self.insert(len(self._layers), layer, name)
+
+  def insert(self, index, layer, name=None):
+    """Add a layer at a position, counted from the bottom"""
+    layer = _as_attrs(layer)
+    self._layers.insert(index, layer)
+    self._names.insert(index, name)
+    self._forget_keys(layer)
+
+  def replace(self, index, layer):
+    """Replace a layer, by position or name, with another"""
+    index = self._index(index)
+    self._forget_keys(self._layers[index])
+    self._layers[index] = _as_attrs(layer)
+    self._forget_keys(self._layers[index])
+
+  def remove(self, index=-1):
+    """Remove a layer, by position or name, and return it"""
+    index = self._index(index)
+    layer = self._layers.pop(index)
+    self._names.pop(index)
+    self._forget_keys(layer)
+    return layer
+
+  def set(self, key, value, layer=-1):
+    """Set a key to a value in one layer (by default, the top one)"""
+    index = self._index(layer)
+    path  = compile_key(_fancy(key))
+    path  = self._normalize(path) or path
+    self._layers[index] = set(self._layers[index], path, _as_attrs(value), build=True)
+    self._forget(path)
+
+  def _index(self, index):
+    if isinstance(index, basestring):
+      if index not in self._names:
+        raise KeyError('No layer named "{}"'.format(index))
+      return len(self._names) - 1 - self._names[::-1].index(index)
+    if not -len(self._layers) <= index < len(self._layers):
+      raise IndexError("Layer index out of range: {}".format(index))
+    return index % len(self._layers)
+
+  # resolution
+
+  def resolve(self, key=''):
+    """The value of a key, merged across layers, or NotFound
+
+    Parameters
+    ----------
+    key : str or tuple
+        a fancy key, like "a.b[0]", or the result of `compile_key`. The empty
+        string resolves every layer at once.
+    """
+    path  = self._normalize(compile_key(_fancy(key)))
+    if path is None:
+      return NotFound
+    value = self._cache.get(path, NotFound)
+    if value is NotFound:
+      value = self._resolve(path)
+      self._cache[path] = value
+    return value
+
+  def _normalize(self, path):
+    """`path` with negative list indices counted from the end of the merged
+    list, or None if one is out of range
+
+    Layers' lists are merged element by element, so an index from the end
+    refers to the merged list's end, not each layer's.
+    """
+    if not any(isinstance(k, int) and k < 0 for k in path):
+      return path
+    path = list(path)
+    for i, k in enumerate(path):
+      if isinstance(k, int) and k < 0:
+        parent = self.resolve(tuple(path[:i]))
+        if not isinstance(parent, (list, tuple)) or k < -len(parent):
+          return None
+        path[i] = k + len(parent)
+    return tuple(path)
+
+  def _resolve(self, path):
+    # each layer's value at `path`, from the top down, until one replaces
+    # everything beneath it
+    found = []
+    for layer in reversed(self._layers):
+      value = _find(layer, path)
+      if value is _BLOCKED:
+        break
+      if value is NotFound or value is Missing:
+        continue
+      if len(found) > 0 and _kind(value) != _kind(found[-1]):
+        break
+      found.append(value)
+      if _kind(value) is None:
+        break
+
+    if len(found) == 0:
+      return NotFound
+    value = found[-1]
+    for override in reversed(found[:-1]):
+      value = merge(override, value, factory=attrs)
+    return value
+
+  def _forget(self, path):
+    """Forget cached values that `path`'s value could have changed"""
+    n = len(path)
+    stale = [
+        p for p in self._cache
+        if p[:n] == path or path[:len(p)] == p
+      ]
+    for p in stale:
+      del self._cache[p]
+
+  def _forget_keys(self, layer):
+    for k in layer:
+      self._forget((k,))
+
+  def cache_size(self):
+    """How many resolved keys are cached"""
+    return len(self._cache)
+
+  # mapping
+
+  def __getattr__(self, key):
+    if not key.startswith('_') and key in self:
+      return self[key]
+    else:
+      raise AttributeError("No attribute: " + str(key))
+
+  def __setattr__(self, key, value):
+    self.set(key, value)
+
+  def __getitem__(self, key):
+    value = self.resolve(key)
+    if value is NotFound:
+      raise KeyError(key)
+    return value
+
+  def __setitem__(self, key, value):
+    self.set(key, value)
+
+  def __iter__(self):
+    keys = {}
+    for layer in self._layers:
+      for k in layer:
+        # read without loading lazily-loaded values
+        if dict.get(layer, k) is not Missing:
+          keys[k] = None
+    return iter(keys)
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+  def __contains__(self, key):
+    if not isinstance(key, basestring):
+      return False
+    try:
+      return self.resolve(key) is not NotFound
+    except KeyError:
+      return False
+
+  def get(self, key, default=None):
+    value = self.resolve(key)
+    return default if value is NotFound else value
+
+  def __repr__(self):
+    return "ConfigStack({!r})".format(self._layers)
+
+  def to_dict(self):
+    return attrs.from_dict(self.resolve()).to_dict()
+
+  def unroll(self):
+    unrolled = unroll(self.resolve())
+    return { k[1:]:v for k, v in unrolled.items() }
+
+
+# stands in for a layer whose value at a key replaces every layer beneath it
+_BLOCKED = object()
+
+
+def _fancy(key):
+  """Turn "a.b" into ".a.b", leaving tuples and "[0].a" alone"""
+  if isinstance(key, basestring) and not key.startswith('[') and len(key) > 0:
+    return '.' + key
+  return key
+
+
+def _as_attrs(value):
+  if isinstance(value, dict) and not isinstance(value, attrs):
+    return attrs.from_dict(value)
+  return value
+
+
+def _kind(value):
+  """Values of the same kind are merged; others replace each other"""
+  if isinstance(value, dict):
+    return dict
+  elif isinstance(value, (list, tuple)):
+    return list
+  else:
+    return None
+
+
+def _find(layer, path):
+  """A layer's value at `path`, NotFound, or _BLOCKED"""
+  obj = layer
+  for k in path:
+    if obj is Missing:
+      return NotFound
+    elif isinstance(obj, dict):
+      obj = obj.get(k, NotFound)
+      if obj is NotFound:
+        return NotFound
+    elif isinstance(obj, (list, tuple)):
+      if not isinstance(k, int):
+        return _BLOCKED
+      # negative indices have already been normalized
+      if not 0 <= k < len(obj):
+        return NotFound
+      obj = obj[k]
+    else:
+      # a scalar replaces whatever lower layers have beneath it
+      return _BLOCKED
+  return obj
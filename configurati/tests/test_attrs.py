@@ -1,6 +1,10 @@
+import threading
 import unittest
 
 from configurati.attrs import *
+from configurati.utils import merge, update, Missing
+from configurati.exceptions import ValidationError
+from configurati.validation import required, validate
 
 
 class AttrsTests(unittest.TestCase):
@@ -101,6 +105,210 @@ class AttrsTests(unittest.TestCase):
     self.assertNotIn('b.c.2', self.a)   # .2 isn't a valid identifier
     self.assertNotIn('b.c[3]', self.a)  # list too short
     self.assertNotIn('b.e', self.a)     # missing dict key
+    self.assertNotIn('b.c[-4]', self.a) # negative index out of range
+    self.assertNotIn('b.d.e', self.a)   # past a leaf
+    self.assertNotIn(123, self.a)       # not a string
+
+  def test_get_default(self):
+    self.assertEqual(self.a.get('b.c[2]'), 3)
+    self.assertEqual(self.a.get('b.c[3]', 'default'), 'default')
+    self.assertEqual(self.a.get('b.x', 'default'), 'default')
+    self.assertEqual(self.a.get('x', 'default'), 'default')
+
+
+  def test_setitem_attrs(self):
+    # attrs are already converted, so they're stored without copying
+    b = attrs({'c': {'d': 1}})
+    self.a['x'] = b
+    self.assertIs(self.a['x'], b)
+    self.assertIsInstance(self.a['x']['c'], attrs)
+
+
+class ThreadedAttrsTests(unittest.TestCase):
+
+  def test_concurrent_keys(self):
+    # many distinct keys, so the compiled key cache is constantly evicting
+    cfg = attrs.from_dict({'k{}'.format(i): {'x{}'.format(j): j for j in range(200)} for i in range(30)})
+    errors = []
+    def work(n):
+      try:
+        for i in range(3000):
+          k = 'k{}.x{}'.format((i + n) % 30, (i * 7 + n) % 200)
+          self.assertEqual(cfg[k], (i * 7 + n) % 200)
+          attrs()['n{}.x{}'.format(n, i % 300)] = i
+      except Exception as e:
+        errors.append(e)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(errors, [])
+    self.assertLessEqual(key_cache_info().size, key_cache_info().maxsize)
+
+
+class AttrsSharingTests(unittest.TestCase):
+
+  def test_dicts_copied(self):
+    a, b = attrs(), {'x': 1}
+    a.b = b
+    b['x'] = 2
+    self.assertEqual(a.b.x, 1)
+
+  def test_attrs_shared(self):
+    a, b = attrs(), attrs({'x': 1})
+    a.b = b
+    b.x = 2
+    self.assertIs(a.b, b)
+    self.assertEqual(a.b.x, 2)
+
+
+class LazyAttrsTests(unittest.TestCase):
+
+  def setUp(self):
+    self.calls = []
+    def section(k, v):
+      def load():
+        self.calls.append(k)
+        return v
+      return load
+    self.a = lazyattrs({
+        'a': section('a', 1),
+        'b': section('b', attrs({'c': [1, 2]})),
+      })
+
+  def test_load_on_access(self):
+    self.assertEqual(self.a.lazy_info(), LazyInfo(2, 0))
+    self.assertEqual(self.a.a, 1)
+    self.assertEqual(self.a['a'], 1)
+    self.assertEqual(self.a['b.c[1]'], 2)
+    self.assertEqual(self.calls, ['a', 'b'])
+    self.assertEqual(self.a.lazy_info(), LazyInfo(2, 2))
+
+  def test_keys_without_loading(self):
+    self.assertEqual(sorted(self.a.keys()), ['a', 'b'])
+    self.assertIn('a', self.a)
+    self.assertEqual(len(self.a), 2)
+    self.assertEqual(self.a.lazy_info().materialized, 0)
+
+  def test_lookup(self):
+    self.assertEqual(lookup(self.a, '.b.c[0]'), 1)
+    self.assertEqual(self.calls, ['b'])
+
+  def test_items(self):
+    self.assertEqual(sorted(self.a.items()), [('a', 1), ('b', {'c': [1, 2]})])
+    self.assertEqual(self.a, {'a': 1, 'b': {'c': [1, 2]}})
+    self.assertEqual(sorted(self.calls), ['a', 'b'])
+
+  def test_set(self):
+    self.a.a = 2
+    self.assertEqual(self.a.a, 2)
+    del self.a['b']
+    self.assertEqual(self.a, {'a': 2})
+    self.assertEqual(self.calls, [])
+
+  def test_plain_dict(self):
+    self.assertEqual(dict(self.a), {})
+    self.assertEqual(self.a.b.c, [1, 2])
+    self.assertEqual(dict(self.a), {'b': {'c': [1, 2]}})
+    d = {}
+    d.update(self.a)
+    self.assertEqual(d, {'b': {'c': [1, 2]}})
+
+    self.a.load_all()
+    self.assertEqual(dict(self.a), {'a': 1, 'b': {'c': [1, 2]}})
+    self.assertEqual(dict(**self.a), {'a': 1, 'b': {'c': [1, 2]}})
+    self.assertEqual(self.a.lazy_info(), LazyInfo(2, 2))
+
+  def test_update(self):
+    self.a.update({'a': 3}, d=4)
+    self.assertEqual(self.a, {'a': 3, 'b': {'c': [1, 2]}, 'd': 4})
+    self.assertEqual(self.calls, ['b'])
+
+
+class AttrsViewTests(unittest.TestCase):
+
+  def setUp(self):
+    self.o = {
+        'a': 'abc',
+        'b': {
+          'c': [1, 2, {'e': 3}],
+          'd': 'zyx',
+        }
+      }
+    self.v = attrs.view(self.o)
+
+  def test_get(self):
+    self.assertEqual(self.v.a, 'abc')
+    self.assertEqual(self.v.b.d, 'zyx')
+    self.assertEqual(self.v['b.c[2].e'], 3)
+    self.assertEqual(self.v['b.c[2]'].e, 3)
+    self.assertEqual(self.v.get('b.x', 'default'), 'default')
+    self.assertRaises(KeyError, lambda: self.v['b.x'])
+    self.assertRaises(AttributeError, lambda: self.v.x)
+
+  def test_no_copy(self):
+    self.assertIsInstance(self.v.b, attrsview)
+    self.assertIs(self.v.b._dict, self.o['b'])
+    self.assertIsInstance(self.v.b.c, attrslistview)
+    self.assertIs(self.v.b.c._list, self.o['b']['c'])
+
+  def test_cached_children(self):
+    self.assertIs(self.v.b, self.v.b)
+    self.o['b'] = {'d': 'new'}
+    self.assertEqual(self.v.b.d, 'new')
+
+  def test_set(self):
+    self.v.b.d = 'xyz'
+    self.v['f.g[1]'] = 1
+    self.assertEqual(self.o['b']['d'], 'xyz')
+    self.assertEqual(self.o['f'], {'g': [Missing, 1]})
+    self.assertRaises(KeyError, self.v.__setitem__, '1a', 1)
+
+  def test_contains(self):
+    self.assertIn('b.c[2].e', self.v)
+    self.assertNotIn('b.c[3]', self.v)
+    self.assertNotIn(1, self.v)
+
+  def test_mapping(self):
+    self.assertEqual(len(self.v), 2)
+    self.assertEqual(sorted(self.v.keys()), ['a', 'b'])
+    self.assertEqual(self.v, self.o)
+    self.assertEqual(self.v.to_dict(), self.o)
+    del self.v['a']
+    self.assertNotIn('a', self.o)
+
+  def test_lists(self):
+    self.assertEqual(self.v.b.c[2].e, 3)
+    self.assertIs(self.v.b.c[2], self.v.b.c[2])
+    self.v.b.c[2].e = 4
+    self.v.b.c.append(attrs.view({'f': 5}))
+    self.assertEqual(self.o['b']['c'], [1, 2, {'e': 4}, {'f': 5}])
+    self.assertEqual(self.v.b.c, [1, 2, {'e': 4}, {'f': 5}])
+    del self.v.b.c[0]
+    self.assertEqual(self.v.b.c[1].e, 4)
+
+    self.o['t'] = ({'g': 6}, 7)
+    self.assertEqual(self.v.t[0].g, 6)
+
+  def test_validate(self):
+    spec = {'b': {'d': required(type=str), 'c': [required()]}}
+    self.assertEqual(validate(spec, self.v), {'b': {'d': 'zyx', 'c': [1, 2, {'e': 3}]}})
+    self.assertRaisesRegexp(ValidationError, 'b.x',
+        validate, {'b': {'x': required()}}, self.v)
+
+  def test_update(self):
+    result = update(attrs.view({'b': {'d': 'new', 'c': [Missing, 5]}}), self.o)
+    self.assertIs(result, self.o)
+    self.assertEqual(self.o['b'], {'c': [1, 5, {'e': 3}], 'd': 'new'})
+
+    update({'b': {'h': 1}}, self.v)
+    self.assertEqual(self.o['b']['h'], 1)
+    self.assertEqual(self.v.b.h, 1)
+
+    merged = merge({'b': {'d': 'merged'}}, self.v)
+    self.assertEqual(merged.b.d, 'merged')
+    self.assertEqual(self.o['b']['d'], 'new')
 
 
 class NextKeyTests(unittest.TestCase):
@@ -124,6 +332,30 @@ class NextKeyTests(unittest.TestCase):
     self.assertRaises(KeyError, next_key, ".1.a")
 
 
+class CompileKeyTests(unittest.TestCase):
+
+  def test_compile(self):
+    self.assertEqual(compile_key(".a-b.c[3][-1].d"), ("a_b", "c", 3, -1, "d"))
+
+  def test_empty(self):
+    self.assertEqual(compile_key(""), ())
+
+  def test_compiled(self):
+    self.assertEqual(compile_key(("a", 1)), ("a", 1))
+
+  def test_invalid(self):
+    self.assertRaises(KeyError, compile_key, ".a.1")
+    self.assertRaises(KeyError, compile_key, ".a[1")
+
+  def test_cache(self):
+    before = key_cache_info()
+    compile_key(".cache_test.a[0]")
+    compile_key(".cache_test.a[0]")
+    after = key_cache_info()
+    self.assertEqual(after.misses - before.misses, 1)
+    self.assertEqual(after.hits   - before.hits,   1)
+
+
 class GetTests(unittest.TestCase):
 
   def setUp(self):
@@ -156,6 +388,33 @@ class GetTests(unittest.TestCase):
   def test_short_list(self):
     self.assertRaises(KeyError, get, self.o, ".a.b[5]")
 
+  def test_compiled_key(self):
+    self.assertEqual(get(self.o, ("a", "b", 1)), 2)
+
+
+class LookupTests(unittest.TestCase):
+
+  def setUp(self):
+    self.o = {
+      'a': {
+        'b': [1, Missing, 3],
+      },
+    }
+
+  def test_found(self):
+    self.assertEqual(lookup(self.o, ".a.b[0]"), 1)
+    self.assertIs(lookup(self.o, ".a.b[1]"), Missing)
+
+  def test_not_found(self):
+    self.assertIs(lookup(self.o, ".a.c"), NotFound)
+    self.assertIs(lookup(self.o, ".a.b[3]"), NotFound)
+    self.assertIs(lookup(self.o, ".a.b.c"), NotFound)
+    self.assertIs(lookup(self.o, ".a[0]"), NotFound)
+    self.assertIs(lookup(self.o, ".a.1"), NotFound)
+
+  def test_default(self):
+    self.assertEqual(lookup(self.o, ".a.c", 'default'), 'default')
+
 
 class SetTests(unittest.TestCase):
 
@@ -191,6 +450,27 @@ class SetTests(unittest.TestCase):
     set(self.o, ".a.b[5]", 1)
     assert self.o['a']['b'][5] == 1
 
+  def test_build_tuple(self):
+    set(self.o, ".a.c[5].e", 1, build=True)
+    self.assertEqual(self.o['a']['c'], (9, 8, 7, 6, Missing, {'e': 1}))
+
+
+class DeepTests(unittest.TestCase):
+  """get/set/unroll shouldn't be limited by the interpreter's recursion limit"""
+
+  def setUp(self):
+    import sys
+    self.depth = sys.getrecursionlimit() * 2
+    self.key   = ".a" * self.depth
+
+  def test_set_get(self):
+    o = set(Missing, self.key, 1, build=True)
+    self.assertEqual(get(o, self.key), 1)
+
+  def test_unroll(self):
+    o = set(Missing, self.key + "[1]", 1, build=True)
+    self.assertEqual(unroll(o), {self.key + "[0]": Missing, self.key + "[1]": 1})
+
 
 class ValidKeyTests(unittest.TestCase):
 
@@ -1,9 +1,12 @@
 from contextlib import contextmanager
+import os
 from tempfile import NamedTemporaryFile as NTF
 import unittest
 
+from configurati.attrs import attrs, lazyattrs, LazyInfo
 from configurati.commands import *
-from configurati.validation import required, optional
+from configurati.exceptions import ConfiguratiException
+from configurati.validation import required, required_index, optional, CompiledSpec
 
 
 class CommandsTest(unittest.TestCase):
@@ -46,6 +49,45 @@ class CommandsTest(unittest.TestCase):
       self.assertEqual(config.c.d, 'abc')
       self.assertEqual(config.c.e, [])
 
+  def test_load_config_yaml(self):
+    text = "\n".join([
+        """a-b: 1""",
+        """_c: 2""",
+        """d: "`{'e-f': [1, 2]}`" """,
+      ])
+    with save(text, loadfunc=load_config, suffix=".yaml") as config:
+      self.assertEqual(config, {'a_b': 1, 'd': {'e_f': [1, 2]}})
+      self.assertEqual(config.d.e_f, [1, 2])
+
+  def test_load_config_streaming(self):
+    for suffix, text in [(".yaml", "a-b: [1, {c: '`2`'}]"), (".json", '{"a-b": [1, {"c": "`2`"}]}')]:
+      with NTF(suffix=suffix) as f:
+        f.write(text)
+        f.flush()
+        config = load_config(f.name, streaming=True)
+        self.assertEqual(config, load_config(f.name))
+        self.assertIsInstance(config.a_b[1], attrs)
+
+  def test_iter_configs(self):
+    with NTF(suffix=".yaml") as f:
+      f.write("a: 1\n---\nb: 2\n")
+      f.flush()
+      self.assertEqual(list(iter_configs(f.name)), [{'a': 1}, {'b': 2}])
+      self.assertRaises(ConfiguratiException, load_config, f.name, streaming=True)
+
+  def test_load_config_utf8(self):
+    for suffix, text in [(".yaml", u"a: \u00e9t\u00e9"), (".json", u'{"a": "\u00e9t\u00e9"}')]:
+      with save(text.encode('UTF-8'), loadfunc=load_config, suffix=suffix) as config:
+        self.assertEqual(config.a, u"\u00e9t\u00e9")
+
+  def test_load_config_yaml_loader(self):
+    import yaml
+    with NTF(suffix=".yaml") as f:
+      f.write("""a: !!python/tuple [1, 2]""")
+      f.flush()
+      self.assertEqual(load_config(f.name).a, (1, 2))
+      self.assertRaises(yaml.YAMLError, load_config, f.name, yaml_loader='safe')
+
   def test_import_config(self):
     with NTF(suffix='.py') as f:
       f.write(self.config_text)
@@ -63,6 +105,18 @@ class CommandsTest(unittest.TestCase):
       self.assertEqual(spec.c.d, required(type=str))
       self.assertEqual(spec.c.e, [required(type=str)])
 
+  def test_load_spec_index(self):
+    with save(self.spec_text, load_spec) as spec:
+      index = required_index(spec)
+      self.assertIs(required_index(spec), index)
+      self.assertEqual(sorted(index.keys), [('a', ('a',)), ('c.d', ('c', 'd')), ('c.e[0]', ('c', 'e', 0))])
+
+  def test_load_compiled_spec(self):
+    with save(self.spec_text, lambda p: load_spec(p, compiled=True)) as spec:
+      self.assertIsInstance(spec, CompiledSpec)
+      self.assertEqual(spec.spec.a, required(type=int))
+      self.assertEqual(spec({'a': '1', 'c': {'d': 'x', 'e': ['y']}})['a'], 1)
+
   def test_import_spec(self):
     with NTF(suffix='.py') as f:
       f.write(self.spec_text)
@@ -75,10 +129,182 @@ class CommandsTest(unittest.TestCase):
       self.assertEqual(c.e, [required(type=str)])
 
 
+class ParallelLoadTest(unittest.TestCase):
+
+  def test_parallel(self):
+    text = "a-b: ['`1 + 1`', '`!serial 2`']\nc: {d: '`{\"e-f\": 3}`'}"
+    with NTF(suffix='.yaml') as f:
+      f.write(text)
+      f.flush()
+      for parallel in ['thread', 'process']:
+        config = load_config(f.name, parallel=parallel, workers=2)
+        self.assertEqual(config, load_config(f.name))
+        self.assertEqual(config.c.d.e_f, 3)
+      self.assertEqual(load_config(f.name, lazy=True, parallel='thread'), load_config(f.name))
+
+  def test_streaming(self):
+    with NTF(suffix='.yaml') as f:
+      self.assertRaises(ConfiguratiException, load_config, f.name, streaming=True, parallel='thread')
+
+
+class LazyLoadTest(unittest.TestCase):
+
+  def setUp(self):
+    self.yaml_text = "\n".join([
+        "a: 1",
+        "b-c:",
+        "  d: '`1 + 1`'",
+        "_e: 2",
+        "f: '`3`'",
+      ])
+
+  def test_same_as_eager(self):
+    with NTF(suffix='.yaml') as f:
+      f.write(self.yaml_text)
+      f.flush()
+      self.assertEqual(load_config(f.name, lazy=True), load_config(f.name))
+
+  def test_lazy(self):
+    with save(self.yaml_text, lambda p: load_config(p, lazy=True), suffix='.yaml') as config:
+      self.assertIsInstance(config, lazyattrs)
+      self.assertEqual(sorted(config.keys()), ['a', 'b_c', 'f'])
+      self.assertEqual(config.b_c.d, 2)
+      self.assertEqual(config.lazy_info(), LazyInfo(3, 1))
+      self.assertEqual(config.f, 3)
+
+  def test_json(self):
+    with save('{"a": 1, "b": "`1 + 1`"}', lambda p: load_config(p, lazy=True), suffix='.json') as config:
+      self.assertEqual(config.b, 2)
+      self.assertEqual(config.lazy_info(), LazyInfo(2, 1))
+
+  def test_unsplittable(self):
+    with save("a = 1", lambda p: load_config(p, lazy=True)) as config:
+      self.assertNotIsInstance(config, lazyattrs)
+      self.assertEqual(config, {'a': 1})
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    config_cache.invalidate()
+
+  def test_hit(self):
+    with NTF(suffix='.py') as f:
+      f.write("a = {'b': [1, 2]}")
+      f.flush()
+      c1 = load_config(f.name, cache=True)
+      c2 = load_config(f.name, cache=True)
+      self.assertEqual(c1, c2)
+      self.assertEqual(config_cache.info().hits, 1)
+
+      # callers can't modify each other's configs
+      c1.a.b.append(3)
+      self.assertEqual(load_config(f.name, cache=True).a.b, [1, 2])
+
+  def test_stale(self):
+    with NTF(suffix='.py') as f:
+      f.write("a = 1")
+      f.flush()
+      self.assertEqual(load_config(f.name, cache=True).a, 1)
+
+      f.seek(0)
+      f.write("a = 22")
+      f.flush()
+      self.assertEqual(load_config(f.name, cache=True).a, 22)
+
+  def test_invalidate(self):
+    with NTF(suffix='.py') as f:
+      f.write("a = 1")
+      f.flush()
+      load_config(f.name, cache=True)
+      config_cache.invalidate(f.name)
+      load_config(f.name, cache=True)
+      self.assertEqual(config_cache.info().hits, 0)
+
+  def test_dependency(self):
+    with NTF(suffix='.py') as b:
+      b.write("x = 1")
+      b.flush()
+      with NTF(suffix='.yaml') as a:
+        a.write("""b: "`from configurati import load_config; load_config('{}').to_dict()`" """.format(b.name))
+        a.flush()
+        self.assertEqual(load_config(a.name, cache=True).b.x, 1)
+
+        # changing an imported file invalidates the importing config
+        b.seek(0)
+        b.write("x = 22")
+        b.flush()
+        self.assertEqual(load_config(a.name, cache=True).b.x, 22)
+
+  def test_options(self):
+    import yaml
+    with NTF(suffix='.yaml') as f:
+      f.write("a: !!python/tuple [1, 2]")
+      f.flush()
+      self.assertEqual(load_config(f.name, cache=True).a, (1, 2))
+      # the cached config was loaded with the default loader, not the safe one
+      self.assertRaises(yaml.YAMLError, load_config, f.name, cache=True, yaml_loader='safe')
+
+  def test_uncached_skips_fingerprint(self):
+    def fingerprint(path):
+      raise AssertionError("fingerprinted " + path)
+    config_cache.fingerprint = fingerprint
+    try:
+      with save("a = 1", lambda p: load_config(p, cache=False)) as config:
+        self.assertEqual(config.a, 1)
+    finally:
+      del config_cache.fingerprint
+
+  def test_snapshot(self):
+    import shutil
+    import tempfile
+    config_cache.directory = tempfile.mkdtemp()
+    try:
+      with NTF(suffix='.json') as f:
+        f.write("""{"a": "`import random; random.random()`", "b": [1, 2]}""")
+        f.flush()
+        c1 = load_config(f.name, cache=True)
+        self.assertEqual(len(os.listdir(config_cache.directory)), 1)
+
+        # a new process would only have the snapshot to go on
+        config_cache._cache.clear()
+        c2 = load_config(f.name, cache=True)
+        self.assertEqual(c1, c2)
+        self.assertIsInstance(c2, attrs)
+
+        config_cache.invalidate()
+        self.assertEqual(os.listdir(config_cache.directory), [])
+    finally:
+      shutil.rmtree(config_cache.directory)
+      config_cache.directory = None
+
+  def test_snapshot_unpicklable(self):
+    import shutil
+    import tempfile
+    config_cache.directory = tempfile.mkdtemp()
+    try:
+      with NTF(suffix='.py') as f:
+        f.write("f = lambda x: x")
+        f.flush()
+        load_config(f.name, cache=True)
+        self.assertEqual(os.listdir(config_cache.directory), [])
+        self.assertEqual(load_config(f.name, cache=True).f(1), 1)
+    finally:
+      shutil.rmtree(config_cache.directory)
+      config_cache.directory = None
+
+  def test_disabled(self):
+    with NTF(suffix='.py') as f:
+      f.write("a = 1")
+      f.flush()
+      load_config(f.name)
+      self.assertEqual(config_cache.info().size, 0)
+
+
 @contextmanager
-def save(text, loadfunc=load_config):
+def save(text, loadfunc=load_config, suffix=".py"):
   """Write and load configuration file"""
-  with NTF(suffix=".py") as f:
+  with NTF(suffix=suffix) as f:
     f.write(text)
     f.flush()
     yield loadfunc(f.name)
@@ -85,6 +85,15 @@ sns = [
       }
     self.assertEqual(c, c_)
 
+  def test_overrides_from(self):
+    with NTF() as f:
+      f.write("\n".join(["version[0]=2", '{"node.port": 1}']))
+      f.flush()
+      c = configure(self.a, overrides_from=f.name)
+      self.assertEqual(c['version'], [1])
+      self.assertEqual(c['node'], {'host': '127.0.0.1', 'port': 1})
+      self.assertEqual(configure(self.a + ['--overrides-from', f.name])['version'], [2])
+
   def test_args_config(self):
     with write(self.o) as (f_config, f_spec):
       c = configure(["--config", f_config.name] + self.a)
@@ -0,0 +1,115 @@
+import unittest
+
+from configurati.attrs import attrs, lazyattrs
+from configurati.stack import *
+from configurati.utils import update, copy_tree, Missing
+
+
+class ConfigStackTests(unittest.TestCase):
+
+  def setUp(self):
+    self.defaults = {
+        'server': {'host': 'localhost', 'port': 80, 'tags': ['a', 'b']},
+        'workers': 1,
+        'paths': ('/tmp', '/var'),
+      }
+    self.region = {
+        'server': {'host': 'example.com', 'tags': [Missing, 'c', 'd']},
+        'paths': (Missing, '/srv'),
+      }
+    self.cli = {'workers': 4, 'server': {'port': 8080}}
+    self.stack = ConfigStack([self.defaults, self.region])
+    self.stack.push(self.cli, name='cli')
+
+  def expected(self):
+    result = {}
+    for layer in self.stack.layers:
+      result = update(copy_tree(layer), result)
+    return result
+
+  def test_same_as_update(self):
+    self.assertEqual(self.stack.resolve(), self.expected())
+    self.assertEqual(dict(self.stack), self.expected())
+    self.assertEqual(self.stack.to_dict(), self.expected())
+
+  def test_keys(self):
+    self.assertEqual(self.stack.server.port, 8080)
+    self.assertEqual(self.stack['server.tags[2]'], 'd')
+    self.assertEqual(self.stack['server']['tags'], ['a', 'c', 'd'])
+    self.assertEqual(self.stack.paths, ('/tmp', '/srv'))
+    self.assertIsInstance(self.stack.server, attrs)
+    self.assertEqual(self.stack.get('server.missing', 1), 1)
+    self.assertNotIn('server.missing', self.stack)
+    self.assertRaises(KeyError, lambda: self.stack['missing'])
+    self.assertRaises(AttributeError, getattr, self.stack, 'missing')
+    self.assertEqual(sorted(self.stack), ['paths', 'server', 'workers'])
+
+  def test_replaced_by_other_types(self):
+    self.stack.push({'server': 'other:80', 'paths': {'tmp': '/tmp'}})
+    self.assertEqual(self.stack.server, 'other:80')
+    self.assertNotIn('server.port', self.stack)
+    self.assertEqual(self.stack.paths, {'tmp': '/tmp'})
+
+  def test_cached(self):
+    server = self.stack.server
+    self.assertIs(self.stack.server, server)
+    self.stack.workers
+    self.assertEqual(self.stack.cache_size(), 2)
+
+  def test_set_forgets_affected_keys(self):
+    self.stack.server
+    self.stack.workers
+    self.stack.set('server.port', 8081, layer='cli')
+    self.assertEqual(self.stack.cache_size(), 1)
+    self.assertEqual(self.stack.server.port, 8081)
+    self.assertEqual(self.stack.layer('cli'), {'workers': 4, 'server': {'port': 8081}})
+
+    self.stack.set('workers', 2, layer=0)
+    self.assertEqual(self.stack.workers, 4)
+    self.stack['workers'] = 3
+    self.assertEqual(self.stack.workers, 3)
+    self.assertEqual(self.stack.resolve(), self.expected())
+
+  def test_negative_indices(self):
+    stack = ConfigStack([{'tags': ['a', 'b', 'c']}, {'tags': ['x']}])
+    self.assertEqual(stack['tags'], ['x', 'b', 'c'])
+    self.assertEqual(stack['tags[-1]'], 'c')
+    self.assertEqual(stack['tags[-3]'], 'x')
+    self.assertNotIn('tags[-4]', stack)
+
+    stack.set('tags[-2]', 'y')
+    self.assertEqual(stack.layer(-1), {'tags': ['x', 'y']})
+    self.assertEqual(stack['tags'], ['x', 'y', 'c'])
+
+  def test_negative_indices_forgotten(self):
+    stack = ConfigStack([{'tags': ['a', 'b', 'c']}])
+    self.assertEqual(stack['tags[-1]'], 'c')
+    stack.set('tags[2]', 'z')
+    self.assertEqual(stack['tags[-1]'], 'z')
+    stack.push({'tags': [Missing, Missing, Missing, 'w']})
+    self.assertEqual(stack['tags[-1]'], 'w')
+
+  def test_layer_changes(self):
+    self.stack.server
+    self.stack.paths
+    self.stack.replace('cli', {'workers': 8})
+    self.assertEqual(self.stack.cache_size(), 1)
+    self.assertEqual(self.stack.server.port, 80)
+    self.assertEqual(self.stack.workers, 8)
+
+    self.stack.remove()
+    self.assertEqual(self.stack.workers, 1)
+    self.stack.insert(0, {'extra': True})
+    self.assertTrue(self.stack.extra)
+    self.assertEqual(self.stack.resolve(), self.expected())
+
+  def test_unknown_layer(self):
+    self.assertRaises(KeyError, self.stack.layer, 'unknown')
+    self.assertRaises(IndexError, self.stack.layer, 3)
+
+  def test_lazy_layers(self):
+    layer = lazyattrs({'a': lambda: attrs({'b': 1}), 'c': lambda: 2})
+    stack = ConfigStack([layer, {'a': {'d': 3}}])
+    self.assertEqual(sorted(stack), ['a', 'c'])
+    self.assertEqual(stack.a, {'b': 1, 'd': 3})
+    self.assertEqual(layer.lazy_info().materialized, 1)
@@ -1,3 +1,4 @@
+import threading
 import unittest
 
 from configurati.utils import *
@@ -43,6 +44,91 @@ class UpdateTests(unittest.TestCase):
     o = update({'a': {'b': [Missing, 2]}}, self.o2)
     self.assertEqual(o['a']['b'], [1,2,3])
 
+  def test_in_place(self):
+    b = self.o2['a']['b']
+    o = update({'a': {'b': [Missing, 2, Missing, 4]}}, self.o2)
+    self.assertIs(o, self.o2)
+    self.assertIs(o['a']['b'], b)
+    self.assertEqual(b, [1, 2, 3, 4])
+
+  def test_not_iterable(self):
+    self.assertEqual(update({'a': [1]}, {'a': 1}), {'a': [1]})
+
+
+class MergeTests(unittest.TestCase):
+
+  def setUp(self):
+    self.o2 = {
+        'a': {
+          'b': [1, Missing, {'x': 1}],
+          'c': ('x', 'y', {'a': 'a'}),
+        },
+        'd': {'e': [1, 2]},
+    }
+
+  def test_same_as_update(self):
+    o1 = {'a': {'b': [Missing, 2, {'y': 2}, 4], 'c': (Missing, 'z')}, 'f': {'g': 1}}
+    self.assertEqual(merge(o1, self.o2), update(o1, copy_tree(self.o2)))
+
+  def test_unmodified(self):
+    before = copy_tree(self.o2)
+    merge({'a': {'b': [2], 'c': (1,)}, 'd': {'e': 3}}, self.o2)
+    self.assertEqual(self.o2, before)
+
+  def test_sharing(self):
+    o = merge({'a': {'b': [2]}}, self.o2)
+    self.assertIs(o['d'], self.o2['d'])
+    self.assertIs(o['a']['c'], self.o2['a']['c'])
+    self.assertIs(o['a']['b'][2], self.o2['a']['b'][2])
+    self.assertIsNot(o['a'], self.o2['a'])
+
+  def test_factory(self):
+    from configurati.attrs import attrs
+    o = merge({'a': {'f': {'g': 1}}}, attrs.from_dict(self.o2), factory=attrs)
+    self.assertIsInstance(o, attrs)
+    self.assertIsInstance(o.a, attrs)
+    self.assertIsInstance(o.a.f, attrs)
+    self.assertEqual(o.a.f.g, 1)
+
+  def test_lazy(self):
+    from configurati.attrs import attrs, lazyattrs
+    o2 = lazyattrs({'a': lambda: attrs({'b': 1}), 'c': lambda: 2})
+    o = merge({'a': {'d': 3}}, o2)
+    self.assertIsInstance(o, lazyattrs)
+    self.assertEqual(o.lazy_info().materialized, 1)
+    self.assertEqual(o2.lazy_info().materialized, 0)
+    self.assertEqual(o.a, {'b': 1, 'd': 3})
+    self.assertEqual(o.c, 2)
+    self.assertEqual(o2.a, {'b': 1})
+
+
+class RecursiveApplyTests(unittest.TestCase):
+
+  def test_apply(self):
+    o = {'a': [1, (2, {'b': 3})], 'c': 4}
+    r = recursive_apply(o, key_func=str.upper, value_func=lambda x: x * 2 if isinstance(x, int) else x)
+    self.assertEqual(r, {'A': [2, (4, {'B': 6})], 'C': 8})
+
+  def test_dicts_after_contents(self):
+    o = {'a': {'b': 1}}
+    r = recursive_apply(o, value_func=lambda x: sorted(x.items()) if isinstance(x, dict) else x)
+    self.assertEqual(r, [('a', [('b', 1)])])
+
+  def test_order(self):
+    seen = []
+    recursive_apply([1, [2, 3], 4], value_func=seen.append)
+    self.assertEqual(seen, [1, 2, 3, 4])
+
+  def test_deep(self):
+    import sys
+    o = 1
+    for i in range(sys.getrecursionlimit() * 2):
+      o = [o]
+    r = recursive_apply(o, value_func=lambda x: x + 1 if isinstance(x, int) else x)
+    while isinstance(r, list):
+      r = r[0]
+    self.assertEqual(r, 2)
+
 
 class StripInvalidKeysTests(unittest.TestCase):
 
@@ -64,3 +150,105 @@ class StripInvalidKeysTests(unittest.TestCase):
       }
 
     self.assertEqual(strip_invalid_keys(d), r)
+
+
+class MissingTests(unittest.TestCase):
+
+  def test_pickle(self):
+    import pickle
+    self.assertIs(pickle.loads(pickle.dumps(Missing, 2)), Missing)
+    self.assertIs(pickle.loads(pickle.dumps(NotFound, 2)), NotFound)
+
+
+class LRUCacheTests(unittest.TestCase):
+
+  def test_get_put(self):
+    c = LRUCache(maxsize=2)
+    c.put('a', 1)
+    self.assertEqual(c.get('a'), 1)
+    self.assertEqual(c.get('b'), None)
+    self.assertEqual(c.info(), CacheInfo(hits=1, misses=1, maxsize=2, size=1))
+
+  def test_eviction(self):
+    c = LRUCache(maxsize=2)
+    c.put('a', 1)
+    c.put('b', 2)
+    c.get('a')      # 'b' is now least recently used
+    c.put('c', 3)
+    self.assertIn('a', c)
+    self.assertNotIn('b', c)
+    self.assertIn('c', c)
+
+  def test_clear(self):
+    c = LRUCache()
+    c.put('a', 1)
+    c.get('a')
+    c.clear()
+    self.assertEqual(c.info(), CacheInfo(hits=0, misses=0, maxsize=1024, size=0))
+
+  def test_threads(self):
+    c = LRUCache(maxsize=100)
+    errors = []
+    def work(offset):
+      try:
+        for i in range(5000):
+          k = (i * 7 + offset) % 150
+          if c.get(k) is None:
+            c.put(k, k)
+      except Exception as e:
+        errors.append(e)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(errors, [])
+    self.assertLessEqual(len(c), 100)
+
+
+class NormalizeTests(unittest.TestCase):
+
+  def setUp(self):
+    self.o = {
+        '_a': {
+          'b': 1,
+        },
+        'd-e-f': {
+          'g': (1, 2, {'h-i': 3}),
+          'c': [{'_ignore': "a", 'keep': "b"}]
+        }
+      }
+
+  def test_equivalent(self):
+    self.assertEqual(normalize(self.o), strip_invalid_keys(normalize_keys(self.o)))
+
+  def test_factory(self):
+    class factory(dict):
+      pass
+    o = normalize(self.o, factory=factory)
+    self.assertIsInstance(o, factory)
+    self.assertIsInstance(o['d_e-f']['g'][2], factory)
+    self.assertIsInstance(o['d_e-f']['c'][0], factory)
+
+  def test_value_func(self):
+    o = {'a': 1, 'b': [2, (3,)]}
+    f = lambda x: {'x-y': x, '_z': x}
+    self.assertEqual(
+        normalize(o, value_func=f),
+        {'a': {'x_y': 1}, 'b': [{'x_y': 2}, ({'x_y': 3},)]}
+      )
+
+  def test_non_string_keys(self):
+    self.assertEqual(normalize({1: 'a', 'b': 2}), {'b': 2})
+
+
+class CopyTreeTests(unittest.TestCase):
+
+  def test_copy(self):
+    leaf = object()
+    o = {'a': [1, (2, {'b-c': leaf})], '_d': 3}
+    c = copy_tree(o)
+    self.assertEqual(c, o)
+    self.assertIsNot(c['a'], o['a'])
+    self.assertIsNot(c['a'][1][1], o['a'][1][1])
+    self.assertIs(c['a'][1][1]['b-c'], leaf)
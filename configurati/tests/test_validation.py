@@ -1,5 +1,7 @@
+import re
 import unittest
 
+from configurati.attrs import attrs, lazyattrs
 from configurati.validation import *
 from configurati.validation import _validate
 
@@ -168,6 +170,56 @@ class ValidateListTests(unittest.TestCase):
     for i in validate_list(s, o):
       self.assertIsInstance(i, int)
 
+  def test_every_failure_reported(self):
+    s = [required(type=int)]
+    o = [1, "a", 3, Missing, "b"]
+    try:
+      validate_list(s, o)
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(e.indices, [1, 3, 4])
+      self.assertIn('[1] failed to convert "a"', str(e))
+      self.assertIn('[3] Missing required argument', str(e))
+
+  def test_failure_before_type_error(self):
+    s = {'l': [required(type=int)]}
+    for spec in [s, compile_spec(s)]:
+      try:
+        validate(spec, {'l': ['x', None]})
+        self.fail("expected a ValidationError")
+      except ValidationError as e:
+        self.assertIn('failed to convert "x"', str(e))
+    self.assertRaises(TypeError, validate, s, {'l': [None, 'x']})
+
+  def test_unicode_failure(self):
+    s = [required(type=int)]
+    try:
+      validate_list(s, ['x', u'\xe9'])
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(e.indices, [0, 1])
+      self.assertIn("[1] failed to convert \"u'\\xe9'\"", str(e))
+
+  def test_optional_elements(self):
+    s = [optional(type=float, default=0.5)]
+    self.assertEqual(validate_list(s, [1, Missing, "2"]), [1.0, 0.5, 2.0])
+
+  def test_one_of(self):
+    s = [required(type=one_of('a', 'b', ['c']))]
+    self.assertEqual(validate_list(s, ['a', ['c'], 'b']), ['a', ['c'], 'b'])
+    s = [required(type=one_of('a', 'b'))]
+    self.assertEqual(validate_list(s, ['b', 'a']), ['b', 'a'])
+    try:
+      validate_list(s, ['a', 'z', ['a'], 'b'])
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(e.indices, [1, 2])
+
+  def test_uncaught_errors(self):
+    # errors other than ValueError aren't validation failures, as before
+    s = [required(type=int)]
+    self.assertRaises(TypeError, validate_list, s, [1, None])
+
 
 class ValidateTupleTests(unittest.TestCase):
 
@@ -262,3 +314,324 @@ class ValidateTests(unittest.TestCase):
 
   def test_no_validator(self):
     self.assertRaises(ValidationError, _validate, 1, Missing)
+
+
+class CollectTests(unittest.TestCase):
+
+  def setUp(self):
+    self.spec = attrs.from_dict({
+        'server': {'host': required(type=str), 'port': optional(type=int, default=80)},
+        'ids': [required(type=int)],
+        'hosts': [{'name': required(type=str)}],
+        'pair': (optional(type=int, default=0), optional(type=str, default='x')),
+      })
+    self.config = {
+        'server': {'port': 'x'},
+        'ids': [1, 'a', 'b'],
+        'hosts': [{'name': 'a'}, {}],
+        'pair': (1, 2, 3),
+      }
+
+  def errors(self, config, **kwargs):
+    try:
+      validate(self.spec, config, collect=True, **kwargs)
+    except ValidationError as e:
+      return e
+    self.fail("expected a ValidationError")
+
+  def test_every_error(self):
+    e = self.errors(self.config)
+    self.assertEqual(sorted(k for k, _ in e.errors),
+        ['hosts[1].name', 'ids[1]', 'ids[2]', 'pair', 'server.host', 'server.port'])
+    self.assertEqual(dict(e.errors)['server.host'], 'Missing required field')
+    self.assertIn('server.port: failed to convert "x"', str(e))
+    self.assertIsNone(e.stopped)
+
+  def test_valid(self):
+    config = {'server': {'host': 'a'}, 'ids': ['1'], 'hosts': [{'name': 'b'}]}
+    self.assertEqual(validate(self.spec, config, collect=True), validate(self.spec, config))
+    self.assertEqual(validate(compile_spec(self.spec), config, collect=True), validate(self.spec, config))
+
+  def test_fail_fast(self):
+    self.assertRaises(ValidationError, validate, self.spec, self.config)
+    del self.config['server']
+    try:
+      validate(self.spec, self.config)
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(str(e), 'Missing required fields: server.host')
+
+  def test_converter_exceptions(self):
+    spec = {
+        'a': required(type=str),
+        'b': optional(type=int, default=None),
+        'l': [required(type=int)],
+      }
+    config = {'l': ['1', None, 'x']}
+    self.assertRaisesRegexp(ValidationError, '^Missing required fields: a$', validate, spec, config)
+    self.assertRaises(TypeError, validate, spec, {'a': 'a', 'l': [1]})
+    try:
+      validate(spec, config, collect=True)
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(e.errors[0], ('a', 'Missing required field'))
+      self.assertEqual(sorted(k for k, _ in e.errors[1:]), ['b', 'l[1]', 'l[2]'])
+      self.assertIn('TypeError', dict(e.errors)['b'])
+      self.assertIn('TypeError', dict(e.errors)['l[1]'])
+      self.assertIn('failed to convert "x"', dict(e.errors)['l[2]'])
+
+  def test_max_errors(self):
+    e = self.errors(self.config, max_errors=2)
+    self.assertEqual(len(e.errors), 2)
+    self.assertEqual(e.stopped, 'stopped after 2 errors')
+
+  def test_time_budget(self):
+    e = self.errors(self.config, time_budget=-1)
+    self.assertEqual(e.errors, [('server.host', 'Missing required field')])
+    self.assertEqual(e.stopped, 'ran out of time')
+
+
+class CompiledSpecTests(unittest.TestCase):
+
+  def setUp(self):
+    self.spec = attrs.from_dict({
+        'version': (optional(type=int, default=0), optional(type=str, default="SNAPSHOT")),
+        'node': optional(
+          type={'host': required(type=str), 'port': optional(type=int, default=8888)},
+          default={'host': 'localhost'},
+        ),
+        'sns': [{'topic': required(type=str), 'enabled': optional(type=bool, default=False)}],
+        'any': [],
+        'level': optional(type=one_of('debug', 'info'), default='info'),
+        'ids': optional(type=[required(type=int)], default=[]),
+        'weights': [optional(type=float, default=1.0)],
+        'os': 'not a spec',
+      })
+    self.configs = [
+        {},
+        {'version': [1, "RELEASE"], 'node': {'host': 'a', 'port': '1'}},
+        {'version': (Missing, "RELEASE"), 'sns': [{'topic': 'x'}, {'topic': 'y', 'enabled': 1}]},
+        {'version': 1},
+        {'version': (1, 2, 3)},
+        {'node': 'a'},
+        {'node': {'port': 'x'}},
+        {'sns': {}},
+        {'sns': [{}]},
+        {'any': [1, 'a', None]},
+        {'level': 'warning'},
+        {'ids': [1, '2', Missing, 'x']},
+        {'weights': ['1.5', Missing]},
+        {'unimportant': True},
+      ]
+
+  def assertSameResult(self, spec, config):
+    try:
+      expected = ('ok', _validate(spec, config))
+    except ValidationError as e:
+      expected = ('error', str(e))
+    try:
+      actual = ('ok', compile_spec(spec).validate_node(config))
+    except ValidationError as e:
+      actual = ('error', str(e))
+    self.assertEqual(actual, expected, config)
+
+  def test_same_as_interpreter(self):
+    for config in self.configs:
+      self.assertSameResult(self.spec, config)
+
+  def test_leaves(self):
+    for spec, config in [
+        (required(type=int), "1"), (required(type=int), "a"), (required(), Missing),
+        (optional(type=int, default="2"), Missing), ([], Missing), ([], 1),
+        ((required(),), Missing), (1, Missing), ({}, "asdf"),
+        ([required(), required()], []), ({'a': [required(), required()]}, {}),
+      ]:
+      self.assertSameResult(spec, config)
+
+  def test_validate(self):
+    spec = compile_spec(self.spec)
+    self.assertIs(compile_spec(spec), spec)
+    config = {'sns': [{'topic': 'x'}]}
+    self.assertEqual(spec(config), validate(self.spec, config))
+    self.assertEqual(validate(spec, config), validate(self.spec, config))
+    self.assertRaises(ValidationError, spec, {'sns': [{}]})
+
+  def test_lazy(self):
+    spec = compile_spec(attrs.from_dict({'a': required(type=int)}))
+    result = validate(spec, lazyattrs({'a': lambda: '1'}))
+    self.assertEqual(result.a, 1)
+
+
+class MissingRequiredKeysTests(unittest.TestCase):
+
+  def test_missing(self):
+    s = attrs.from_dict({
+        'a': required(),
+        'b': {'c': required(), 'd': optional()},
+        'e': (required(), required()),
+      })
+    o = {'b': {'d': 1}, 'e': (1,)}
+    self.assertEqual(sorted(missing_required_keys(s, o)), ['a', 'b.c', 'e[1]'])
+
+
+class RequiredIndexTests(unittest.TestCase):
+
+  def setUp(self):
+    self.spec = attrs.from_dict({
+        'a': required(),
+        'b': {'c': required(), 'd': optional()},
+        'e': (required(), optional()),
+        'f': {'g': optional()},
+      })
+    self.index = RequiredIndex(self.spec)
+
+  def test_keys(self):
+    self.assertEqual(
+        sorted(self.index.keys),
+        [('a', ('a',)), ('b.c', ('b', 'c')), ('e[0]', ('e', 0))]
+      )
+
+  def test_beneath(self):
+    self.assertEqual(self.index.beneath(('b',)), (('b.c', ('b', 'c')),))
+    self.assertEqual(self.index.beneath(('f',)), ())
+
+  def test_is_optional(self):
+    self.assertFalse(self.index.is_optional())
+    self.assertFalse(self.index.is_optional(('e',)))
+    self.assertTrue(self.index.is_optional(('e', 1)))
+    self.assertTrue(self.index.is_optional(('f',)))
+
+  def test_missing(self):
+    o = {'b': {'d': 1}, 'e': (1,)}
+    self.assertEqual(self.index.missing(o), missing_required_keys(self.spec, o))
+    self.assertEqual(self.index.missing(o, ('b',)), ['b.c'])
+
+  def test_attached(self):
+    self.assertIsNot(required_index(self.spec), required_index(self.spec))
+    spec = index_spec(self.spec)
+    self.assertIs(required_index(spec), required_index(spec))
+    self.assertIs(required_index(compile_spec(spec)), required_index(spec))
+
+
+class ValidateLazilyTests(unittest.TestCase):
+
+  def setUp(self):
+    self.spec = attrs.from_dict({
+        'a': required(type=int),
+        'b': {'c': required(type=int), 'd': optional(default=1)},
+        'e': optional(default=2),
+      })
+
+  def test_lazy(self):
+    config = lazyattrs({'a': lambda: '1', 'b': lambda: attrs({'c': 'x'})})
+    result = validate(self.spec, config)
+    self.assertIsInstance(result, lazyattrs)
+    self.assertEqual(result.a, 1)
+    self.assertEqual(result.e, 2)
+    self.assertEqual(config.lazy_info().materialized, 1)
+    self.assertRaises(ValidationError, getattr, result, 'b')
+
+  def test_missing(self):
+    config = lazyattrs({'a': lambda: 1})
+    try:
+      validate(self.spec, config)
+      self.fail()
+    except ValidationError as e:
+      self.assertIn('b.c', str(e))
+    self.assertEqual(config.lazy_info().materialized, 0)
+
+
+class ValidationSessionTests(unittest.TestCase):
+
+  def setUp(self):
+    self.spec = attrs.from_dict({
+        'server': {'host': required(type=str), 'port': optional(type=int, default=80)},
+        'hosts': [{'name': required(type=str), 'weight': optional(type=float, default=1.0)}],
+        'ids': [required(type=int)],
+        'pair': (optional(type=int, default=0), optional(type=str, default='x')),
+        'os': 'not a spec',
+      })
+    self.config = {'server': {'host': 'a'}, 'hosts': [{'name': 'b'}], 'ids': ['1', 2]}
+    self.session = ValidationSession(self.spec)
+    self.session.validate(self.config)
+
+  def assertRevalidates(self, changed):
+    expected = validate(self.spec, self.config)
+    self.assertEqual(self.session.revalidate(self.config, changed), expected)
+
+  def test_leaf(self):
+    self.config['server']['port'] = '8080'
+    self.assertRevalidates(['server.port'])
+    self.assertEqual(self.session.result['server']['port'], 8080)
+
+  def test_list_element(self):
+    self.config['hosts'][0]['weight'] = '2'
+    self.config['ids'][1] = '3'
+    self.assertRevalidates(['hosts[0].weight', ('ids', 1)])
+
+  def test_structure(self):
+    self.config['ids'].append('4')
+    del self.config['server']['host']
+    self.config['server']['host'] = 'c'
+    self.config['pair'] = [1]
+    self.assertRevalidates(['ids', 'server', 'pair[0]'])
+
+  def test_unrelated(self):
+    result = self.session.result
+    self.config['os'] = 'linux'
+    self.config['unimportant'] = True
+    self.assertRevalidates(['os', 'unimportant'])
+    self.assertIs(self.session.result, result)
+
+  def test_missing(self):
+    del self.config['server']['host']
+    self.assertRaisesRegexp(ValidationError, 'server.host',
+        self.session.revalidate, self.config, ['server.host'])
+    self.assertEqual(self.session.result['server']['host'], 'a')
+
+    self.config['server']['host'] = 'c'
+    self.assertRevalidates(['server.host'])
+
+  def test_failures(self):
+    self.config['ids'][0] = 'x'
+    self.config['ids'][1] = 'y'
+    try:
+      self.session.revalidate(self.config, ['ids[1]', 'ids[0]'])
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertEqual(e.indices, [0, 1])
+    self.assertEqual(self.session.result['ids'], [1, 2])
+
+  def test_failed_keys_pending(self):
+    session = ValidationSession({'a': required(type=int), 'b': required(type=int)})
+    config = {'a': '1', 'b': '2'}
+    session.validate(config)
+    config['a'] = 'x'
+    self.assertRaises(ValidationError, session.revalidate, config, ['a'])
+    config['b'] = '3'
+    self.assertRaisesRegexp(ValidationError, 'failed to convert "x"',
+        session.revalidate, config, ['b'])
+    config['a'] = '4'
+    self.assertEqual(session.revalidate(config, []), {'a': 4, 'b': 3})
+
+  def test_failed_validate_pending(self):
+    self.config = {'server': {'host': 'a'}, 'hosts': [{'name': 'b'}], 'ids': ['x']}
+    self.assertRaises(ValidationError, self.session.validate, self.config)
+    self.assertRaises(ValidationError, self.session.revalidate, self.config, [])
+    self.config['ids'] = [7]
+    self.assertRevalidates([])
+
+  def test_missing_order(self):
+    spec = attrs.from_dict({k: required(type=int) for k in 'zyxabc'})
+    session = ValidationSession(spec)
+    session.validate({k: 1 for k in 'zyxabc'})
+    try:
+      validate(spec, {})
+      self.fail("expected a ValidationError")
+    except ValidationError as e:
+      self.assertRaisesRegexp(ValidationError, "^" + re.escape(str(e)) + "$",
+          session.revalidate, {}, list('zyxabc'))
+
+  def test_everything(self):
+    self.config = {'server': {'host': 'z'}, 'hosts': [{'name': 'c'}], 'ids': [5]}
+    self.assertRevalidates([''])
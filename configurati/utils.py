@@ -1,51 +1,87 @@
+from collections import Mapping, MutableMapping, MutableSequence, namedtuple, OrderedDict
+import copy
+import cPickle as pickle
+import hashlib
 import itertools
+import os
 import re
 import sys
+from tempfile import NamedTemporaryFile
+import threading
 
 
 def identity(x):
   return x
 
 
+def unique(xs):
+  """Remove duplicates from a list, keeping the first occurrence of each"""
+  return list(OrderedDict.fromkeys(xs))
+
+
 def recursive_apply(obj, key_func=identity, value_func=identity):
-  """Recursively apply a function to the keys and values of a nested object"""
-  if isinstance(obj, dict):
-    result = {}
-    for k, v in obj.items():
-      k = key_func(k)
-      result[k] = recursive_apply(v, key_func, value_func)
-    return value_func(result)
-  elif isinstance(obj, list):
-    result = []
-    for v in obj:
-      result.append(recursive_apply(v, key_func, value_func))
-    return result
-  elif isinstance(obj, tuple):
-    result = []
-    for v in obj:
-      result.append(recursive_apply(v, key_func, value_func))
-    return tuple(result)
-  else:
-    return value_func(obj)
+  """Recursively apply a function to the keys and values of a nested object
+
+  `value_func` is applied to every leaf and to every dict after its contents
+  have been transformed. Nesting is tracked with an explicit stack rather than
+  the call stack, so arbitrarily deep objects can be transformed.
+  """
+  root  = [None]
+  stack = [(_VISIT, obj, root, 0)]
+  while len(stack) > 0:
+    action, obj, target, slot = stack.pop()
+    if action is _VISIT:
+      if isinstance(obj, dict):
+        result   = {}
+        children = [(key_func(k), v) for k, v in obj.items()]
+        stack.append((_FINISH_DICT, result, target, slot))
+      elif isinstance(obj, list) or isinstance(obj, tuple):
+        result   = [None] * len(obj)
+        children = enumerate(obj)
+        finish   = _FINISH_LIST if isinstance(obj, list) else _FINISH_TUPLE
+        stack.append((finish, result, target, slot))
+      else:
+        target[slot] = value_func(obj)
+        continue
+      # children are pushed in reverse so they're visited in order
+      stack.extend(reversed([(_VISIT, v, result, k) for k, v in children]))
+    elif action is _FINISH_DICT:
+      target[slot] = value_func(obj)
+    elif action is _FINISH_LIST:
+      target[slot] = obj
+    else:
+      target[slot] = tuple(obj)
+  return root[0]
+
+
+# recursive_apply stack actions
+_VISIT        = object()
+_FINISH_DICT  = object()
+_FINISH_LIST  = object()
+_FINISH_TUPLE = object()
+
+
+# keys like "list-variable", to be replaced by "list_variable"
+_HYPHENATED = re.compile("([a-zA-Z])-([a-zA-Z])")
+
+# only keys of this format are valid
+_VALID_IDENTIFIER = re.compile("""^[a-zA-Z][a-zA-Z0-9_-]*$""")
 
 
 def normalize_keys(obj):
   """replace list-variable with list_variable"""
 
   def key_func(k):
-    return re.sub("([a-zA-Z])-([a-zA-Z])", r"\1_\2", k)
+    return _HYPHENATED.sub(r"\1_\2", k)
 
   return recursive_apply(obj, key_func=key_func)
 
 
 def strip_invalid_keys(obj):
-  # only keys of this format are valid
-  valid_identifier = re.compile("""^[a-zA-Z][a-zA-Z0-9_-]*$""")
-
   if isinstance(obj, dict):
     result = {}
     for k, v in obj.items():
-      if valid_identifier.search(k) is not None:
+      if _VALID_IDENTIFIER.search(k) is not None:
         result[k] = strip_invalid_keys(v)
     return result
   elif isinstance(obj, list):
@@ -56,45 +92,212 @@ def strip_invalid_keys(obj):
     return obj
 
 
-def update(o1, o2):
-  """Overlay `o1` over `o2`"""
-
-  def update_dict(o1, o2):
-    if not isinstance(o2, dict):
-      o2 = {}
-    for k, v in o1.items():
-      o2[k] = update(o1[k], o2.get(k, {}))
-    return o2
-
-  def update_list(o1, o2):
-    if not isinstance(o2, list):
-      try:
-        o2 = list(o2)
-      except ValueError:
-        o2 = []
-    if len(o1) > len(o2):
-      o2 = o2 + [Missing] * (len(o1) - len(o2))
-    if len(o2) > len(o1):
-      o1 = o1 + [Missing] * (len(o2) - len(o1))
-    for i in range(len(o1)):
-      o2[i] = update(o1[i], o2[i])
-    return o2
-
-  def update_tuple(o1, o2):
-    return tuple(update_list(o1, list(o2)))
-
-
-  if isinstance(o1, dict):
-    return update_dict(o1, o2)
-  elif isinstance(o1, list):
-    return update_list(o1, o2)
-  elif isinstance(o1, tuple):
-    return update_tuple(o1, o2)
+def normalize(obj, value_func=identity, factory=dict):
+  """Prepare freshly loaded contents for use as a config in a single pass
+
+  Equivalent to applying `value_func` to every leaf, then `normalize_keys`,
+  then `strip_invalid_keys`, then building a `factory` out of every dict, but
+  without copying the whole object at each step. If `value_func` returns a
+  dict, list or tuple, that is normalized in turn. Keys that aren't strings
+  are dropped along with other invalid keys.
+  """
+  return _rebuild(obj, normalize_key, value_func, factory)
+
+
+def copy_tree(obj, factory=dict):
+  """Copy the dicts, lists and tuples of a nested object, sharing its leaves"""
+  return _rebuild(obj, identity, identity, factory)
+
+
+def normalize_key(k):
+  """Normalize a single key as `normalize`, or return None if it's invalid"""
+  if isinstance(k, basestring) and _VALID_IDENTIFIER.search(k) is not None:
+    return _HYPHENATED.sub(r"\1_\2", k)
   else:
-    if isinstance(o1, Missing_):
-      return o2
+    return None
+
+
+def _rebuild(obj, key_func, value_func, factory):
+  """Rebuild a nested object, transforming keys and leaves along the way
+
+  Keys for which `key_func` returns None are dropped.
+  """
+  root  = [None]
+  stack = [(obj, root, 0, value_func)]
+  while len(stack) > 0:
+    obj, target, slot, value_func = stack.pop()
+
+    if obj is _FINISH_TUPLE:
+      # `target` holds a finished tuple's contents
+      value, target, slot = tuple(target), slot[0], slot[1]
+    elif isinstance(obj, dict):
+      value    = factory()
+      children = []
+      for k, v in obj.items():
+        k = key_func(k)
+        if k is not None:
+          children.append((v, value, k, value_func))
+      stack.extend(reversed(children))
+    elif isinstance(obj, list):
+      value = [None] * len(obj)
+      stack.extend(reversed([(v, value, i, value_func) for i, v in enumerate(obj)]))
+    elif isinstance(obj, tuple):
+      # fill in a list, then convert it to a tuple once all contents are done
+      contents = [None] * len(obj)
+      stack.append((_FINISH_TUPLE, contents, (target, slot), identity))
+      stack.extend(reversed([(v, contents, i, value_func) for i, v in enumerate(obj)]))
+      continue
+    else:
+      value = value_func(obj)
+      if isinstance(value, (dict, list, tuple)):
+        stack.append((value, target, slot, identity))
+        continue
+
+    # containers are attached before their contents are filled in. dict's own
+    # __setitem__ is used so that subclasses don't re-validate or re-convert.
+    if isinstance(target, dict):
+      dict.__setitem__(target, slot, value)
+    else:
+      target[slot] = value
+  return root[0]
+
+
+def update(o1, o2, factory=dict):
+  """Overlay `o1` over `o2`, modifying `o2` where possible
+
+  Only the parts of `o2` that `o1` overrides are visited, so the cost depends
+  on the size of `o1` rather than `o2`. `o2`'s dicts and lists are modified in
+  place; its tuples are replaced.
+
+  Parameters
+  ----------
+  o1 : object
+      overrides. Missing values in its lists and tuples leave `o2`'s in place.
+  o2 : object
+      object to override
+  factory : type
+      dict type to build mappings with where `o2` has none
+  """
+  return _overlay(o1, o2, factory, in_place=True)
+
+
+def merge(o1, o2, factory=dict):
+  """Overlay `o1` over `o2` without modifying either
+
+  Equivalent to `update(o1, copy_tree(o2))`, but only the dicts, lists and
+  tuples along the paths `o1` overrides are copied; everything else is shared
+  with `o2`. The cost depends on the size of `o1` rather than `o2`.
+
+  Parameters
+  ----------
+  o1 : object
+      overrides
+  o2 : object
+      object to override
+  factory : type
+      dict type to build mappings with where `o2` has none
+  """
+  return _overlay(o1, o2, factory, in_place=False)
+
+
+def _overlay(o1, o2, factory, in_place):
+  root  = [None]
+  stack = [(_VISIT, o1, o2, root, 0)]
+  while len(stack) > 0:
+    action, o1, o2, target, slot = stack.pop()
+    if action is _VISIT:
+      kind = _KINDS.get(type(o1)) or _kind(o1)
+      if kind is _MAPPING or kind is _DICT:
+        if (_KINDS.get(type(o2)) or _kind(o2)) is not _DICT:
+          value = factory()
+        elif in_place:
+          value = o2
+        else:
+          value = shallow_copy(o2)
+        stack.append((_FINISH_DICT, value, None, target, slot))
+        # the only parts of `o2` visited are those `o1` overrides
+        stack.extend(
+            (_VISIT, v, value.get(k, NotFound), value, k)
+            for k, v in o1.items()
+          )
+        continue
+      elif kind is _LIST or kind is _TUPLE:
+        if kind is _LIST and in_place and (_KINDS.get(type(o2)) or _kind(o2)) is _LIST:
+          value = o2
+        else:
+          value = _as_list(o2)
+        if len(o1) > len(value):
+          value.extend([Missing] * (len(o1) - len(value)))
+        finish = _FINISH_LIST if kind is _LIST else _FINISH_TUPLE
+        stack.append((finish, value, None, target, slot))
+        stack.extend((_VISIT, v, value[i], value, i) for i, v in enumerate(o1))
+        continue
+      elif o1 is Missing:
+        value = factory() if o2 is NotFound else o2
+      else:
+        value = o1
+    elif action is _FINISH_TUPLE:
+      value = tuple(o1)
     else:
-      return o1
+      value = o1
+
+    # mappings' own __setitem__ is skipped so that subclasses don't convert
+    # (and so copy) shared values
+    if isinstance(target, dict):
+      dict.__setitem__(target, slot, value)
+    else:
+      target[slot] = value
+  return root[0]
+
+
+# how `_overlay` treats an object: as a dict (or a mutable mapping standing in
+# for one, such as an attrsview), a read-only mapping, a list (or a mutable
+# sequence standing in for one), a tuple, or a leaf
+_DICT    = object()
+_MAPPING = object()
+_LIST    = object()
+_TUPLE   = object()
+_LEAF    = object()
+
+# type -> its kind. checking abstract base classes with isinstance is slow
+# enough to dominate `_overlay`, so each type is only checked once.
+_KINDS = {dict: _DICT, list: _LIST, tuple: _TUPLE}
+
+
+def _kind(o):
+  t = type(o)
+  if issubclass(t, (dict, MutableMapping)):
+    kind = _DICT
+  elif issubclass(t, Mapping):
+    kind = _MAPPING
+  elif issubclass(t, (list, MutableSequence)):
+    kind = _LIST
+  elif issubclass(t, tuple):
+    kind = _TUPLE
+  else:
+    kind = _LEAF
+  _KINDS[t] = kind
+  return kind
+
+
+def _as_list(o):
+  """A new list with the contents of `o`, or an empty list if it has none"""
+  if isinstance(o, (list, tuple)):
+    return list(o)
+  try:
+    return list(o)
+  except (TypeError, ValueError):
+    return []
+
+
+def shallow_copy(d):
+  """Copy a dict without copying its contents
+
+  Dict subclasses may define `__copy__` to control how they're copied.
+  """
+  if type(d) is dict:
+    return d.copy()
+  return copy.copy(d)
 
 
 class Missing_(object):
@@ -106,9 +309,143 @@ class Missing_(object):
   def __repr__(self):
     return str(self)
 
+  def __reduce__(self):
+    # unpickle as the module-level singleton so `is Missing` still works
+    return "Missing"
+
 
 Missing = Missing_()
 
+
+class NotFound_(object):
+  """Returned when looking up a key that isn't present in a nested object"""
+
+  def __str__(self):
+    return "NotFound"
+
+  def __repr__(self):
+    return str(self)
+
+  def __reduce__(self):
+    return "NotFound"
+
+
+NotFound = NotFound_()
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "size"])
+
+
+class LRUCache(object):
+  """A bounded mapping that evicts its least recently used entries
+
+  Safe to share between threads: every operation holds a lock.
+
+  Parameters
+  ----------
+  maxsize : int or None
+      maximum number of entries to keep. If None, the cache is unbounded.
+  """
+
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self.hits    = 0
+    self.misses  = 0
+    self._data   = OrderedDict()
+    self._lock   = threading.Lock()
+
+  def get(self, key, default=None):
+    """Retrieve a cached value, marking it as most recently used"""
+    with self._lock:
+      value = self._data.pop(key, NotFound)
+      if value is NotFound:
+        self.misses += 1
+        return default
+      self._data[key] = value
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    """Cache a value, evicting the least recently used entry if full"""
+    with self._lock:
+      self._data.pop(key, None)
+      self._data[key] = value
+      if self.maxsize is not None:
+        while len(self._data) > self.maxsize:
+          self._data.popitem(last=False)
+
+  def invalidate(self, key):
+    """Drop a single entry, if present"""
+    with self._lock:
+      self._data.pop(key, None)
+
+  def clear(self):
+    """Drop all entries and reset hit/miss counters"""
+    with self._lock:
+      self._data.clear()
+      self.hits   = 0
+      self.misses = 0
+
+  def info(self):
+    with self._lock:
+      return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+  def __contains__(self, key):
+    with self._lock:
+      return key in self._data
+
+  def __len__(self):
+    with self._lock:
+      return len(self._data)
+
+
+def snapshot_path(directory, key, prefix=""):
+  """Where to save a pickled snapshot of the value for `key` in `directory`
+
+  Caches sharing a directory should each use their own `prefix`, so they
+  don't mistake each other's snapshots for their own.
+  """
+  name = prefix + hashlib.sha1(key.encode('UTF-8')).hexdigest() + ".pickle"
+  return os.path.join(directory, name)
+
+
+def snapshot_paths(directory, prefix=""):
+  """Every snapshot saved in `directory` with `prefix`"""
+  if directory is None or not os.path.isdir(directory):
+    return []
+  pattern = re.compile("^" + re.escape(prefix) + "[0-9a-f]{40}[.]pickle$")
+  return [
+      os.path.join(directory, name)
+      for name in os.listdir(directory)
+      if pattern.search(name) is not None
+    ]
+
+
+def read_snapshot(path):
+  """Load a snapshot, or return NotFound if it's missing or unreadable"""
+  try:
+    with open(path, 'rb') as f:
+      return pickle.load(f)
+  except Exception:
+    # missing, unreadable or corrupt snapshots are simply ignored
+    return NotFound
+
+
+def write_snapshot(path, value):
+  """Save a snapshot, unless `value` can't be pickled"""
+  try:
+    contents = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+  except (pickle.PicklingError, TypeError, AttributeError):
+    return
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  # write to a temporary file first so readers never see a partial snapshot
+  with NamedTemporaryFile(dir=directory, delete=False) as f:
+    f.write(contents)
+  os.rename(f.name, path)
+
+
 def previous_frame():
   """Find the first frame in the call stack not originating from this module"""
   module_name = __name__.split(".")
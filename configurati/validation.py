@@ -2,9 +2,13 @@
 Tools for validating a configuration spec
 """
 
-from .attrs import attrs
+from collections import namedtuple
+from itertools import imap
+import time
+
+from .attrs import attrs, compile_key, lazyattrs, lookup, unwrap
 from .exceptions import ValidationError
-from .utils import identity, Missing
+from .utils import identity, Missing, NotFound
 
 
 class variable(object):
@@ -92,6 +96,7 @@ def one_of(*options):
     if not obj in options:
       raise ValueError("%s isn't one of %s" % (obj, options))
     return obj
+  type.options = options
   return type
 
 
@@ -100,26 +105,32 @@ def is_spec(obj):
   return any(test(obj) for test, _ in VALIDATORS)
 
 
-def validate_required(spec, config):
+def validate_required(spec, config, errors=None):
   if config is Missing:
-    raise ValidationError("Missing required argument")
+    return _invalid("Missing required argument", errors)
   if hasattr(spec.type, '__call__'):
     try:
       return spec.type(config)
     except ValueError:
-      raise ValidationError('failed to convert "{}" with "{}"'.format(config, spec))
+      return _invalid(_conversion_failure(config, spec), errors)
+    except Exception as e:
+      # when collecting, anything else the type raises is one more problem
+      if errors is None:
+        raise
+      errors.add("{}: {}: {}".format(_conversion_failure(config, spec), type(e).__name__, _text(e)))
+      return None
   else:
     # a spec, rather than a function, was used as the type.
-    return _validate(spec.type, config)
+    return _validate(spec.type, config, errors)
 
 
-def validate_optional(spec, config):
+def validate_optional(spec, config, errors=None):
   if config is Missing:
     config = spec.default
-  return _validate(required(type=spec.type), config)
+  return _validate(required(type=spec.type), config, errors)
 
 
-def validate_dict(spec, config):
+def validate_dict(spec, config, errors=None):
   if config is Missing:
     # if config is missing, replace it with an empty dict. if any of the spec's
     # contents are required, this will throw a ValidationError later; on the
@@ -127,20 +138,26 @@ def validate_dict(spec, config):
     config = {}
 
   if not isinstance(config, dict):
-    raise ValidationError('spec calls for type dict; found "{}" instead'.format(config))
+    return _invalid('spec calls for type dict; found "{}" instead'.format(config), errors)
 
   # for each key-value pair, replace with validated bit or what's already in
   # the config IF the value is in fact a spec definition
   result = {}
-  for k, v in spec.items():
-    if is_spec(v):
-      result[k] = _validate(v, config.get(k, Missing))
+  if errors is None:
+    for k, v in spec.items():
+      if is_spec(v):
+        result[k] = _validate(v, config.get(k, Missing))
+  else:
+    errors.check_time()
+    for k, v in spec.items():
+      if is_spec(v):
+        result[k] = errors.validate("." + k, v, config.get(k, Missing))
   return result
 
 
-def validate_list(spec, config):
+def validate_list(spec, config, errors=None):
   if len(spec) > 1:
-    raise ValidationError('spec for list "{}" contains multiple definitions for its contents')
+    return _invalid('spec for list "{}" contains multiple definitions for its contents', errors)
   elif len(spec) == 0:
     # no spec for contents, so just take it as everything is OK
     spec = [required(type=identity)]
@@ -150,12 +167,32 @@ def validate_list(spec, config):
     config = []
 
   if not isinstance(config, list):
-    raise ValidationError('spec calls for type list; found "{}" instead'.format(config))
-
-  return [_validate(spec[0], c) for c in config]
+    return _invalid('spec calls for type list; found "{}" instead'.format(config), errors)
 
+  batch = _batch(spec[0])
+  if errors is None:
+    if batch is not None:
+      return batch(config)
+    return [_validate(spec[0], c) for c in config]
 
-def validate_tuple(spec, config):
+  errors.check_time()
+  if batch is not None:
+    try:
+      return batch(config)
+    except ValidationError as e:
+      for key, message in e.errors:
+        errors.add(message, key)
+      return None
+    except Exception:
+      # validate each element in turn, recording what each raises
+      pass
+  return [
+      errors.validate("[{}]".format(i), spec[0], c)
+      for i, c in enumerate(config)
+    ]
+
+
+def validate_tuple(spec, config, errors=None):
   if config is Missing:
     # if config is missing, replace it a tuple of all missing values. if all of
     # this spec's fields are optional, then they'll be replaced reasonable;
@@ -169,7 +206,7 @@ def validate_tuple(spec, config):
       # a list or a tuple. this gives validation some leniency.
       config = tuple(config)
     else:
-      raise ValidationError('spec calls for type tuple; found "{}" instead'.format(config))
+      return _invalid('spec calls for type tuple; found "{}" instead'.format(config), errors)
 
   # extend config with Missing's if necessary
   if len(config) < len(spec):
@@ -177,9 +214,119 @@ def validate_tuple(spec, config):
 
   # XXX what if spec and config have different lengths?
   if len(spec) != len(config):
-    raise ValidationError('length of spec "{}" doesn\'t match config "{}"'.format(spec, config))
+    return _invalid('length of spec "{}" doesn\'t match config "{}"'.format(spec, config), errors)
+
+  if errors is None:
+    return tuple( _validate(s, c) for s, c in zip(spec, config) )
+  errors.check_time()
+  return tuple(
+      errors.validate("[{}]".format(i), s, c)
+      for i, (s, c) in enumerate(zip(spec, config))
+    )
+
+
+def _conversion_failure(config, spec):
+  """Message for a value `spec`'s type couldn't convert"""
+  return 'failed to convert "{}" with "{}"'.format(_text(config), _text(spec))
+
+
+def _text(obj):
+  """`str(obj)`, or its repr if it can't be encoded as ASCII"""
+  try:
+    return str(obj)
+  except UnicodeError:
+    return repr(obj)
+
+
+def _invalid(message, errors):
+  """Fail validation: raise, or if errors are being collected, record it"""
+  if errors is None:
+    raise ValidationError(message)
+  errors.add(message)
+  return None
+
+
+# coercions cheap and side effect-free enough to apply to a whole list at once,
+# and to apply again one element at a time if any element fails
+BATCHED_TYPES = frozenset([int, long, float, str, unicode])
+
+
+def _batch(spec):
+  """A function validating every element of a list against `spec` at once
+
+  Returns None unless `spec` is a `required` or `optional` whose type is in
+  `BATCHED_TYPES` or made by `one_of`. The function's result is the same as
+  validating each element in turn, but elements are converted with a single
+  `map` (or, for `one_of`, checked against a set of the options), and every
+  invalid element is reported in one `ValidationError`, whose `indices`
+  attribute lists their positions.
+  """
+  if isinstance(spec, required):
+    element, default = spec, NotFound
+  elif isinstance(spec, optional):
+    element, default = required(type=spec.type), spec.default
+  else:
+    return None
+
+  coerce  = spec.type
+  options = getattr(coerce, 'options', None)
+  if options is not None:
+    try:
+      contains = frozenset(options).__contains__
+    except TypeError:
+      # unhashable options
+      contains = options.__contains__
+    def convert(config):
+      if not all(imap(contains, config)):
+        raise ValueError("not all options")
+      return list(config)
+  elif isinstance(coerce, type) and coerce in BATCHED_TYPES:
+    def convert(config):
+      return map(coerce, config)
+  else:
+    return None
+
+  def one_by_one(config):
+    result, errors = [], []
+    for i, c in enumerate(config):
+      if c is Missing:
+        errors.append((i, "Missing required argument"))
+        continue
+      try:
+        result.append(coerce(c))
+      except ValueError:
+        errors.append((i, _conversion_failure(c, element)))
+      except Exception:
+        # validating elements in turn would have stopped at the first failure
+        if len(errors) > 0:
+          raise _element_errors(errors)
+        raise
+    if len(errors) > 0:
+      raise _element_errors(errors)
+    return result
+
+  def validate_elements(config):
+    if Missing in config:
+      if default is not NotFound:
+        config = [default if c is Missing else c for c in config]
+      if default is NotFound or default is Missing:
+        return one_by_one(config)
+    try:
+      return convert(config)
+    except (ValueError, TypeError):
+      # find every element at fault, or raise what the first one raises
+      return one_by_one(config)
+  return validate_elements
+
 
-  return tuple( _validate(s, c) for s, c in zip(spec, config) )
+def _element_errors(errors):
+  """One ValidationError for a batched list's [(index, message)] errors"""
+  error = ValidationError("invalid list elements: " + "; ".join(
+      "[{}] {}".format(i, message) for i, message in errors
+    ))
+  error.indices = [i for i, _ in errors]
+  error.errors  = [("[{}]".format(i), message) for i, message in errors]
+  return error
 
 
 VALIDATORS = [
@@ -190,25 +337,604 @@ VALIDATORS = [
     (lambda x: isinstance(x,   tuple),   validate_tuple),
   ]
 
-def _validate(spec, config):
+def _validate(spec, config, errors=None):
   for (test, func) in VALIDATORS:
     if test(spec):
-      return func(spec, config)
-  raise ValidationError('No validator for spec: "{}"'.format(spec))
+      return func(spec, config, errors)
+  return _invalid('No validator for spec: "{}"'.format(spec), errors)
+
+
+class CompiledSpec(object):
+  """A spec compiled once into validation functions, to validate many configs
+
+  Calling a compiled spec is equivalent to `validate(spec, config)`, but each
+  node's validator is chosen, and anything that depends only on the spec is
+  worked out, ahead of time rather than on every call.
+
+  >>> spec = compile_spec(load_spec("spec.py"))
+  >>> configs = [spec(c) for c in configs]
+
+  Parameters
+  ----------
+  spec : object
+      spec to compile
+  """
+
+  def __init__(self, spec):
+    self.spec      = spec
+    self.index     = required_index(spec)
+    self._validate = _compile(spec)
+
+  def __call__(self, config):
+    return validate(self, config)
+
+  def validate_node(self, config):
+    """Equivalent to `_validate(spec, config)`"""
+    return self._validate(config)
+
+
+def compile_spec(spec):
+  """Compile a spec; see `CompiledSpec`. Compiled specs are returned as is."""
+  if isinstance(spec, CompiledSpec):
+    return spec
+  return CompiledSpec(spec)
+
+
+def _compile(spec):
+  """Build a function equivalent to `lambda config: _validate(spec, config)`
+
+  Problems with the spec itself are raised when the function is called, and
+  only if the interpreter would have reached them.
+  """
+  if isinstance(spec, required):
+    return _compile_required(spec)
+  elif isinstance(spec, optional):
+    return _compile_optional(spec)
+  elif isinstance(spec, dict):
+    return _compile_dict(spec)
+  elif isinstance(spec, list):
+    return _compile_list(spec)
+  elif isinstance(spec, tuple):
+    return _compile_tuple(spec)
+  else:
+    return _fail('No validator for spec: "{}"'.format(spec))
+
+
+def _fail(message):
+  def invalid_spec(config):
+    raise ValidationError(message)
+  return invalid_spec
+
+
+def _compile_required(spec):
+  if hasattr(spec.type, '__call__'):
+    coerce = spec.type
+    def compiled_required(config):
+      if config is Missing:
+        raise ValidationError("Missing required argument")
+      try:
+        return coerce(config)
+      except ValueError:
+        raise ValidationError(_conversion_failure(config, spec))
+  else:
+    # a spec, rather than a function, was used as the type.
+    inner = _compile(spec.type)
+    def compiled_required(config):
+      if config is Missing:
+        raise ValidationError("Missing required argument")
+      return inner(config)
+  return compiled_required
+
+
+def _compile_optional(spec):
+  default = spec.default
+  inner   = _compile_required(required(type=spec.type))
+  def compiled_optional(config):
+    if config is Missing:
+      config = default
+    return inner(config)
+  return compiled_optional
+
+
+def _compile_dict(spec):
+  children = [(k, _compile(v)) for k, v in spec.items() if is_spec(v)]
+  def compiled_dict(config):
+    if config is Missing:
+      config = {}
+    if not isinstance(config, dict):
+      raise ValidationError('spec calls for type dict; found "{}" instead'.format(config))
+    get = config.get
+    return {k: child(get(k, Missing)) for k, child in children}
+  return compiled_dict
+
+
+def _compile_list(spec):
+  if len(spec) > 1:
+    return _fail('spec for list "{}" contains multiple definitions for its contents')
+  elif len(spec) == 0:
+    # no spec for contents, so just take it as everything is OK
+    spec = [required(type=identity)]
+
+  batch   = _batch(spec[0])
+  element = _compile(spec[0])
+  def compiled_list(config):
+    if config is Missing:
+      # lists are always optional; if unspecified, an empty list is used
+      config = []
+    if not isinstance(config, list):
+      raise ValidationError('spec calls for type list; found "{}" instead'.format(config))
+    if batch is not None:
+      return batch(config)
+    return [element(c) for c in config]
+  return compiled_list
+
+
+def _compile_tuple(spec):
+  elements = [_compile(s) for s in spec]
+  n = len(spec)
+  def compiled_tuple(config):
+    if config is Missing:
+      config = (Missing,) * n
+
+    if not isinstance(config, tuple):
+      if hasattr(config, '__iter__'):
+        # see validate_tuple
+        config = tuple(config)
+      else:
+        raise ValidationError('spec calls for type tuple; found "{}" instead'.format(config))
+
+    if len(config) < n:
+      config = config + (Missing,) * (n - len(config))
+    if len(config) != n:
+      raise ValidationError('length of spec "{}" doesn\'t match config "{}"'.format(spec, config))
+
+    return tuple(element(c) for element, c in zip(elements, config))
+  return compiled_tuple
+
+
+class RequiredIndex(object):
+  """Every required key in a spec, found once and kept for later validations
+
+  Each key is kept both as it's named in errors ("a.b[0]") and as the result
+  of `compile_key`, in a tree of the paths leading to them, so checking a
+  config for missing keys is one walk over the parts of the config those paths
+  lead to rather than over the whole spec. Keys are also grouped by every
+  subtree of the spec they're in, so whether a subtree has any required keys
+  at all is known without looking at it again. The spec shouldn't be modified
+  afterwards.
+
+  Like `missing_required_keys`, only the first element of a list spec is
+  considered, and subtrees within lists are named with index 0.
+
+  Parameters
+  ----------
+  spec : object
+      spec to index
+  """
+
+  def __init__(self, spec):
+    # walk the spec as `attrs.unroll` does, so keys are reported in the same
+    # order
+    leaves = {}
+    stack  = [('', (), spec)]
+    while len(stack) > 0:
+      prefix, path, obj = stack.pop()
+      if isinstance(obj, dict):
+        for k, v in obj.items():
+          stack.append((prefix + "." + k, path + (k,), v))
+      elif isinstance(obj, (list, tuple)):
+        for k, v in enumerate(obj):
+          stack.append(("{}[{}]".format(prefix, k), path + (k,), v))
+      else:
+        leaves[prefix] = (path, obj)
+    leaves = { k[1:]: v for k, v in leaves.items() }
+
+    self.keys = tuple(
+        (k, path) for k, (path, v) in leaves.items()
+        if isinstance(v, required)
+      )
+
+    # each node is (children, keys beneath it), where children are
+    # (key component, node) pairs and keys are (position in `keys`, key, path)
+    # triples
+    children, beneath = {}, {}
+    for i, (k, path) in enumerate(self.keys):
+      for j in range(len(path) + 1):
+        beneath.setdefault(path[:j], []).append((i, k, path))
+        if j > 0:
+          children.setdefault(path[:j - 1], set()).add(path[j - 1])
+    self._nodes = {}
+    for path in sorted(beneath, key=len, reverse=True):
+      self._nodes[path] = (
+          tuple((k, self._nodes[path + (k,)]) for k in children.get(path, ())),
+          tuple(beneath[path]),
+        )
+
+  def beneath(self, path=()):
+    """Each (key, compiled key) of the required keys in a subtree"""
+    node = self._nodes.get(path)
+    if node is None:
+      return ()
+    return tuple((k, p) for _, k, p in node[1])
+
+  def is_optional(self, path=()):
+    """Could a subtree, given by compiled key, be left out of a config?"""
+    return path not in self._nodes
+
+  def missing(self, config, path=(), compiled=False):
+    """Required keys in a subtree that `config` doesn't have
+
+    Parameters
+    ----------
+    config : dict
+        config to check
+    path : tuple
+        compiled key of the subtree to check
+    compiled : bool
+        return (key, compiled key) pairs rather than just keys
+    """
+    node = self._nodes.get(path)
+    if node is None:
+      return []
+
+    missing = []
+    obj = lookup(config, path)
+    if obj is NotFound:
+      missing.extend(node[1])
+    else:
+      stack = [(node, obj)]
+      while len(stack) > 0:
+        node, obj = stack.pop()
+        for k, child in node[0]:
+          # as `lookup` would
+          if isinstance(obj, dict) and not isinstance(obj, lazyattrs):
+            value = dict.get(obj, k, NotFound)
+          elif isinstance(obj, (list, tuple)):
+            value = obj[k] if isinstance(k, int) and -len(obj) <= k < len(obj) else NotFound
+          else:
+            value = lookup(obj, (k,))
+          if value is NotFound:
+            missing.extend(child[1])
+          elif len(child[0]) > 0:
+            stack.append((child, value))
+
+    missing.sort()
+    if compiled:
+      return [(k, p) for _, k, p in missing]
+    return [k for _, k, _ in missing]
+
+
+def index_spec(spec):
+  """Attach a `RequiredIndex` to a spec, for `required_index` to find later"""
+  if isinstance(spec, attrs):
+    object.__setattr__(spec, '_required_index', RequiredIndex(spec))
+  return spec
+
+
+def required_index(spec):
+  """A spec's `RequiredIndex`: the one made when it was loaded or compiled,
+  or a new one"""
+  if isinstance(spec, CompiledSpec):
+    return spec.index
+  index = vars(spec).get('_required_index') if isinstance(spec, attrs) else None
+  if index is None:
+    index = RequiredIndex(spec)
+  return index
 
 
 def missing_required_keys(spec, config):
-  result = []
-  for k, v in spec.unroll().items():
-    if isinstance(v, required) and k not in config:
-      result.append(k)
-  return result
+  return required_index(spec).missing(unwrap(config))
+
+
+def validate(spec, config, collect=False, max_errors=None, time_budget=None):
+  """Validate a config against a spec, returning the validated config
+
+  By default, validation stops at the first problem found, which is raised as
+  a `ValidationError`. With `collect=True`, the whole config is checked in one
+  pass instead, and every problem found is raised together in one
+  `ValidationError`, whose `errors` attribute lists (key, message) pairs, such
+  as ("server.port", 'failed to convert "x" with ...'). Both ways walk the
+  spec the same way; collecting just records each problem and carries on.
+  That includes exceptions other than `ValueError` raised by a spec's type,
+  which stopping at the first problem lets through as they are.
+
+  Parameters
+  ----------
+  spec : object
+      spec, or `CompiledSpec`, to validate against
+  config : dict or attrsview
+      config to validate. A `lazyattrs` is validated lazily (see
+      `validate_lazily`), unless errors are being collected.
+  collect : bool
+      check the whole config and report every problem, rather than stopping
+      at the first
+  max_errors : int or None
+      when collecting, stop after this many problems
+  time_budget : float or None
+      when collecting, stop after about this many seconds
+  """
+  compiled = spec if isinstance(spec, CompiledSpec) else None
+  config   = unwrap(config)
+
+  if collect:
+    return _collect(spec, config, max_errors, time_budget)
 
+  if isinstance(config, lazyattrs) and isinstance(getattr(compiled, 'spec', spec), dict):
+    return validate_lazily(spec, config)
 
-def validate(spec, config):
-  missing = missing_required_keys(spec, attrs.from_dict(config))
+  missing = missing_required_keys(spec, config)
   if len(missing) > 0:
     text = "Missing required fields: " + ", ".join(missing)
     raise ValidationError("".join(text))
 
+  if compiled is not None:
+    return compiled.validate_node(config)
   return _validate(spec, config)
+
+
+def _collect(spec, config, max_errors, time_budget):
+  errors = _Errors(max_errors, time_budget)
+  result = None
+  try:
+    for key in missing_required_keys(spec, config):
+      errors.add("Missing required field", key if key.startswith('[') else '.' + key)
+    if isinstance(spec, CompiledSpec):
+      spec = spec.spec
+    result = _validate(spec, config, errors)
+  except _StopCollecting:
+    pass
+  if len(errors.errors) > 0:
+    raise errors.exception()
+  return result
+
+
+class _StopCollecting(Exception):
+  pass
+
+
+class _Errors(object):
+  """Problems found while validating, each with the key it was found at"""
+
+  def __init__(self, max_errors=None, time_budget=None):
+    self.errors    = []
+    self.stopped   = None
+    self._keys     = set()
+    self._path     = []
+    self._max      = max_errors
+    self._deadline = None if time_budget is None else time.time() + time_budget
+
+  def validate(self, key, spec, config):
+    """Validate a child of the current node; `key` is like ".a" or "[0]" """
+    self._path.append(key)
+    result = _validate(spec, config, self)
+    self._path.pop()
+    return result
+
+  def add(self, message, key=''):
+    """Record a problem at the current node, or at `key` beneath it"""
+    key = "".join(self._path) + key
+    key = key[1:] if key.startswith('.') else key
+    # required keys are checked before anything else; don't report them twice
+    if key in self._keys:
+      return
+    self._keys.add(key)
+    self.errors.append((key, message))
+    if self._max is not None and len(self.errors) >= self._max:
+      self.stopped = "stopped after {} errors".format(self._max)
+      raise _StopCollecting()
+
+  def check_time(self):
+    if self._deadline is not None and time.time() > self._deadline:
+      self.stopped = "ran out of time"
+      raise _StopCollecting()
+
+  def exception(self):
+    lines = ["{} validation errors{}:".format(
+        len(self.errors), "" if self.stopped is None else " ({})".format(self.stopped)
+      )]
+    for key, message in self.errors:
+      lines.append("  {}: {}".format(key or "(top level)", message))
+    error = ValidationError("\n".join(lines))
+    error.errors  = list(self.errors)
+    error.stopped = self.stopped
+    return error
+
+
+def validate_lazily(spec, config):
+  """Validate each of a `lazyattrs`' top-level values when it's first accessed
+
+  Required keys missing from the top level are reported immediately; anything
+  else wrong with a value is reported when that value is accessed.
+  """
+  index = required_index(spec)
+  if isinstance(spec, CompiledSpec):
+    spec = spec.spec
+
+  missing = [
+      key for k in spec if not config.has_key(k) and not index.is_optional((k,))
+      for key, _ in index.beneath((k,))
+    ]
+  if len(missing) > 0:
+    text = "Missing required fields: " + ", ".join(missing)
+    raise ValidationError("".join(text))
+
+  return lazyattrs({
+    k: _section_validator(spec, config, k)
+    for k, v in spec.items() if is_spec(v)
+  })
+
+
+def _section_validator(spec, config, key):
+  def validate_section():
+    section = {key: config[key]} if config.has_key(key) else {}
+    result = validate(attrs({key: spec[key]}), section)
+    return attrs.from_dict(result)[key]
+  return validate_section
+
+
+class ValidationSession(object):
+  """Validate a config, then re-validate only the parts of it that change
+
+  After `validate` checks a whole config, `revalidate` takes the config again
+  along with the keys that have changed since, and re-validates only the spec
+  subtrees that could be affected: the deepest node above each changed key
+  whose validated value doesn't depend on its siblings. Missing required keys
+  are tracked the same way. Each call's result is the same as validating the
+  whole config from scratch.
+
+  The validated result is updated in place and shared between calls. If a
+  call raises a `ValidationError`, the session is left as it was, and what
+  that call was given is checked again by the next one.
+
+  >>> session = ValidationSession(load_spec("spec.py"))
+  >>> result = session.validate(config)
+  >>> config['server']['port'] = 8081
+  >>> result = session.revalidate(config, ["server.port"])
+
+  Parameters
+  ----------
+  spec : object
+      spec to validate against, or a `CompiledSpec`
+  """
+
+  def __init__(self, spec):
+    self._compiled = compile_spec(spec)
+    self.spec      = self._compiled.spec
+    self._index    = self._compiled.index
+    self.result    = None
+    self._missing  = {}
+    # keys given to calls that raised, which haven't been re-validated since.
+    # () stands for the whole config.
+    self._pending  = []
+    # position of each required key in the spec, to report them in order
+    self._order    = {k: i for i, (k, _) in enumerate(self._index.keys)}
+
+  def validate(self, config):
+    """Validate an entire config, as `validate` would"""
+    config = unwrap(config)
+    self._pending = [()]
+    missing = self._missing_keys((), config)
+    self._raise_missing(missing)
+    self.result   = self._compiled.validate_node(config)
+    self._missing = missing
+    self._pending = []
+    return self.result
+
+  def revalidate(self, config, changed):
+    """Re-validate a config, given every key changed since the last call
+
+    Parameters
+    ----------
+    config : dict
+        the config, with its changes
+    changed : [str or tuple]
+        fancy keys, like "server.port" or "hosts[0]", or the results of
+        `compile_key`, of every value that's been set, added or removed
+    """
+    config = unwrap(config)
+    if self.result is None:
+      return self.validate(config)
+    changed = self._pending + list(changed)
+    self._pending = changed
+
+    # the subtrees to re-validate, skipping any inside another
+    subtrees = {}
+    for key in changed:
+      path = key if isinstance(key, tuple) else _compile_path(key)
+      subtree = self._affected(config, path)
+      if subtree is not None:
+        subtrees[subtree.path] = subtree
+    kept = []
+    for path in sorted(subtrees, key=len):
+      if not any(path[:len(p)] == p for p in kept):
+        kept.append(path)
+    if () in kept:
+      return self.validate(config)
+    # in the order a full validation would reach them, so the same error is
+    # raised first
+    kept = sorted((subtrees[path] for path in kept), key=lambda s: s.order)
+
+    # required keys first, as `validate` does. like `missing_required_keys`,
+    # only the first element of a list is checked for them.
+    missing = {
+        k: p for k, p in self._missing.items()
+        if not any(p[:len(s.spec_path)] == s.spec_path for s in kept)
+      }
+    for subtree in kept:
+      missing.update(self._missing_keys(subtree.spec_path, config))
+    self._raise_missing(missing)
+
+    values, errors = [], []
+    for i, subtree in enumerate(kept):
+      try:
+        values.append(_validate(subtree.spec, subtree.config))
+      except ValidationError as e:
+        if subtree.index is None:
+          raise
+        errors.append((subtree.index, str(e)))
+      # a batched list's failures are reported together, once they're all in
+      following = kept[i + 1] if i + 1 < len(kept) else None
+      if len(errors) > 0 and (following is None or following.index is None or
+                              following.path[:-1] != subtree.path[:-1]):
+        raise _element_errors(errors)
+    for subtree, value in zip(kept, values):
+      parent = self.result
+      for k in subtree.path[:-1]:
+        parent = parent[k]
+      parent[subtree.path[-1]] = value
+    self._missing = missing
+    self._pending = []
+    return self.result
+
+  def _affected(self, config, path):
+    """The `_Subtree` to re-validate when `path` changes
+
+    Returns None if `path` isn't covered by the spec.
+    """
+    spec, result = self.spec, self.result
+    spec_path, order, index = [], [], None
+    for i, k in enumerate(path):
+      if isinstance(spec, dict) and isinstance(config, dict) and isinstance(result, dict):
+        # each of a dict's values is validated independently
+        if not isinstance(k, basestring) or not is_spec(spec.get(k)):
+          return None
+        order.append(list(spec.keys()).index(k))
+        spec, config, result = spec[k], config.get(k, Missing), result[k]
+        spec_path.append(k)
+      elif isinstance(spec, list) and len(spec) == 1 and \
+          isinstance(config, list) and isinstance(result, list) and \
+          len(config) == len(result) and isinstance(k, int) and 0 <= k < len(config):
+        # as are a list's elements, as long as its length hasn't changed
+        if _batch(spec[0]) is not None:
+          index = k
+        order.append(k)
+        spec, config, result = spec[0], config[k], result[k]
+        spec_path.append(0)
+      else:
+        path = path[:i]
+        break
+    return _Subtree(path, tuple(spec_path), tuple(order), spec, config, index)
+
+  def _missing_keys(self, path, config):
+    """Required keys missing beneath `path`, like `missing_required_keys`"""
+    return dict(self._index.missing(config, path, compiled=True))
+
+  def _raise_missing(self, missing):
+    if len(missing) > 0:
+      keys = sorted(missing, key=self._order.__getitem__)
+      raise ValidationError("Missing required fields: " + ", ".join(keys))
+
+
+# part of a config to re-validate. `spec_path` is `path` with every list index
+# replaced by 0, `order` is the position of each of its keys in the spec, and
+# `index` is its position in its list if that list is batched (see `_batch`),
+# so errors can be reported as the list would report them.
+_Subtree = namedtuple('_Subtree', ['path', 'spec_path', 'order', 'spec', 'config', 'index'])
+
+def _compile_path(key):
+  """Compile "a.b[0]" or "[0].a", or "" for the whole config"""
+  if len(key) == 0:
+    return ()
+  if key.startswith('['):
+    return compile_key(key)
+  return compile_key('.' + key)